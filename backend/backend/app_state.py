@@ -1,3 +1,4 @@
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -7,6 +8,7 @@ from loguru import logger
 from backend.config import IndexingError, Metadata, Settings, configure_logging
 from backend.croissant_store import CroissantStore, get_croissant_store
 from backend.engine import Engine
+from backend.engine.feedback import RuntimeCostModel
 from backend.indexing import (
     generate_embedding_index,
     generate_fainder_indices,
@@ -35,6 +37,8 @@ class ApplicationState:
 
     def __init__(self) -> None:
         self._components: InitializedComponents | None = None
+        # Updates run outside of the event loop, so concurrent updates must not interleave
+        self._update_lock = threading.Lock()
 
     @property
     def croissant_store(self) -> CroissantStore:
@@ -99,7 +103,14 @@ class ApplicationState:
             raise
 
     def update_indices(self) -> None:
-        """Update indices from the croissant files."""
+        """Update indices from the croissant files.
+
+        Queries keep running on the previous indices until the new ones are published.
+        """
+        with self._update_lock:
+            self._update_indices()
+
+    def _update_indices(self) -> None:
         if self._components is None:
             raise RuntimeError("ApplicationState not initialized")
 
@@ -124,6 +135,16 @@ class ApplicationState:
             engine=engine,
         )
 
+    def save_cost_model(self) -> None:
+        """Persist the operator costs that the engine has learned so far."""
+        if self._components is not None and self._components.engine.cost_model is not None:
+            self._components.engine.cost_model.save()
+
+    def _create_cost_model(self, settings: Settings) -> RuntimeCostModel | None:
+        if not settings.cost_feedback:
+            return None
+        return RuntimeCostModel(settings.cost_model_path)
+
     def _load_config_from_json(
         self, config_name: str, settings: Settings
     ) -> dict[str, Any] | None:
@@ -203,11 +224,15 @@ class ApplicationState:
             fainder_index=fainder_index,
             hnsw_index=hnsw_index,
             metadata=metadata,
-            cache_size=settings.query_cache_size,
+            cache_max_bytes=settings.query_cache_max_bytes,
+            cache_ttl=settings.query_cache_ttl,
+            leaf_cache_max_bytes=settings.leaf_cache_max_bytes,
+            plan_cache_max_bytes=settings.plan_cache_max_bytes,
             min_usability_score=settings.min_usability_score,
             rank_by_usability=settings.rank_by_usability,
             executor_type=settings.executor_type,
             max_workers=settings.max_workers,
+            cost_model=self._create_cost_model(settings),
         )
         return metadata, croissant_store, tantivy_index, fainder_index, hnsw_index, engine
 
@@ -311,16 +336,27 @@ class ApplicationState:
             ef=settings.hnsw_ef,
         )
 
-        engine = Engine(
-            tantivy_index=tantivy_index,
-            fainder_index=fainder_index,
-            hnsw_index=hnsw_index,
-            metadata=metadata,
-            cache_size=settings.query_cache_size,
-            min_usability_score=settings.min_usability_score,
-            rank_by_usability=settings.rank_by_usability,
-            executor_type=settings.executor_type,
-            max_workers=settings.max_workers,
-        )
+        if self._components is not None:
+            # Keep the engine so that its learned operator costs and its caches, including their
+            # hit statistics, survive the update. The caches are emptied since plans and results
+            # of the previous indices are outdated.
+            engine = self._components.engine
+            engine.update_indices(tantivy_index, fainder_index, hnsw_index, metadata)
+        else:
+            engine = Engine(
+                tantivy_index=tantivy_index,
+                fainder_index=fainder_index,
+                hnsw_index=hnsw_index,
+                metadata=metadata,
+                cache_max_bytes=settings.query_cache_max_bytes,
+                cache_ttl=settings.query_cache_ttl,
+                leaf_cache_max_bytes=settings.leaf_cache_max_bytes,
+                plan_cache_max_bytes=settings.plan_cache_max_bytes,
+                min_usability_score=settings.min_usability_score,
+                rank_by_usability=settings.rank_by_usability,
+                executor_type=settings.executor_type,
+                max_workers=settings.max_workers,
+                cost_model=self._create_cost_model(settings),
+            )
 
         return metadata, croissant_store, tantivy_index, fainder_index, hnsw_index, engine
@@ -3,8 +3,9 @@ import os
 import sys
 import warnings
 from enum import StrEnum, auto
+from itertools import chain
 from pathlib import Path
-from typing import TYPE_CHECKING, Annotated, Any, Literal
+from typing import TYPE_CHECKING, Annotated, Any, Literal, NamedTuple, Self
 
 import numpy as np
 from fainder.execution.parallel_processing import FainderChunkLayout
@@ -24,11 +25,23 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from backend.utils import load_json
 
 if TYPE_CHECKING:
+    from collections.abc import Sequence
     from types import FrameType
 
-DocumentHighlights = dict[int | np.uint32, dict[str, str]]
+
+class FieldHighlight(NamedTuple):
+    """Text of a document field and the sorted, disjoint character spans that match a query."""
+
+    text: str
+    spans: tuple[tuple[int, int], ...]
+
+
+# The executors carry highlights as spans, which are rendered to HTML for returned documents only
+DocumentHighlights = dict[int | np.uint32, dict[str, FieldHighlight]]
 ColumnHighlights = NDArray[np.uint32]
 Highlights = tuple[DocumentHighlights, ColumnHighlights]
+RenderedDocumentHighlights = dict[int | np.uint32, dict[str, str]]
+RenderedHighlights = tuple[RenderedDocumentHighlights, ColumnHighlights]
 IntegerArray = Annotated[
     NDArray[np.uint32],
     BeforeValidator(lambda data: np.array(data, dtype=np.uint32)),
@@ -38,6 +51,57 @@ DocumentArray = NDArray[np.uint32]
 ColumnArray = NDArray[np.uint32]
 
 
+class CsrMapping:
+    """Mapping from documents to their column IDs in compressed sparse row (CSR) format.
+
+    The columns of all documents are stored in one flat array and the columns of document i are
+    `col_ids[offsets[i]:offsets[i + 1]]`. Compared to one small array per document, this avoids the
+    per-array overhead and allows gathering the columns of many documents without a Python loop.
+    """
+
+    __slots__ = ("col_ids", "offsets")
+
+    def __init__(self, offsets: NDArray[np.int64], col_ids: NDArray[np.uint32]) -> None:
+        self.offsets = offsets
+        self.col_ids = col_ids
+
+    @classmethod
+    def from_lists(cls, doc_to_cols: "Sequence[Sequence[int] | NDArray[np.uint32]]") -> Self:
+        """Build the mapping from the column IDs of each document."""
+        lengths = np.fromiter((len(cols) for cols in doc_to_cols), dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        col_ids = np.fromiter(
+            chain.from_iterable(doc_to_cols), dtype=np.uint32, count=int(offsets[-1])
+        )
+        return cls(offsets, col_ids)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, doc_id: int | np.integer[Any]) -> NDArray[np.uint32]:
+        return self.col_ids[self.offsets[doc_id] : self.offsets[doc_id + 1]]
+
+    def tolist(self) -> list[list[int]]:
+        return [cols.tolist() for cols in np.split(self.col_ids, self.offsets[1:-1])]
+
+
+DocumentColumns = Annotated[
+    CsrMapping,
+    BeforeValidator(
+        lambda data: data if isinstance(data, CsrMapping) else CsrMapping.from_lists(data)
+    ),
+    PlainSerializer(lambda data: data.tolist()),
+]
+
+
+class StreamFormat(StrEnum):
+    """Enum representing the formats of streamed query responses."""
+
+    NDJSON = auto()
+    SSE = auto()
+
+
 class ExecutorType(StrEnum):
     """Enum representing different executor types for query execution."""
 
@@ -45,6 +109,8 @@ class ExecutorType(StrEnum):
     PREFILTERING = auto()
     THREADED = auto()
     THREADED_PREFILTERING = auto()
+    # Selects one of the other executors for each query
+    AUTO = auto()
 
 
 class CroissantStoreType(StrEnum):
@@ -60,7 +126,7 @@ class FainderMode(StrEnum):
 
 
 class Metadata(BaseModel):
-    doc_to_cols: list[IntegerArray]
+    doc_to_cols: DocumentColumns
     doc_to_path: list[str]
     col_to_doc: IntegerArray
     name_to_vector: dict[str, int]
@@ -100,11 +166,26 @@ class Settings(BaseSettings):
     croissant_cache_size: int = 128
 
     # Engine settings
-    query_cache_size: int = 128
+    query_cache_max_bytes: int = 256 * 2**20
+    query_cache_ttl: float | None = None
+    leaf_cache_max_bytes: int = 256 * 2**20
+    plan_cache_max_bytes: int = 16 * 2**20
     min_usability_score: float = 0.0
     rank_by_usability: bool = True
     executor_type: ExecutorType = ExecutorType.SIMPLE
     max_workers: int = os.cpu_count() or 1
+    # Learning operator costs profiles every query, which times each operator and records its
+    # statistics under a lock shared by all queries
+    cost_feedback: bool = False
+    cost_model_file: Path = Path("cost_model.json")
+
+    # Query pool settings
+    query_workers: int = os.cpu_count() or 1
+    query_queue_size: int = 64
+    query_retry_after: int = 1
+    result_session_max_bytes: int = 64 * 2**20
+    result_session_ttl: float | None = 600.0
+    result_prefetch: bool = True
 
     # Fainder settings
     fainder_n_clusters: int = 50
@@ -182,6 +263,11 @@ class Settings(BaseSettings):
     def metadata_path(self) -> Path:
         return self.data_dir / self.collection_name / self.metadata_file
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def cost_model_path(self) -> Path:
+        return self.data_dir / self.collection_name / self.cost_model_file
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def fainder_config_path(self) -> Path:
@@ -216,15 +302,67 @@ class QueryRequest(BaseModel):
     fainder_mode: FainderMode = FainderMode.LOW_MEMORY
     result_highlighting: bool = False
     fainder_index_name: str = "default"
+    result_handle: str | None = None
+    analyze: bool = False
+
+
+class PlanNode(BaseModel):
+    """A node of an optimized query plan, optionally annotated with runtime statistics.
+
+    Wall times are in seconds and measure the operator itself after its inputs are available. For
+    threaded executors, the wall time of an operator also includes waiting for inputs that are
+    evaluated in the background.
+    """
+
+    operator: str
+    arguments: list[str] = []
+    children: list["PlanNode"] = []
+    wall_time: float | None = None
+    input_cardinalities: list[int] = []
+    output_cardinality: int | None = None
+    hist_filter_size: int | None = None
+    cache_hit: bool | None = None
+    write_group: int | None = None
+    read_groups: list[int] | None = None
 
 
-class QueryResponse(BaseModel):
+class QueryMetadata(BaseModel):
     query: str
-    results: list[dict[str, Any]]
     search_time: float
+    queue_time: float
     result_count: int
     page: int
     total_pages: int
+    result_handle: str | None = None
+    plan: PlanNode | None = None
+
+
+class QueryResponse(QueryMetadata):
+    results: list[dict[str, Any]]
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    page: int = 1
+    per_page: int = 10
+    fainder_mode: FainderMode = FainderMode.LOW_MEMORY
+    result_highlighting: bool = False
+    fainder_index_name: str = "default"
+
+
+class BatchQueryResponse(BaseModel):
+    responses: list[QueryResponse]
+    search_time: float
+    queue_time: float
+
+
+class ExplainResponse(BaseModel):
+    query: str
+    executor_type: ExecutorType
+    analyzed: bool
+    plan: PlanNode
+    search_time: float | None = None
+    result_count: int | None = None
 
 
 class MessageResponse(BaseModel):
@@ -234,8 +372,61 @@ class MessageResponse(BaseModel):
 class CacheInfo(BaseModel):
     hits: int
     misses: int
-    max_size: int | None
+    evictions: int
+    expirations: int
     curr_size: int
+    curr_bytes: int
+    max_bytes: int
+    ttl: float | None
+
+
+class OperatorCacheInfo(BaseModel):
+    hits: int
+    misses: int
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+class CacheStatistics(BaseModel):
+    result_cache: CacheInfo
+    plan_cache: CacheInfo
+    leaf_cache: CacheInfo
+    leaf_cache_operators: dict[str, OperatorCacheInfo]
+
+
+class OperatorCostInfo(BaseModel):
+    """Learned costs of a leaf operator in a Fainder mode and index.
+
+    Latencies are exponentially weighted moving averages in seconds. Keyword and column name
+    operators do not depend on the Fainder mode and index, so both are None for them.
+    """
+
+    operator: str
+    fainder_mode: FainderMode | None
+    fainder_index_name: str | None
+    observations: int = 0
+    latency: float = 0.0
+    cardinality: float = 0.0
+    filtered_observations: int = 0
+    latency_per_filtered_hist: float = 0.0
+    stop_point: int | None = None
+
+
+class CostModelInfo(BaseModel):
+    enabled: bool = True
+    operators: list[OperatorCostInfo] = []
+
+
+class QueryPoolInfo(BaseModel):
+    running: int
+    queued: int
+    rejected: int
+    max_workers: int
+    max_queue_size: int
 
 
 class ColumnSearchError(Exception):
@@ -254,6 +445,10 @@ class FainderError(Exception):
     pass
 
 
+class QueryPoolFullError(Exception):
+    pass
+
+
 class FainderConfigRequest(BaseModel):
     config_name: str
 
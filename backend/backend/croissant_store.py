@@ -50,7 +50,7 @@ class CroissantStore(ABC):
         """Get a document by ID."""
 
     def get_documents(self, doc_ids: list[int]) -> list[Document]:
-        return [self._get_document(doc_id) for doc_id in doc_ids]
+        return [self.get_document(doc_id) for doc_id in doc_ids]
 
     def add_document(self, doc: Document) -> None:
         """Add a new document to the store."""
@@ -71,11 +71,17 @@ class CroissantStore(ABC):
 
         # Save to file system
         dump_json(doc, file_path)
+        self._clear_document_cache()
 
     @abstractmethod
     def replace_documents(self, doc_to_path: list[str]) -> None:
         """Replace all documents in the store."""
 
+    def _clear_document_cache(self) -> None:
+        cache_clear: Callable[[], None] | None = getattr(self.get_document, "cache_clear", None)
+        if cache_clear is not None:
+            cache_clear()
+
     def _rewrite_paths(self, doc_to_path: list[str]) -> list[Path]:
         return [self.base_path / path for path in doc_to_path]
 
@@ -154,6 +160,7 @@ class FileCroissantStore(CroissantStore):
 
     def replace_documents(self, doc_to_path: list[str]) -> None:
         self.doc_to_path = self._rewrite_paths(doc_to_path)
+        self._clear_document_cache()
 
 
 def get_croissant_store(
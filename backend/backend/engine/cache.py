@@ -0,0 +1,273 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, NamedTuple, TypeVar
+
+import numpy as np
+from loguru import logger
+from numpy.typing import NDArray
+
+from backend.config import (
+    CacheInfo,
+    ColumnArray,
+    DocumentArray,
+    DocumentHighlights,
+    FainderMode,
+    Highlights,
+    OperatorCacheInfo,
+)
+
+from .plan import QueryPlan
+from .ranking import Ranking
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class ResultCacheKey(NamedTuple):
+    """Key of a query result in the result cache."""
+
+    plan: str
+    fainder_mode: FainderMode
+    enable_highlighting: bool
+    fainder_index_name: str
+    # Generation of the indices that the result was computed on, so that results of outdated
+    # indices never match
+    index_generation: int
+
+
+class PlanCacheKey(NamedTuple):
+    """Key of an optimized query plan in the plan cache."""
+
+    query: str
+    leaf_costs: tuple[tuple[str, float], ...] | None
+    # Plans are optimized with the statistics of the indices of this generation
+    index_generation: int
+
+
+class QueryResult(NamedTuple):
+    """Ranked result of a query together with the highlights of the documents."""
+
+    ranking: Ranking
+    highlights: Highlights
+
+
+class LeafCacheKey(NamedTuple):
+    """Key of a leaf operator result in the leaf cache."""
+
+    operator: str
+    arguments: tuple[Hashable, ...]
+    fainder_mode: FainderMode | None
+    fainder_index_name: str | None
+    index_generation: int
+
+
+class KeywordResult(NamedTuple):
+    """Result of a keyword search with the scores and highlights of the matched documents."""
+
+    doc_ids: DocumentArray
+    scores: NDArray[np.float32]
+    highlights: DocumentHighlights
+
+
+LeafResult = KeywordResult | ColumnArray
+
+
+def doc_highlights_nbytes(doc_highlights: DocumentHighlights) -> int:
+    """Estimate the memory footprint of document highlights in bytes."""
+    return sum(
+        len(field) + len(highlight.text) + 16 * len(highlight.spans)
+        for fields in doc_highlights.values()
+        for field, highlight in fields.items()
+    )
+
+
+def highlights_nbytes(highlights: Highlights) -> int:
+    """Estimate the memory footprint of query result highlights in bytes."""
+    doc_highlights, col_highlights = highlights
+    return col_highlights.nbytes + doc_highlights_nbytes(doc_highlights)
+
+
+def query_result_nbytes(result: QueryResult) -> int:
+    """Estimate the memory footprint of a query result in bytes."""
+    return result.ranking.nbytes + highlights_nbytes(result.highlights)
+
+
+def plan_nbytes(plan: QueryPlan) -> int:
+    return plan.nbytes
+
+
+def leaf_result_nbytes(result: LeafResult) -> int:
+    """Estimate the memory footprint of a leaf operator result in bytes."""
+    if isinstance(result, KeywordResult):
+        return (
+            result.doc_ids.nbytes + result.scores.nbytes + doc_highlights_nbytes(result.highlights)
+        )
+    return result.nbytes
+
+
+class _CacheEntry(Generic[V]):
+    __slots__ = ("expires_at", "nbytes", "value")
+
+    def __init__(self, value: V, nbytes: int, expires_at: float | None) -> None:
+        self.value = value
+        self.nbytes = nbytes
+        self.expires_at = expires_at
+
+
+class ResultCache(Generic[K, V]):
+    """A thread-safe LRU cache that evicts entries by their memory size and age.
+
+    Args:
+        max_bytes: Maximum total size of all cached values in bytes. A non-positive value disables
+            the cache.
+        sizeof: Function that returns the size of a value in bytes.
+        ttl: Time to live of an entry in seconds. None means that entries never expire.
+    """
+
+    def __init__(
+        self, max_bytes: int, sizeof: Callable[[V], int], ttl: float | None = None
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._entries: OrderedDict[K, _CacheEntry[V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._curr_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: K) -> V | None:
+        """Return the cached value for a key or None if the key is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def peek(self, key: K) -> V | None:
+        """Return the cached value for a key without updating the statistics or the LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (
+                entry.expires_at is not None and entry.expires_at <= time.monotonic()
+            ):
+                return None
+            return entry.value
+
+    def put(self, key: K, value: V) -> None:
+        """Add a value to the cache and evict the least recently used entries if necessary."""
+        if not self.enabled:
+            return
+
+        nbytes = self._sizeof(value)
+        if nbytes > self.max_bytes:
+            logger.debug("Not caching value of {} bytes as it exceeds the cache size", nbytes)
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value, nbytes, expires_at)
+            self._curr_bytes += nbytes
+
+            while self._curr_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._curr_bytes = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                curr_size=len(self._entries),
+                curr_bytes=self._curr_bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+            )
+
+    def _remove(self, key: K) -> None:
+        entry = self._entries.pop(key)
+        self._curr_bytes -= entry.nbytes
+
+
+class LeafCache:
+    """A cache for the results of leaf operators that is shared across queries.
+
+    Cached arrays are made read-only since they are handed out to many queries. All entries share
+    a single memory budget, but hits and misses are tracked per operator.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float | None = None) -> None:
+        self._cache: ResultCache[LeafCacheKey, LeafResult] = ResultCache(
+            max_bytes=max_bytes, sizeof=leaf_result_nbytes, ttl=ttl
+        )
+        self._lock = threading.Lock()
+        self._operator_hits: dict[str, int] = {}
+        self._operator_misses: dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.enabled
+
+    def get(self, key: LeafCacheKey) -> LeafResult | None:
+        if not self.enabled:
+            return None
+
+        result = self._cache.get(key)
+        with self._lock:
+            counter = self._operator_misses if result is None else self._operator_hits
+            counter[key.operator] = counter.get(key.operator, 0) + 1
+        return result
+
+    def put(self, key: LeafCacheKey, result: LeafResult) -> None:
+        if not self.enabled:
+            return
+
+        if isinstance(result, KeywordResult):
+            result.doc_ids.flags.writeable = False
+            result.scores.flags.writeable = False
+        else:
+            result.flags.writeable = False
+        self._cache.put(key, result)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def info(self) -> CacheInfo:
+        return self._cache.info()
+
+    def operator_info(self) -> dict[str, OperatorCacheInfo]:
+        with self._lock:
+            return {
+                operator: OperatorCacheInfo(
+                    hits=self._operator_hits.get(operator, 0),
+                    misses=self._operator_misses.get(operator, 0),
+                )
+                for operator in self._operator_hits.keys() | self._operator_misses.keys()
+            }
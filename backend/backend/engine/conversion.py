@@ -1,20 +1,55 @@
 import numpy as np
 from numpy.typing import NDArray
 
-from backend.config import ColumnArray, DocumentArray
+from backend.config import ColumnArray, CsrMapping, DocumentArray
 
 
-def doc_to_col_ids(doc_ids: DocumentArray, doc_to_cols: list[NDArray[np.uint32]]) -> ColumnArray:
-    return np.fromiter(
-        (col_id for doc_id in doc_ids for col_id in doc_to_cols[int(doc_id)]),
-        dtype=np.uint32,
-    )
+def is_sorted_unique(ids: NDArray[np.uint32]) -> bool:
+    """Check whether IDs are sorted in strictly ascending order, i.e., sorted and unique."""
+    return bool(np.all(ids[1:] > ids[:-1]))
+
+
+def sorted_unique_ids(ids: NDArray[np.uint32]) -> NDArray[np.uint32]:
+    """Return IDs sorted and without duplicates, which the executors expect of all ID arrays.
+
+    Checking the order takes linear time, so IDs that are already sorted are not sorted again.
+    """
+    return ids if is_sorted_unique(ids) else np.unique(ids)
+
+
+def doc_to_col_ids(doc_ids: DocumentArray, doc_to_cols: CsrMapping) -> ColumnArray:
+    """Gather the columns of documents with a vectorized expansion of their CSR ranges."""
+    starts = doc_to_cols.offsets[doc_ids]
+    lengths = doc_to_cols.offsets[doc_ids + 1] - starts
+    # Position j of the gathered columns is at j - (first position of its document) + its start
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    positions = np.arange(shifts.size, dtype=np.int64) + shifts
+    return sorted_unique_ids(doc_to_cols.col_ids[positions])
+
+
+# Minimum number of columns per document ID at which the documents are deduplicated by counting
+# instead of sorting
+DENSE_COUNTING_DENSITY = 0.05
 
 
 def col_to_doc_ids(col_ids: ColumnArray, col_to_doc: NDArray[np.uint32]) -> DocumentArray:
-    return np.unique(col_to_doc[col_ids])
+    doc_ids = col_to_doc[col_ids]
+    if doc_ids.size > 0 and doc_ids.size >= (int(doc_ids.max()) + 1) * DENSE_COUNTING_DENSITY:
+        return np.flatnonzero(np.bincount(doc_ids)).astype(np.uint32)
+    return np.unique(doc_ids)
 
 
 def col_to_hist_ids(col_ids: ColumnArray, cutoff_hists: int) -> ColumnArray:
     # filter out the columns that are under the cutoff using numpy array operations
     return col_ids[col_ids < cutoff_hists]
+
+
+def col_complement_to_doc_ids(
+    excluded_col_ids: ColumnArray, col_to_doc: NDArray[np.uint32], cols_per_doc: NDArray[np.int64]
+) -> DocumentArray:
+    """Return the documents that contain at least one column that is not excluded.
+
+    This converts the complement of a set of columns without materializing it.
+    """
+    excluded_per_doc = np.bincount(col_to_doc[excluded_col_ids], minlength=len(cols_per_doc))
+    return np.flatnonzero(excluded_per_doc < cols_per_doc).astype(np.uint32)
@@ -1,12 +1,63 @@
 import os
-from functools import lru_cache
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+from itertools import combinations
+from typing import Any
 
-from backend.config import CacheInfo, ExecutorType, FainderMode, Highlights, Metadata
+import numpy as np
+from loguru import logger
+
+from backend.config import (
+    CacheStatistics,
+    CostModelInfo,
+    DocumentArray,
+    ExecutorType,
+    FainderMode,
+    Highlights,
+    Metadata,
+    PlanNode,
+    RenderedHighlights,
+)
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
+from .cache import (
+    LeafCache,
+    PlanCacheKey,
+    QueryResult,
+    ResultCache,
+    ResultCacheKey,
+    plan_nbytes,
+    query_result_nbytes,
+)
+from .conversion import sorted_unique_ids
+from .execution.batch_executor import BatchExecutor
+from .execution.context import QueryProfile, Refinement
+from .execution.executor import Executor
 from .execution.factory import create_executor
-from .optimizer import create_optimizer
+from .execution.highlighting_executor import HighlightingExecutor
+from .execution.profiling import explain_plan
+from .feedback import RuntimeCostModel
+from .highlighting import render_highlights
+from .optimizer import Optimizer, create_optimizer
 from .parser import Parser
+from .plan import Conjunction, QueryPlan, compile_plan
+from .ranking import Ranking
+from .statistics import StatisticsCatalog
+
+# Maximum number of operands of a conjunction whose subsets are looked up in the result cache
+MAX_REFINEMENT_OPERANDS = 6
+
+
+@dataclass(frozen=True)
+class IndexComponents:
+    """Components of an engine that depend on its indices and are replaced together."""
+
+    index_generation: int
+    statistics: StatisticsCatalog
+    optimizer: Optimizer
+    executor: Executor[Any]
+    batch_executor: BatchExecutor
+    highlighting_executor: HighlightingExecutor
 
 
 class Engine:
@@ -16,32 +67,42 @@ class Engine:
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        cache_size: int = 128,
+        cache_max_bytes: int = 256 * 2**20,
+        cache_ttl: float | None = None,
+        leaf_cache_max_bytes: int = 256 * 2**20,
+        plan_cache_max_bytes: int = 16 * 2**20,
         min_usability_score: float = 0.0,
         rank_by_usability: bool = True,
         executor_type: ExecutorType = ExecutorType.SIMPLE,
         max_workers: int = os.cpu_count() or 1,
+        cost_model: RuntimeCostModel | None = None,
     ) -> None:
         self.parser = Parser()
-        self.optimizer = create_optimizer(executor_type)
-        self.executor = create_executor(
-            executor_type=executor_type,
-            tantivy_index=tantivy_index,
-            fainder_index=fainder_index,
-            hnsw_index=hnsw_index,
-            metadata=metadata,
-            min_usability_score=min_usability_score,
-            rank_by_usability=rank_by_usability,
-            max_workers=max_workers,
+        # Optimized plans only depend on the query text, the statistics of the indices, and the
+        # learned leaf costs, so they survive cache clears but not index updates
+        self.plan_cache: ResultCache[PlanCacheKey, QueryPlan] = ResultCache(
+            max_bytes=plan_cache_max_bytes, sizeof=plan_nbytes
         )
+        # Costs that are learned from the runtime statistics of executed queries
+        self.cost_model = cost_model
+
+        # The leaf cache stores the results of individual predicates across queries. Its keys
+        # contain the index generation so that results computed on outdated indices never match.
+        self.leaf_cache = LeafCache(max_bytes=leaf_cache_max_bytes, ttl=cache_ttl)
+
         self.max_workers = max_workers
         self.min_usability_score = min_usability_score
         self.rank_by_usability = rank_by_usability
         self.executor_type = executor_type
+        self._components = self._create_components(
+            tantivy_index, fainder_index, hnsw_index, metadata, index_generation=0
+        )
 
-        # NOTE: Don't use lru_cache on methods
-        # See https://docs.astral.sh/ruff/rules/cached-instance-method/ for details
-        self.execute = lru_cache(maxsize=cache_size)(self._execute)
+        # The result cache is keyed on the canonical form of the optimized plan so that queries
+        # that only differ syntactically share the same cache entry
+        self.result_cache: ResultCache[ResultCacheKey, QueryResult] = ResultCache(
+            max_bytes=cache_max_bytes, sizeof=query_result_nbytes, ttl=cache_ttl
+        )
 
     def update_indices(
         self,
@@ -50,7 +111,58 @@ class Engine:
         hnsw_index: HnswIndex,
         metadata: Metadata,
     ) -> None:
-        self.executor = create_executor(
+        """Replace the indices of the engine.
+
+        All components that depend on the indices are created before they replace the current
+        ones in a single assignment, so concurrent queries use either the previous or the new
+        components, but never a mix of both.
+        """
+        self._components = self._create_components(
+            tantivy_index, fainder_index, hnsw_index, metadata, self.index_generation + 1
+        )
+        # Cached results and plans are keyed on the index generation and never match again, so
+        # clearing them only frees memory
+        self.clear_cache()
+        self.plan_cache.clear()
+
+    @property
+    def index_generation(self) -> int:
+        return self._components.index_generation
+
+    @property
+    def statistics(self) -> StatisticsCatalog:
+        return self._components.statistics
+
+    @property
+    def optimizer(self) -> Optimizer:
+        return self._components.optimizer
+
+    @optimizer.setter
+    def optimizer(self, optimizer: Optimizer) -> None:
+        self._components = replace(self._components, optimizer=optimizer)
+
+    @property
+    def executor(self) -> Executor[Any]:
+        return self._components.executor
+
+    @property
+    def batch_executor(self) -> BatchExecutor:
+        return self._components.batch_executor
+
+    @property
+    def highlighting_executor(self) -> HighlightingExecutor:
+        return self._components.highlighting_executor
+
+    def _create_components(
+        self,
+        tantivy_index: TantivyIndex,
+        fainder_index: FainderIndex,
+        hnsw_index: HnswIndex,
+        metadata: Metadata,
+        index_generation: int,
+    ) -> IndexComponents:
+        statistics = StatisticsCatalog(metadata, fainder_index.hists, tantivy_index)
+        executor = create_executor(
             executor_type=self.executor_type,
             tantivy_index=tantivy_index,
             fainder_index=fainder_index,
@@ -59,37 +171,342 @@ class Engine:
             min_usability_score=self.min_usability_score,
             rank_by_usability=self.rank_by_usability,
             max_workers=self.max_workers,
+            leaf_cache=self.leaf_cache,
+            index_generation=index_generation,
+            statistics=statistics,
+        )
+        batch_executor = BatchExecutor(
+            tantivy_index=tantivy_index,
+            fainder_index=fainder_index,
+            hnsw_index=hnsw_index,
+            metadata=metadata,
+            min_usability_score=self.min_usability_score,
+            rank_by_usability=self.rank_by_usability,
+            leaf_cache=self.leaf_cache,
+            index_generation=index_generation,
+            max_workers=self.max_workers,
+        )
+        highlighting_executor = HighlightingExecutor(
+            tantivy_index=tantivy_index,
+            fainder_index=fainder_index,
+            hnsw_index=hnsw_index,
+            metadata=metadata,
+            min_usability_score=self.min_usability_score,
+            rank_by_usability=self.rank_by_usability,
+            leaf_cache=self.leaf_cache,
+            index_generation=index_generation,
+        )
+        return IndexComponents(
+            index_generation=index_generation,
+            statistics=statistics,
+            optimizer=create_optimizer(self.executor_type, statistics=statistics),
+            executor=executor,
+            batch_executor=batch_executor,
+            highlighting_executor=highlighting_executor,
         )
-        self.clear_cache()
 
     def clear_cache(self) -> None:
-        self.execute.cache_clear()
+        self.result_cache.clear()
+        self.leaf_cache.clear()
 
-    def cache_info(self) -> CacheInfo:
-        hits, misses, max_size, curr_size = self.execute.cache_info()
-        return CacheInfo(hits=hits, misses=misses, max_size=max_size, curr_size=curr_size)
+    def cache_info(self) -> CacheStatistics:
+        return CacheStatistics(
+            result_cache=self.result_cache.info(),
+            plan_cache=self.plan_cache.info(),
+            leaf_cache=self.leaf_cache.info(),
+            leaf_cache_operators=self.leaf_cache.operator_info(),
+        )
 
-    def _execute(
+    def cost_info(self) -> CostModelInfo:
+        if self.cost_model is None:
+            return CostModelInfo(enabled=False)
+        return self.cost_model.info()
+
+    def execute(
+        self,
+        query: str,
+        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
+        enable_highlighting: bool = False,
+        fainder_index_name: str = "default",
+    ) -> tuple[list[int], RenderedHighlights]:
+        """Execute a query and return all result documents in ranked order.
+
+        The highlights of all result documents are rendered to HTML.
+        """
+        result = self.execute_ranked(query, fainder_mode, enable_highlighting, fainder_index_name)
+        doc_highlights, col_highlights = result.highlights
+        return result.ranking.top(len(result.ranking)).tolist(), (
+            render_highlights(doc_highlights),
+            col_highlights,
+        )
+
+    def highlight(
+        self,
+        query: str,
+        doc_ids: Sequence[int] | DocumentArray,
+        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
+        fainder_index_name: str = "default",
+    ) -> Highlights:
+        """Compute the highlights of some result documents of a query, e.g., of a result page.
+
+        This allows executing a query without highlighting and highlighting only the documents
+        that are shown. The highlights equal those of a highlighted execution of the query for
+        these documents.
+        """
+        components = self._components
+        plan = self._plan(components, query, fainder_mode, fainder_index_name)
+        return components.highlighting_executor.highlight(
+            plan,
+            sorted_unique_ids(np.asarray(doc_ids, dtype=np.uint32)),
+            fainder_mode,
+            fainder_index_name,
+        )
+
+    def execute_ranked(
+        self,
+        query: str,
+        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
+        enable_highlighting: bool = False,
+        fainder_index_name: str = "default",
+    ) -> QueryResult:
+        """Execute a query and return a lazily ranked result.
+
+        Only the part of the ranking that is accessed gets sorted, so callers that need a single
+        page of results should use `QueryResult.ranking.page` instead of ranking all documents.
+        """
+        # The components are read once since update_indices may replace them while the query is
+        # running. Their index generation keeps results of outdated indices out of the cache.
+        components = self._components
+        executor = components.executor
+        plan = self._plan(components, query, fainder_mode, fainder_index_name)
+
+        cache_key = ResultCacheKey(
+            plan.canonical,
+            fainder_mode,
+            enable_highlighting,
+            fainder_index_name,
+            executor.index_generation,
+        )
+        result = self.result_cache.get(cache_key)
+        if result is None:
+            result = self._execute(
+                executor,
+                plan,
+                fainder_mode,
+                enable_highlighting,
+                fainder_index_name,
+                refinement=self._find_refinement(plan, cache_key),
+            )
+            self.result_cache.put(cache_key, result)
+
+        return result
+
+    def _find_refinement(self, plan: QueryPlan, cache_key: ResultCacheKey) -> Refinement | None:
+        """Find the cached result of a query that a plan refines with additional operands.
+
+        A plan refines a query if its root is a conjunction whose operands include the query or
+        all operands of the query, e.g., `kw('a') AND col(pp(0.9;ge;30))` refines `kw('a')`. Of
+        all cached queries, the one with the most operands is reused. Plans with shared subplans
+        are never refined since the scores of a shared keyword predicate depend on all of its
+        occurrences.
+        """
+        conjunction = plan.root.children[0]
+        if (
+            not isinstance(conjunction, Conjunction)
+            or len(conjunction.children) > MAX_REFINEMENT_OPERANDS
+            or any(op.shared for op in plan.operators)
+        ):
+            return None
+
+        operands = conjunction.children
+        for size in range(len(operands) - 1, 0, -1):
+            for subset in combinations(operands, size):
+                # Canonical form of the query that consists of the operands, see `canonical_form`
+                canonical = (
+                    subset[0].canonical
+                    if size == 1
+                    else f"conjunction({','.join(sorted(op.canonical for op in subset))})"
+                )
+                result = self.result_cache.peek(cache_key._replace(plan=f"query({canonical})"))
+                if result is None:
+                    continue
+
+                logger.debug("Refining the cached result of query({})", canonical)
+                return Refinement(
+                    conjunction_id=conjunction.id,
+                    covered=frozenset(op.id for op in subset),
+                    result=(result.ranking.doc_ids, result.highlights),
+                    scores=result.ranking.scores,
+                )
+        return None
+
+    def execute_batch(
+        self,
+        queries: Sequence[str],
+        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
+        enable_highlighting: bool = False,
+        fainder_index_name: str = "default",
+    ) -> list[QueryResult]:
+        """Execute a batch of queries and return a lazily ranked result for each of them.
+
+        Queries with the same optimized plan are executed once, and predicates and subtrees that
+        occur in several queries are shared between them.
+        """
+        components = self._components
+        executor = components.batch_executor
+        cache_keys: list[ResultCacheKey] = []
+        results: dict[ResultCacheKey, QueryResult] = {}
+        pending: dict[ResultCacheKey, QueryPlan] = {}
+        for query in queries:
+            plan = self._plan(components, query, fainder_mode, fainder_index_name)
+            cache_key = ResultCacheKey(
+                plan.canonical,
+                fainder_mode,
+                enable_highlighting,
+                fainder_index_name,
+                executor.index_generation,
+            )
+            cache_keys.append(cache_key)
+            if cache_key in results or cache_key in pending:
+                continue
+            result = self.result_cache.get(cache_key)
+            if result is None:
+                pending[cache_key] = plan
+            else:
+                results[cache_key] = result
+
+        if pending:
+            ctxs = [
+                executor.create_context(fainder_mode, enable_highlighting, fainder_index_name)
+                for _ in pending
+            ]
+            try:
+                doc_results = executor.execute_batch(list(pending.values()), ctxs)
+                for cache_key, ctx, (doc_ids, highlights) in zip(
+                    pending, ctxs, doc_results, strict=True
+                ):
+                    result = QueryResult(Ranking(doc_ids, ctx.scores.gather(doc_ids)), highlights)
+                    self.result_cache.put(cache_key, result)
+                    results[cache_key] = result
+            finally:
+                for ctx in ctxs:
+                    executor.score_pool.release(ctx.scores)
+
+        return [results[cache_key] for cache_key in cache_keys]
+
+    def explain(
         self,
         query: str,
         fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> tuple[list[int], Highlights]:
-        # Reset state for new query
-        self.executor.reset(fainder_mode, enable_highlighting, fainder_index_name)
+        analyze: bool = False,
+    ) -> tuple[PlanNode, QueryResult | None]:
+        """Return the optimized plan of a query.
+
+        With `analyze`, the query is executed and each node of the plan is annotated with its
+        runtime statistics. Analyzed queries bypass the result cache, but not the leaf cache, so
+        that the statistics reflect an actual execution.
+        """
+        components = self._components
+        plan = self._plan(components, query, fainder_mode, fainder_index_name)
+        executor = components.executor
+        ctx = executor.create_context(fainder_mode, enable_highlighting, fainder_index_name)
+        try:
+            if self.cost_model is not None:
+                ctx.stop_points = self.cost_model.stop_points(fainder_mode, fainder_index_name)
+            result_groups = executor.plan_uses_result_groups(plan, ctx)
+        finally:
+            executor.score_pool.release(ctx.scores)
+        if not analyze:
+            return explain_plan(plan, result_groups=result_groups), None
+
+        profile = QueryProfile(len(plan.operators))
+        result = self._execute(
+            executor, plan, fainder_mode, enable_highlighting, fainder_index_name, profile
+        )
+        return explain_plan(plan, profile, result_groups), result
+
+    def plan(
+        self,
+        query: str,
+        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
+        fainder_index_name: str = "default",
+    ) -> QueryPlan:
+        """Parse, optimize, and compile a query, reusing the cached plan of a previous execution.
+
+        Plans are immutable, so the returned plan can be shared by concurrent executions. The
+        Fainder mode and index only matter once the costs of their operators have been learned.
+        """
+        return self._plan(self._components, query, fainder_mode, fainder_index_name)
+
+    def _plan(
+        self,
+        components: IndexComponents,
+        query: str,
+        fainder_mode: FainderMode,
+        fainder_index_name: str,
+    ) -> QueryPlan:
+        leaf_costs = (
+            self.cost_model.leaf_costs(fainder_mode, fainder_index_name)
+            if self.cost_model is not None
+            else None
+        )
+        cache_key = PlanCacheKey(
+            query,
+            tuple(sorted(leaf_costs.items())) if leaf_costs is not None else None,
+            components.index_generation,
+        )
+        plan = self.plan_cache.get(cache_key)
+        if plan is not None:
+            return plan
 
         # Parse query
         parse_tree = self.parser.parse(query)
 
         # Optimze query
-        parse_tree = self.optimizer.optimize(parse_tree)
+        parse_tree = components.optimizer.optimize(parse_tree, leaf_costs)
+
+        # Compile the optimized tree into an immutable plan
+        plan = compile_plan(parse_tree)
+        self.plan_cache.put(cache_key, plan)
+        return plan
+
+    def _execute(
+        self,
+        executor: Executor[Any],
+        plan: QueryPlan,
+        fainder_mode: FainderMode,
+        enable_highlighting: bool,
+        fainder_index_name: str,
+        profile: QueryProfile | None = None,
+        refinement: Refinement | None = None,
+    ) -> QueryResult:
+        # All per-query state lives in the execution context so that concurrent queries never
+        # interfere with each other
+        ctx = executor.create_context(fainder_mode, enable_highlighting, fainder_index_name)
+        cost_model = self.cost_model
+        if cost_model is not None:
+            # Every query is profiled to learn the costs of its operators
+            profile = profile or QueryProfile(len(plan.operators))
+            ctx.stop_points = cost_model.stop_points(fainder_mode, fainder_index_name)
+        ctx.profile = profile
+        if refinement is not None:
+            # The operands of the cached query are not evaluated, so their scores are reused
+            doc_ids, _ = refinement.result
+            scored = refinement.scores >= 0
+            ctx.scores.add(doc_ids[scored], refinement.scores[scored])
+            ctx.refinement = refinement
 
-        # Execute query
-        result, highlights = self.executor.execute(parse_tree)
+        try:
+            # Execute query
+            result, highlights = executor.execute(plan, ctx)
+            # Ranking is deferred until the results are accessed
+            scores = ctx.scores.gather(result)
+        finally:
+            executor.score_pool.release(ctx.scores)
 
-        # Sort by score
-        result_list: list[int] = result.tolist()
+        if cost_model is not None and profile is not None:
+            cost_model.record(plan, profile, fainder_mode, fainder_index_name)
 
-        result_list.sort(key=lambda x: self.executor.scores.get(x, -1), reverse=True)
-        return result_list, highlights
+        return QueryResult(Ranking(result, scores), highlights)
@@ -0,0 +1,177 @@
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from backend.config import ExecutorType, FainderMode, Metadata
+from backend.engine.cache import LeafCache
+from backend.engine.constants import FilteringStopPointsConfig
+from backend.engine.plan import KeywordOp, NameOp, Negation, Operator, PercentileOp, QueryPlan
+from backend.indices import FainderIndex, HnswIndex, TantivyIndex
+
+from .common import DocResult
+from .context import ExecutionContext, ScoreAccumulatorPool
+from .executor import Executor
+from .prefiltering_executor import PrefilteringExecutor
+from .simple_executor import SimpleExecutor
+from .threaded_executor import ThreadedExecutor
+from .threaded_prefiltering_executor import ThreadedPrefilteringExecutor
+
+if TYPE_CHECKING:
+    from backend.engine.statistics import StatisticsCatalog
+
+# Number of histograms below which percentile searches are too cheap to outweigh the overhead of
+# histogram filters and threads. On the toy collection (23 histograms), the prefiltering and
+# threaded executors that the selection picks take 0.1 to 0.9 ms longer per query than the simple
+# executor (`python -m benchmarks.executor_selection --min-hists 0`), so they only pay off once a
+# search over all histograms takes well over a millisecond. Rerun the benchmark on a collection of
+# the target size to tune the threshold.
+MIN_HISTS = 10_000
+
+
+class AutoExecutor(Executor[ExecutionContext]):
+    """Dispatches each query plan to the executor that suits the shape of the plan best.
+
+    The choice follows the performance characteristics of the executors:
+    - Plans without percentile predicates and all plans on indices with fewer than `min_hists`
+      histograms are evaluated by the simple executor, since neither threads nor histogram
+      filters pay off for fast searches
+    - Percentile predicates are prefiltered if the plan has a keyword or column name predicate
+      outside of a negation that is expected to yield a histogram filter, i.e., whose estimated
+      result is smaller than the filtering stop points of the Fainder mode
+    - Plans with several percentile predicates are evaluated with threads
+
+    All executors share the indices, the leaf cache, and a pool of score accumulators, so the
+    contexts of this executor can be handed to any of them. The threaded executors also share one
+    thread pool, so that at most `max_workers` operators run at the same time.
+
+    Args:
+        statistics: Statistics that estimate the result sizes of the filtering predicates. Without
+            statistics, every keyword or column name predicate is expected to yield a filter.
+        min_hists: Number of histograms from which on the other executors are considered.
+    """
+
+    def __init__(
+        self,
+        tantivy_index: TantivyIndex,
+        fainder_index: FainderIndex,
+        hnsw_index: HnswIndex,
+        metadata: Metadata,
+        min_usability_score: float = 0.0,
+        rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
+        max_workers: int = os.cpu_count() or 1,
+        statistics: "StatisticsCatalog | None" = None,
+        min_hists: int = MIN_HISTS,
+    ) -> None:
+        self.tantivy_index = tantivy_index
+        self.fainder_index = fainder_index
+        self.hnsw_index = hnsw_index
+        self.metadata = metadata
+        self.min_usability_score = min_usability_score
+        self.rank_by_usability = rank_by_usability
+        self.leaf_cache = leaf_cache
+        self.index_generation = index_generation
+        self.score_pool = ScoreAccumulatorPool(len(metadata.doc_to_cols))
+        self.statistics = statistics
+        self.min_hists = min_hists
+        self.max_workers = max_workers
+
+        self._thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        weakref.finalize(self, self._thread_pool.shutdown, wait=True)
+
+        common: dict[str, Any] = {
+            "tantivy_index": tantivy_index,
+            "fainder_index": fainder_index,
+            "hnsw_index": hnsw_index,
+            "metadata": metadata,
+            "min_usability_score": min_usability_score,
+            "rank_by_usability": rank_by_usability,
+            "leaf_cache": leaf_cache,
+            "index_generation": index_generation,
+        }
+        self.executors: dict[ExecutorType, Executor[Any]] = {
+            ExecutorType.SIMPLE: SimpleExecutor(**common),
+            ExecutorType.PREFILTERING: PrefilteringExecutor(**common),
+            ExecutorType.THREADED: ThreadedExecutor(
+                **common, max_workers=max_workers, thread_pool=self._thread_pool
+            ),
+            ExecutorType.THREADED_PREFILTERING: ThreadedPrefilteringExecutor(
+                **common, max_workers=max_workers, thread_pool=self._thread_pool
+            ),
+        }
+        for executor in self.executors.values():
+            executor.score_pool = self.score_pool
+
+    def create_context(
+        self,
+        fainder_mode: FainderMode,
+        enable_highlighting: bool = False,
+        fainder_index_name: str = "default",
+    ) -> ExecutionContext:
+        return ExecutionContext(
+            self.score_pool.acquire(), fainder_mode, enable_highlighting, fainder_index_name
+        )
+
+    def execute(self, plan: QueryPlan, ctx: ExecutionContext) -> DocResult:
+        """Evaluate a query plan with the executor that is selected for it."""
+        executor_type = self.select(plan, ctx)
+        logger.debug("Executing query with the {} executor", executor_type)
+        executor = self.executors[executor_type]
+
+        # The context of the selected executor takes over the per-query state of this context.
+        # Its own score accumulator is returned right away since both share the same pool.
+        executor_ctx = executor.create_context(
+            ctx.fainder_mode, ctx.enable_highlighting, ctx.fainder_index_name
+        )
+        self.score_pool.release(executor_ctx.scores)
+        executor_ctx.scores = ctx.scores
+        executor_ctx.profile = ctx.profile
+        executor_ctx.stop_points = ctx.stop_points
+        executor_ctx.refinement = ctx.refinement
+        result: DocResult = executor.execute(plan, executor_ctx)
+        return result
+
+    def plan_uses_result_groups(self, plan: QueryPlan, ctx: ExecutionContext) -> bool:
+        return self.executors[self.select(plan, ctx)].uses_result_groups
+
+    def select(self, plan: QueryPlan, ctx: ExecutionContext) -> ExecutorType:
+        """Select the executor type for a query plan."""
+        num_percentile_ops = sum(isinstance(op, PercentileOp) for op in plan.operators)
+        if num_percentile_ops == 0 or self.metadata.num_hists < self.min_hists:
+            return ExecutorType.SIMPLE
+
+        parallel = num_percentile_ops > 1
+        stop_points = ctx.filtering_stop_points()
+        if any(self._yields_filter(op, stop_points) for op in _filter_candidates(plan.root)):
+            return ExecutorType.THREADED_PREFILTERING if parallel else ExecutorType.PREFILTERING
+        return ExecutorType.THREADED if parallel else ExecutorType.SIMPLE
+
+    def _yields_filter(
+        self, op: KeywordOp | NameOp, stop_points: FilteringStopPointsConfig
+    ) -> bool:
+        """Check whether the estimated result of a predicate is small enough to filter by."""
+        statistics = self.statistics
+        if statistics is None:
+            return True
+        if isinstance(op, KeywordOp):
+            num_docs = statistics.keyword_selectivity(op.query) * statistics.num_docs
+            return num_docs < stop_points["num_doc_ids"]
+        num_cols = statistics.name_selectivity(op.column, op.k) * statistics.num_cols
+        return num_cols < stop_points["num_col_ids"]
+
+
+def _filter_candidates(operator: Operator) -> list[KeywordOp | NameOp]:
+    """Return the keyword and column name predicates that are not below a negation.
+
+    Predicates below a negation write to a result group that no percentile predicate outside of
+    the negation reads, so they never filter histograms.
+    """
+    if isinstance(operator, KeywordOp | NameOp):
+        return [operator]
+    if isinstance(operator, Negation):
+        return []
+    return [leaf for child in operator.children for leaf in _filter_candidates(child)]
@@ -0,0 +1,148 @@
+import os
+import weakref
+from collections import Counter
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+from loguru import logger
+
+from backend.config import Metadata
+from backend.engine.cache import KeywordResult, LeafCache, LeafResult
+from backend.engine.plan import KeywordOp, NameOp, Operator, PercentileOp, QueryPlan
+from backend.indices import FainderIndex, HnswIndex, TantivyIndex
+
+from .common import DocResult
+from .context import ExecutionContext
+from .simple_executor import SimpleExecutor
+
+
+class BatchExecutor(SimpleExecutor):
+    """Evaluates a batch of queries and shares the results of their common subexpressions.
+
+    All distinct leaf predicates of the batch are evaluated exactly once and in parallel. The
+    queries are then assembled bottom-up with the operator methods of the simple executor, where
+    subtrees that occur in more than one query are evaluated only for the first one.
+    """
+
+    def __init__(
+        self,
+        tantivy_index: TantivyIndex,
+        fainder_index: FainderIndex,
+        hnsw_index: HnswIndex,
+        metadata: Metadata,
+        min_usability_score: float = 0.0,
+        rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
+        max_workers: int = os.cpu_count() or 1,
+    ) -> None:
+        super().__init__(
+            tantivy_index=tantivy_index,
+            fainder_index=fainder_index,
+            hnsw_index=hnsw_index,
+            metadata=metadata,
+            min_usability_score=min_usability_score,
+            rank_by_usability=rank_by_usability,
+            leaf_cache=leaf_cache,
+            index_generation=index_generation,
+        )
+        self.max_workers = max_workers
+
+        # Results of a batch that are shared by the executors bound to its queries
+        self._leaf_results: dict[str, LeafResult] = {}
+        self._shared: dict[str, Any] = {}
+        self._shared_keys: set[str] = set()
+
+        self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        # Shut down the thread pool once the executor (but not one of its bound copies) is deleted
+        weakref.finalize(self, self._thread_pool.shutdown, wait=True)
+
+    def execute_batch(
+        self, plans: Sequence[QueryPlan], ctxs: Sequence[ExecutionContext]
+    ) -> list[DocResult]:
+        """Evaluate a batch of query plans, each in its own execution context.
+
+        All contexts must share the same Fainder mode, Fainder index, and highlighting setting.
+        """
+        if len(plans) != len(ctxs):
+            raise ValueError("Each query plan needs its own execution context")
+        if not plans:
+            return []
+
+        # Canonical forms of all operators identify common subexpressions across queries
+        query_counts: Counter[str] = Counter()
+        leaves: dict[str, KeywordOp | NameOp | PercentileOp] = {}
+        for plan in plans:
+            query_counts.update({op.canonical for op in plan.operators})
+            for op in plan.operators:
+                if isinstance(op, KeywordOp | NameOp | PercentileOp):
+                    leaves.setdefault(op.canonical, op)
+
+        shared_keys = {key for key, count in query_counts.items() if count > 1}
+        logger.debug(
+            "Evaluating {} distinct leaves for {} queries with {} shared subexpressions",
+            len(leaves),
+            len(plans),
+            len(shared_keys),
+        )
+
+        # Evaluate all distinct leaf predicates once and in parallel
+        leaf_executor: BatchExecutor = self.bind(ctxs[0])
+        futures = {
+            key: self._thread_pool.submit(leaf_executor._evaluate_leaf, op)
+            for key, op in leaves.items()
+        }
+        leaf_results = {key: future.result() for key, future in futures.items()}
+
+        shared: dict[str, Any] = {}
+        results: list[DocResult] = []
+        for plan, ctx in zip(plans, ctxs, strict=True):
+            bound: BatchExecutor = self.bind(ctx)
+            bound._leaf_results = leaf_results
+            bound._shared = shared
+            bound._shared_keys = shared_keys
+            bound._add_keyword_scores(plan)
+            results.append(bound._evaluate(plan.root))
+
+        return results
+
+    def _evaluate_leaf(self, op: KeywordOp | NameOp | PercentileOp) -> LeafResult:
+        match op:
+            case KeywordOp():
+                return self._keyword_result(op.query)
+            case NameOp():
+                return self._name_search(op.column, op.k)
+            case PercentileOp():
+                return self._percentile_search(op)
+
+    def _add_keyword_scores(self, plan: QueryPlan) -> None:
+        """Add the scores of all keyword predicates of a query to its context."""
+        for op in plan.operators:
+            if isinstance(op, KeywordOp):
+                result = self._leaf_results[op.canonical]
+                if isinstance(result, KeywordResult):
+                    self.updates_scores(result.doc_ids, result.scores)
+
+    def _evaluate(self, operator: Operator) -> Any:  # noqa: ANN401
+        """Evaluate an operator with the leaf results and shared subexpressions of the batch."""
+        key = operator.canonical
+        if key in self._shared:
+            return self._shared[key]
+
+        leaf_result = self._leaf_results.get(key)
+        if isinstance(leaf_result, KeywordResult):
+            # Keyword results carry document highlights but no column highlights
+            result: Any = (
+                leaf_result.doc_ids,
+                (leaf_result.highlights, np.array([], dtype=np.uint32)),
+            )
+        elif leaf_result is not None:
+            result = leaf_result
+        else:
+            result = super()._evaluate(operator)
+
+        if key in self._shared_keys:
+            self._shared[key] = result
+        return result
@@ -1,5 +1,5 @@
-import re
 from collections.abc import Sequence
+from dataclasses import dataclass
 from typing import Any, Literal, TypeGuard, TypeVar
 
 import numpy as np
@@ -8,9 +8,10 @@ from lark.visitors import Visitor_Recursive
 from loguru import logger
 from numpy.typing import NDArray
 
-from backend.config import ColumnArray, DocumentArray, DocumentHighlights, FainderMode, Highlights
-from backend.engine.constants import FILTERING_STOP_POINTS
+from backend.config import ColumnArray, CsrMapping, DocumentArray, DocumentHighlights, Highlights
+from backend.engine.constants import FilteringStopPointsConfig
 from backend.engine.conversion import doc_to_col_ids
+from backend.engine.highlighting import merge_field_highlights
 
 DocResult = tuple[DocumentArray, Highlights]
 ColResult = ColumnArray
@@ -196,10 +197,10 @@ class ResultGroupAnnotator(Visitor_Recursive[Token]):
 def exceeds_filtering_limit(
     ids: DocumentArray | ColumnArray,
     id_type: Literal["num_hist_ids", "num_col_ids", "num_doc_ids"],
-    fainder_mode: FainderMode,
+    stop_points: FilteringStopPointsConfig,
 ) -> bool:
-    """Check if the number of IDs exceeds the filtering limit for the current mode."""
-    return len(ids) > FILTERING_STOP_POINTS[fainder_mode][id_type]
+    """Check if the number of IDs exceeds the filtering limit of a query."""
+    return len(ids) > stop_points[id_type]
 
 
 def is_doc_result(val: Sequence[Any]) -> TypeGuard[Sequence[DocResult]]:
@@ -211,100 +212,220 @@ def merge_highlights(
     left: Highlights,
     right: Highlights,
     doc_ids: DocumentArray,
-    doc_to_cols: list[NDArray[np.uint32]],
+    doc_to_cols: CsrMapping,
 ) -> Highlights:
-    """Merge highlights for documents that are in the result set."""
-    pattern = r"<mark>(.*?)</mark>"
-    regex = re.compile(pattern, re.DOTALL)
+    """Merge highlights for documents that are in the result set.
 
+    The spans of a field that both sides highlight are united, so the merged highlights do not
+    depend on the order of the operands.
+    """
     # Merge document highlights
     doc_highlights: DocumentHighlights = {}
     left_doc_highlights = left[0]
     right_doc_highlights = right[0]
-    for doc_id in doc_ids:
-        left_highlights = left_doc_highlights.get(doc_id, {})
-        right_highlights = right_doc_highlights.get(doc_id, {})
+    candidates = list(left_doc_highlights.keys() | right_doc_highlights.keys())
+    if candidates:
+        in_result = contains_sorted(doc_ids, np.array(candidates, dtype=np.uint32))
+        for doc_id, keep in zip(candidates, in_result.tolist(), strict=True):
+            if keep:
+                doc_highlights[doc_id] = merge_field_highlights(
+                    left_doc_highlights.get(doc_id, {}), right_doc_highlights.get(doc_id, {})
+                )
 
-        # Only process if either side has highlights
-        if left_highlights or right_highlights:
-            merged_highlights = {}
+    # Merge column highlights
+    col_highlights = union_arrays(left[1], right[1])
+    col_highlights = intersect_arrays(col_highlights, doc_to_col_ids(doc_ids, doc_to_cols))
 
-            # Process each field that appears in either highlight set
-            all_keys = set(left_highlights.keys()) | set(right_highlights.keys())
-            for key in all_keys:
-                left_text = left_highlights.get(key, "")
-                right_text = right_highlights.get(key, "")
+    return doc_highlights, col_highlights
 
-                # If either text is empty, use the non-empty one
-                if not left_text:
-                    merged_highlights[key] = right_text
-                    continue
-                if not right_text:
-                    continue
 
-                # Both texts have content, merge their marks
-                # Extract all marked words from right text
-                right_marks = set(regex.findall(right_text))
+# All document and column ID arrays that the executors produce are sorted and free of duplicates.
+# The leaf lookups of the executors establish this invariant and every set operation below relies
+# on and preserves it, so that no operation has to sort its operands again.
 
-                # Add marks from right text to left text
-                for word in right_marks:
-                    if f"<mark>{word}</mark>" not in left_text:
-                        # Word isn't marked yet
-                        left_text = left_text.replace(word, f"<mark>{word}</mark>")
+# Minimum number of IDs per value of the ID range at which set operations use dense masks over
+# the ID range instead of searching and merging the sorted IDs
+DENSE_INTERSECTION_DENSITY = 0.25
+DENSE_UNION_DENSITY = 0.02
+# Minimum size ratio of an operand to the candidates of an intersection at which the candidates are
+# binary-searched in the operand instead of merged with it
+SEARCH_SIZE_RATIO = 8
 
-                merged_highlights[key] = left_text
 
-            doc_highlights[doc_id] = merged_highlights
+def id_range(arrays: Sequence[NDArray[np.uint32]]) -> int:
+    """Return the number of IDs up to and including the largest ID in any of the arrays."""
+    return max((int(arr[-1]) + 1 for arr in arrays if arr.size > 0), default=0)
 
-    # Merge column highlights
-    col_highlights = union_arrays(left[1], right[1])
-    col_highlights = intersect_arrays(col_highlights, doc_to_col_ids(doc_ids, doc_to_cols))
 
-    return doc_highlights, col_highlights
+def is_dense(arrays: Sequence[NDArray[np.uint32]], num_ids: int, density: float) -> bool:
+    """Check whether arrays are dense enough in an ID range for a set operation on masks."""
+    return sum(arr.size for arr in arrays) >= num_ids * density
+
+
+def ids_mask(ids: NDArray[np.uint32], num_ids: int) -> NDArray[np.bool_]:
+    mask = np.zeros(num_ids, dtype=np.bool_)
+    mask[ids] = True
+    return mask
+
+
+def contains_sorted(ids: NDArray[np.uint32], values: NDArray[np.uint32]) -> NDArray[np.bool_]:
+    """Return a mask of the values that are contained in an array of sorted IDs."""
+    if ids.size == 0:
+        return np.zeros(values.size, dtype=np.bool_)
+    positions = np.searchsorted(ids, values)
+    np.minimum(positions, ids.size - 1, out=positions)
+    found: NDArray[np.bool_] = ids[positions] == values
+    return found
 
 
 def intersect_arrays(a: DocumentArray, b: DocumentArray) -> DocumentArray:
-    mask = np.isin(a, b)
-    return a[mask]
+    return reduce_arrays([a, b], "and")
 
 
 def union_arrays(a: DocumentArray, b: DocumentArray) -> DocumentArray:
-    return np.union1d(a, b)
+    return reduce_arrays([a, b], "or")
 
 
 def reduce_arrays(
     arrays: Sequence[TArray],
     operator: Literal["and", "or"],
 ) -> TArray:
+    """Intersect or unite sorted arrays of unique IDs in a single pass over all operands.
+
+    Dense arrays are combined as masks over their ID range. Otherwise, an intersection starts with
+    the smallest operand and keeps the candidates that a binary search finds in each larger
+    operand, smallest first, which costs O(m log n) per operand of size n for m candidates like a
+    galloping search. Operands of a similar size as the candidates are merged with them instead.
+    A union merges the sorted runs of all operands and drops duplicates.
+    """
+    if operator not in {"and", "or"}:
+        raise ValueError(f"Invalid operator: {operator}")
+    if len(arrays) == 1:
+        return arrays[0]
+
+    num_ids = id_range(arrays)
+    density = DENSE_INTERSECTION_DENSITY if operator == "and" else DENSE_UNION_DENSITY
+    if is_dense(arrays, num_ids, density):
+        return _reduce_masks(arrays, operator, num_ids)
     if operator == "and":
-        intersection = arrays[0]
-        for arr in arrays[1:]:
+        return _intersect_sorted(arrays)
+    return _merge_sorted(arrays)
+
+
+def _intersect_sorted(arrays: Sequence[TArray]) -> TArray:
+    operands = sorted(arrays, key=len)
+    intersection = operands[0]
+    for arr in operands[1:]:
+        if intersection.size == 0:
+            break
+        if arr.size >= SEARCH_SIZE_RATIO * intersection.size:
+            intersection = intersection[contains_sorted(arr, intersection)]
+        else:
             intersection = np.intersect1d(intersection, arr, assume_unique=True)
-        return intersection.view(type(arrays[0]))
-    if operator == "or":
-        union = arrays[0]
-        for arr in arrays[1:]:
-            union = np.union1d(union, arr)
-        return union.view(type(arrays[0]))
-    raise ValueError(f"Invalid operator: {operator}")
+    return intersection.astype(arrays[0].dtype, copy=False).view(type(arrays[0]))
+
+
+def _merge_sorted(arrays: Sequence[TArray]) -> TArray:
+    # The stable sort of NumPy is a Timsort that merges the presorted runs of the operands
+    merged = np.concatenate(arrays).astype(arrays[0].dtype, copy=False)
+    merged.sort(kind="stable")
+    if merged.size > 1:
+        keep = np.empty(merged.size, dtype=np.bool_)
+        keep[0] = True
+        np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+        merged = merged[keep]
+    return merged.view(type(arrays[0]))
+
+
+def _reduce_masks(
+    arrays: Sequence[TArray], operator: Literal["and", "or"], num_ids: int
+) -> TArray:
+    mask = ids_mask(arrays[0], num_ids)
+    for arr in arrays[1:]:
+        if operator == "and":
+            mask &= ids_mask(arr, num_ids)
+        else:
+            mask[arr] = True
+    return np.flatnonzero(mask).astype(arrays[0].dtype).view(type(arrays[0]))
+
+
+def difference_arrays(a: TArray, b: TArray) -> TArray:
+    num_ids = id_range([a, b])
+    if is_dense([a, b], num_ids, DENSE_INTERSECTION_DENSITY):
+        mask = ids_mask(a, num_ids)
+        mask[b] = False
+        return np.flatnonzero(mask).astype(a.dtype).view(type(a))
+    return a[~contains_sorted(b, a)].view(type(a))
 
 
 def negate_array(
     item: TArray,
     number_of_ids: int,
 ) -> TArray:
-    # Create a mask for the negation
-    dtype = item.dtype
-    mask = np.isin(np.arange(number_of_ids), item, invert=True)
-    result = np.arange(number_of_ids, dtype=dtype)[mask]
+    # Create a mask for the negation, which avoids sorting all IDs like np.isin
+    mask = np.ones(number_of_ids, dtype=np.bool_)
+    mask[item] = False
+    result = np.flatnonzero(mask).astype(item.dtype)
     return result.view(type(item))
 
 
+@dataclass(frozen=True, slots=True)
+class Complement:
+    """All document or column IDs of the collection except the excluded ones.
+
+    The executors without result groups return complements for negations instead of materializing
+    them. A conjunction with a positive operand evaluates `X AND NOT Y` as the set difference of X
+    and Y, so that a complement is only materialized if nothing bounds it.
+    """
+
+    excluded: NDArray[np.uint32]
+
+    def materialize(self, number_of_ids: int) -> NDArray[np.uint32]:
+        return negate_array(self.excluded, number_of_ids)
+
+
+LazyIds = NDArray[np.uint32] | Complement
+LazyDocResult = tuple[LazyIds, Highlights]
+
+
+def complement_ids(ids: LazyIds) -> LazyIds:
+    """Negate IDs without materializing the complement."""
+    return ids.excluded if isinstance(ids, Complement) else Complement(ids)
+
+
+def materialize_ids(ids: LazyIds, number_of_ids: int) -> NDArray[np.uint32]:
+    return ids.materialize(number_of_ids) if isinstance(ids, Complement) else ids
+
+
+def combine_ids(items: Sequence[LazyIds], operator: Literal["and", "or"]) -> LazyIds:
+    """Combine IDs that may be complements with a junction operator.
+
+    Complements are never materialized: `X AND NOT Y AND NOT Z` is the difference of X and the
+    union of Y and Z, and `X OR NOT Y OR NOT Z` is the complement of the intersection of Y and Z
+    without X.
+    """
+    positives = [item for item in items if not isinstance(item, Complement)]
+    excluded = [item.excluded for item in items if isinstance(item, Complement)]
+    if not excluded:
+        return reduce_arrays(positives, operator)
+
+    if operator == "and":
+        excluded_ids = reduce_arrays(excluded, "or")
+        if not positives:
+            return Complement(excluded_ids)
+        return difference_arrays(reduce_arrays(positives, "and"), excluded_ids)
+
+    excluded_ids = reduce_arrays(excluded, "and")
+    if positives:
+        excluded_ids = difference_arrays(excluded_ids, reduce_arrays(positives, "or"))
+    return Complement(excluded_ids)
+
+
 def junction(
     items: Sequence[TResult],
     operator: Literal["and", "or"],
     enable_highlighting: bool = False,
-    doc_to_cols: list[NDArray[np.uint32]] | None = None,
+    doc_to_cols: CsrMapping | None = None,
 ) -> TResult:
     """Combine query results using a junction operator (AND/OR)."""
     if len(items) < 2:  # noqa: PLR2004
@@ -331,3 +452,42 @@ def junction(
 
     # Items contains column results (i.e., ColResult)
     return reduce_arrays(items, operator)  # type: ignore[type-var]
+
+
+def lazy_junction(
+    items: Sequence[LazyDocResult] | Sequence[LazyIds],
+    operator: Literal["and", "or"],
+    enable_highlighting: bool = False,
+    doc_to_cols: CsrMapping | None = None,
+) -> LazyDocResult | LazyIds:
+    """Combine query results whose IDs may be complements using a junction operator (AND/OR).
+
+    Complements carry no highlights. With highlighting, the complements of a disjunction of
+    documents are materialized so that the highlights of its positive operands are kept, and the
+    highlights of all operands are merged like in `junction`.
+    """
+    if len(items) < 2:  # noqa: PLR2004
+        raise ValueError("Junction must have at least two items")
+
+    if not is_lazy_doc_result(items):
+        return combine_ids(items, operator)  # type: ignore[arg-type]
+
+    ids = [item[0] for item in items]
+    if not enable_highlighting or doc_to_cols is None:
+        return combine_ids(ids, operator), ({}, np.array([], dtype=np.uint32))
+
+    if operator == "or":
+        ids = [materialize_ids(item, len(doc_to_cols)) for item in ids]
+    doc_ids = combine_ids(ids, operator)
+    if isinstance(doc_ids, Complement):
+        return doc_ids, ({}, np.array([], dtype=np.uint32))
+
+    highlights = items[0][1]
+    for item in items[1:]:
+        highlights = merge_highlights(highlights, item[1], doc_ids, doc_to_cols)
+    return doc_ids, highlights
+
+
+def is_lazy_doc_result(val: Sequence[Any]) -> TypeGuard[Sequence[LazyDocResult]]:
+    """Check if a list contains document results whose IDs may be complements."""
+    return all(isinstance(item, tuple) for item in val)
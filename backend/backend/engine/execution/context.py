@@ -0,0 +1,155 @@
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+from backend.config import DocumentArray, FainderMode, Highlights
+from backend.engine.constants import FILTERING_STOP_POINTS, FilteringStopPointsConfig
+from backend.engine.plan import Operator
+
+
+class ScoreAccumulator:
+    """Dense accumulator for the scores of all documents in a collection.
+
+    Scores are summed with a vectorized scatter-add into a preallocated array. The accumulator
+    remembers which documents it has updated so that it can be reset in time proportional to the
+    number of scored documents instead of the collection size.
+
+    Args:
+        num_docs: Number of documents in the collection.
+    """
+
+    def __init__(self, num_docs: int) -> None:
+        self._scores = np.zeros(num_docs, dtype=np.float32)
+        self._scored = np.zeros(num_docs, dtype=np.bool_)
+        self._updates: list[DocumentArray] = []
+        # Leaf operators of threaded executors update the scores concurrently
+        self._lock = threading.Lock()
+
+    def add(self, doc_ids: DocumentArray, scores: NDArray[np.float32]) -> None:
+        """Add scores to the documents with the given IDs."""
+        with self._lock:
+            np.add.at(self._scores, doc_ids, scores)
+            self._scored[doc_ids] = True
+            self._updates.append(doc_ids)
+
+    def gather(self, doc_ids: DocumentArray, default: float = -1) -> NDArray[np.float32]:
+        """Return the scores of the given documents, using a default for unscored documents."""
+        with self._lock:
+            return np.where(self._scored[doc_ids], self._scores[doc_ids], np.float32(default))
+
+    def get(self, doc_id: int, default: float = -1) -> float:
+        with self._lock:
+            return float(self._scores[doc_id]) if self._scored[doc_id] else default
+
+    def reset(self) -> None:
+        """Reset the scores of all documents that have been updated since the last reset."""
+        with self._lock:
+            for doc_ids in self._updates:
+                self._scores[doc_ids] = 0
+                self._scored[doc_ids] = False
+            self._updates.clear()
+
+
+class ScoreAccumulatorPool:
+    """A thread-safe pool of score accumulators that are reused across queries.
+
+    Args:
+        num_docs: Number of documents in the collection.
+    """
+
+    def __init__(self, num_docs: int) -> None:
+        self.num_docs = num_docs
+        self._free: list[ScoreAccumulator] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> ScoreAccumulator:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return ScoreAccumulator(self.num_docs)
+
+    def release(self, accumulator: ScoreAccumulator) -> None:
+        accumulator.reset()
+        with self._lock:
+            self._free.append(accumulator)
+
+
+@dataclass
+class OperatorStats:
+    """Runtime statistics of a single operator of a query plan."""
+
+    wall_time: float | None = None
+    output_cardinality: int | None = None
+    hist_filter_size: int | None = None
+    cache_hit: bool | None = None
+
+
+class QueryProfile:
+    """Collects the runtime statistics of the operators of a single query plan.
+
+    Args:
+        num_operators: Number of operators in the plan.
+    """
+
+    def __init__(self, num_operators: int) -> None:
+        # Each operator only updates its own statistics, so operators in different threads can
+        # record concurrently
+        self.operators = [OperatorStats() for _ in range(num_operators)]
+
+    def stats(self, operator: Operator) -> OperatorStats:
+        return self.operators[operator.id]
+
+
+@dataclass(frozen=True)
+class Refinement:
+    """Cached result of a query that the evaluated query refines with additional operands.
+
+    Attributes:
+        conjunction_id: ID of the conjunction whose operands include those of the cached query.
+        covered: IDs of the operands of the conjunction that the cached result replaces.
+        result: Document IDs and highlights of the cached query.
+        scores: Scores of the documents of the cached query, or -1 for unscored documents.
+    """
+
+    conjunction_id: int
+    covered: frozenset[int]
+    result: tuple[DocumentArray, Highlights]
+    scores: NDArray[np.float32]
+
+
+@dataclass
+class ExecutionContext:
+    """Per-query state of an executor.
+
+    Executors themselves only hold state that is shared by all queries (indices, metadata, caches,
+    and thread pools). Everything that belongs to a single query lives in its execution context,
+    which allows a single executor to evaluate many queries concurrently.
+    """
+
+    scores: ScoreAccumulator
+    fainder_mode: FainderMode = FainderMode.LOW_MEMORY
+    enable_highlighting: bool = False
+    fainder_index_name: str = "default"
+    profile: QueryProfile | None = None
+    # Sizes at which the prefiltering executors stop filtering, defaults to those of the mode
+    stop_points: FilteringStopPointsConfig | None = None
+    # Results of the subplans that occur more than once in the plan, keyed by canonical form
+    shared_results: dict[str, Any] = field(default_factory=dict[str, Any])
+    # Cached result of a previous query that replaces some operands of the root conjunction
+    refinement: Refinement | None = None
+
+    def filtering_stop_points(self) -> FilteringStopPointsConfig:
+        if self.stop_points is not None:
+            return self.stop_points
+        return FILTERING_STOP_POINTS[self.fainder_mode]
+
+
+@dataclass
+class ResultGroupContext(ExecutionContext):
+    """Execution context with the result groups of the prefiltering executors."""
+
+    parent_write_group: Mapping[int, int] = field(default_factory=dict[int, int])
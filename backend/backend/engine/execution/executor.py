@@ -1,19 +1,47 @@
+import copy
 from abc import ABC, abstractmethod
-from collections.abc import Sequence
+from typing import Any, ClassVar, Generic, Self, TypeVar
 
-from lark import ParseTree
+import numpy as np
 from loguru import logger
+from numpy.typing import NDArray
 
-from backend.config import DocumentArray, FainderMode, Metadata
+from backend.config import ColumnArray, DocumentArray, FainderMode, Metadata
+from backend.engine.cache import KeywordResult, LeafCache, LeafCacheKey
+from backend.engine.conversion import is_sorted_unique, sorted_unique_ids
+from backend.engine.optimizer import INVERTED_MARKER
+from backend.engine.plan import Conjunction, Operator, PercentileOp, QueryPlan
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
-from .common import DocResult
+from .common import DocResult, contains_sorted
+from .context import ExecutionContext, OperatorStats, ScoreAccumulatorPool
+from .profiling import evaluate_profiled
 
+TContext = TypeVar("TContext", bound=ExecutionContext)
 
-class Executor(ABC):
-    """Base abstract class for query executors that defines the common interface."""
 
-    scores: dict[int, float]
+class Executor(ABC, Generic[TContext]):
+    """Base abstract class for query executors that defines the common interface.
+
+    An executor only holds state that is shared by all queries. The state of a single query lives
+    in an execution context that is created with `create_context` and passed to `execute`. This
+    makes it safe to evaluate many queries concurrently with the same executor.
+    """
+
+    tantivy_index: TantivyIndex
+    fainder_index: FainderIndex
+    hnsw_index: HnswIndex
+    metadata: Metadata
+    min_usability_score: float
+    rank_by_usability: bool
+    leaf_cache: LeafCache | None
+    index_generation: int
+    score_pool: ScoreAccumulatorPool
+    # Whether the executor shares intermediate results through the result groups of a plan
+    uses_result_groups: ClassVar[bool] = False
+
+    # Only set on executors that are bound to a query, see `bind`
+    ctx: TContext
 
     @abstractmethod
     def __init__(
@@ -22,26 +50,235 @@ class Executor(ABC):
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-        enable_highlighting: bool = False,
     ) -> None:
         """Initialize the executor with the necessary indices and metadata."""
 
     @abstractmethod
-    def reset(
+    def create_context(
         self,
         fainder_mode: FainderMode,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> None:
-        """Reset the executor's state."""
+    ) -> TContext:
+        """Create a new execution context for a query."""
 
     @abstractmethod
-    def execute(self, tree: ParseTree) -> DocResult:
-        """Start processing the parse tree."""
+    def execute(self, plan: QueryPlan, ctx: TContext) -> DocResult:
+        """Evaluate a query plan in an execution context."""
+
+    def plan_uses_result_groups(self, plan: QueryPlan, ctx: TContext) -> bool:
+        """Check whether a plan is evaluated with its result groups in a context.
+
+        Executors that dispatch plans to other executors report the choice for the plan.
+        """
+        return self.uses_result_groups
+
+    def bind(self, ctx: TContext) -> Self:
+        """Return a shallow copy of the executor that evaluates a single query in a context.
+
+        The copy shares all indices, caches, and thread pools with this executor, so binding is
+        cheap. Operator implementations access the per-query state through `self.ctx`.
+        """
+        bound = copy.copy(self)
+        bound.ctx = ctx
+        return bound
+
+    def _evaluate(self, operator: Operator) -> Any:  # noqa: ANN401
+        """Evaluate an operator with the method of the same name.
+
+        Operator methods evaluate their children with this method, so a plan is evaluated
+        top-down without an intermediate tree transformation. Subplans that occur more than once
+        in a plan are only evaluated for their first occurrence, unless the executor uses result
+        groups, in which case each occurrence is evaluated with its own histogram filter. Results
+        that are futures are shared as well, so that no leaf is submitted twice.
+        """
+        if not operator.shared or self.uses_result_groups:
+            return self._evaluate_operator(operator)
+
+        shared_results = self.ctx.shared_results
+        if operator.canonical not in shared_results:
+            shared_results[operator.canonical] = self._evaluate_operator(operator)
+        else:
+            logger.trace("Reusing the result of shared subplan: {}", operator.canonical)
+        return shared_results[operator.canonical]
+
+    def _evaluate_operator(self, operator: Operator) -> Any:  # noqa: ANN401
+        evaluate = getattr(self, operator.name)
+        profile = self.ctx.profile
+        if profile is None:
+            return evaluate(operator)
+        return evaluate_profiled(evaluate, operator, profile.stats(operator))
+
+    def _refined_children(self, op: Conjunction) -> tuple[tuple[Operator, ...], DocResult | None]:
+        """Return the operands of a conjunction that are not covered by a refined query.
+
+        If the query refines a cached query, the operands of the cached query are not evaluated
+        again and the cached result is returned instead, which the conjunction intersects with the
+        remaining operands.
+        """
+        refinement = self.ctx.refinement
+        if refinement is None or refinement.conjunction_id != op.id:
+            return op.children, None
+
+        logger.trace("Reusing the cached result of {} operands", len(refinement.covered))
+        children = tuple(child for child in op.children if child.id not in refinement.covered)
+        return children, refinement.result
+
+    def _operator_stats(self, operator: Operator) -> OperatorStats | None:
+        """Return the statistics of an operator if the query is profiled, otherwise None."""
+        profile = self.ctx.profile
+        return profile.stats(operator) if profile is not None else None
 
-    def updates_scores(self, doc_ids: DocumentArray, scores: Sequence[float]) -> None:
+    def updates_scores(self, doc_ids: DocumentArray, scores: NDArray[np.float32]) -> None:
         logger.trace("Updating scores for {} documents", doc_ids.size)
 
-        for doc_id, score in zip(doc_ids, scores, strict=True):
-            self.scores[int(doc_id)] += score
+        self.ctx.scores.add(doc_ids, scores)
+
+    ###########################
+    # Cached leaf index lookups
+    ###########################
+
+    def _leaf_cache_key(
+        self, operator: str, arguments: tuple[str | float | int | bool, ...]
+    ) -> LeafCacheKey:
+        if operator == "percentile_op":
+            return LeafCacheKey(
+                operator,
+                arguments,
+                self.ctx.fainder_mode,
+                self.ctx.fainder_index_name,
+                self.index_generation,
+            )
+        return LeafCacheKey(operator, arguments, None, None, self.index_generation)
+
+    def _keyword_search(
+        self, query: str, stats: OperatorStats | None = None, occurrences: int = 1
+    ) -> KeywordResult:
+        """Search the keyword index and update the scores of the matched documents.
+
+        The scores of a keyword predicate that occurs several times in a shared subplan but is
+        evaluated only once are added once per occurrence.
+        """
+        result = self._keyword_result(query, stats)
+        scores = result.scores if occurrences == 1 else result.scores * np.float32(occurrences)
+        self.updates_scores(result.doc_ids, scores)
+        return result
+
+    def _keyword_result(self, query: str, stats: OperatorStats | None = None) -> KeywordResult:
+        """Search the keyword index without updating any scores."""
+        key = self._leaf_cache_key("keyword_op", (str(query), self.ctx.enable_highlighting))
+        result = self.leaf_cache.get(key) if self.leaf_cache else None
+        if stats is not None:
+            stats.cache_hit = isinstance(result, KeywordResult)
+        if not isinstance(result, KeywordResult):
+            doc_ids, scores, highlights = self.tantivy_index.search(
+                query,
+                self.ctx.enable_highlighting,
+                self.min_usability_score,
+                self.rank_by_usability,
+            )
+            result = _sorted_keyword_result(
+                KeywordResult(doc_ids, np.array(scores, dtype=np.float32), highlights)
+            )
+            if self.leaf_cache:
+                self.leaf_cache.put(key, result)
+        else:
+            logger.trace("Leaf cache hit for keyword query: {}", query)
+
+        return result
+
+    def _name_search(self, column: str, k: int, stats: OperatorStats | None = None) -> ColumnArray:
+        """Search the column name index."""
+        key = self._leaf_cache_key("name_op", (str(column), k))
+        result = self.leaf_cache.get(key) if self.leaf_cache else None
+        if stats is not None:
+            stats.cache_hit = isinstance(result, np.ndarray)
+        if isinstance(result, np.ndarray):
+            logger.trace("Leaf cache hit for column name query: {};{}", column, k)
+            return result
+
+        result = sorted_unique_ids(self.hnsw_index.search(column, k, None))
+        if self.leaf_cache:
+            self.leaf_cache.put(key, result)
+        return result
+
+    def _percentile_search(
+        self,
+        op: PercentileOp,
+        hist_filter: ColumnArray | None = None,
+        stats: OperatorStats | None = None,
+    ) -> ColumnArray:
+        """Search the Fainder index.
+
+        If the unfiltered result of the predicate is cached, a histogram filter is applied by
+        intersecting the cached result with the filter instead of searching the index again.
+        Only unfiltered results are added to the cache.
+        """
+        arguments: tuple[str | float, ...] = (op.percentile, str(op.comparison), op.reference)
+        upper_bound = op.upper_bound
+        if upper_bound is not None:
+            arguments += (str(upper_bound[0]), upper_bound[1])
+        if op.inverted:
+            arguments += (INVERTED_MARKER,)
+        key = self._leaf_cache_key("percentile_op", arguments)
+        result = self.leaf_cache.get(key) if self.leaf_cache else None
+        if stats is not None:
+            stats.cache_hit = isinstance(result, np.ndarray)
+            stats.hist_filter_size = len(hist_filter) if hist_filter is not None else None
+        if isinstance(result, np.ndarray):
+            logger.trace("Leaf cache hit for percentile query: {}", ";".join(op.arguments()))
+            if hist_filter is None:
+                return result
+            return result[contains_sorted(hist_filter, result)]
+
+        if upper_bound is None:
+            result = self.fainder_index.search(
+                op.percentile,
+                op.comparison,
+                op.reference,
+                self.ctx.fainder_mode,
+                self.ctx.fainder_index_name,
+                hist_filter,
+                op.inverted,
+            )
+            if op.inverted:
+                result = self._add_non_histogram_columns(result, hist_filter)
+        else:
+            result = self.fainder_index.search_range(
+                op.percentile,
+                (op.comparison, op.reference),
+                upper_bound,
+                self.ctx.fainder_mode,
+                self.ctx.fainder_index_name,
+                hist_filter,
+            )
+        result = sorted_unique_ids(result)
+        if hist_filter is None and self.leaf_cache:
+            self.leaf_cache.put(key, result)
+        return result
+
+    def _add_non_histogram_columns(
+        self, result: ColumnArray, hist_filter: ColumnArray | None
+    ) -> ColumnArray:
+        """Add the columns without histograms to the result of an inverted percentile predicate.
+
+        Histograms have the column IDs below `num_hists`, so the columns without histograms are
+        exactly the IDs from `num_hists` to the number of columns.
+        """
+        num_hists = self.metadata.num_hists
+        if hist_filter is None:
+            non_histogram_columns = np.arange(
+                num_hists, len(self.metadata.col_to_doc), dtype=np.uint32
+            )
+        else:
+            non_histogram_columns = hist_filter[hist_filter >= num_hists]
+        # Both parts are disjoint, so they need not be deduplicated
+        return np.concatenate((result, non_histogram_columns)).astype(np.uint32)
+
+
+def _sorted_keyword_result(result: KeywordResult) -> KeywordResult:
+    """Sort the documents of a keyword search by ID instead of by score."""
+    if is_sorted_unique(result.doc_ids):
+        return result
+    order = np.argsort(result.doc_ids, kind="stable")
+    return KeywordResult(result.doc_ids[order], result.scores[order], result.highlights)
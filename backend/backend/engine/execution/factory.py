@@ -1,14 +1,20 @@
 import os
+from typing import TYPE_CHECKING, Any
 
-from backend.config import ExecutorType, FainderMode, Metadata
+from backend.config import ExecutorType, Metadata
+from backend.engine.cache import LeafCache
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
+from .auto_executor import AutoExecutor
 from .executor import Executor
 from .prefiltering_executor import PrefilteringExecutor
 from .simple_executor import SimpleExecutor
 from .threaded_executor import ThreadedExecutor
 from .threaded_prefiltering_executor import ThreadedPrefilteringExecutor
 
+if TYPE_CHECKING:
+    from backend.engine.statistics import StatisticsCatalog
+
 
 def create_executor(
     executor_type: ExecutorType,
@@ -16,13 +22,17 @@ def create_executor(
     fainder_index: FainderIndex,
     hnsw_index: HnswIndex,
     metadata: Metadata,
-    fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-    enable_highlighting: bool = False,
     min_usability_score: float = 0.0,
     rank_by_usability: bool = True,
     max_workers: int = os.cpu_count() or 1,
-) -> Executor:
-    """Factory function to create the appropriate executor based on the executor type."""
+    leaf_cache: LeafCache | None = None,
+    index_generation: int = 0,
+    statistics: "StatisticsCatalog | None" = None,
+) -> Executor[Any]:
+    """Factory function to create the appropriate executor based on the executor type.
+
+    The statistics are only used by the automatic executor selection.
+    """
     match executor_type:
         case ExecutorType.SIMPLE:
             return SimpleExecutor(
@@ -30,10 +40,10 @@ def create_executor(
                 fainder_index=fainder_index,
                 hnsw_index=hnsw_index,
                 metadata=metadata,
-                fainder_mode=fainder_mode,
-                enable_highlighting=enable_highlighting,
                 min_usability_score=min_usability_score,
                 rank_by_usability=rank_by_usability,
+                leaf_cache=leaf_cache,
+                index_generation=index_generation,
             )
         case ExecutorType.PREFILTERING:
             return PrefilteringExecutor(
@@ -41,10 +51,10 @@ def create_executor(
                 fainder_index=fainder_index,
                 hnsw_index=hnsw_index,
                 metadata=metadata,
-                fainder_mode=fainder_mode,
-                enable_highlighting=enable_highlighting,
                 min_usability_score=min_usability_score,
                 rank_by_usability=rank_by_usability,
+                leaf_cache=leaf_cache,
+                index_generation=index_generation,
             )
         case ExecutorType.THREADED:
             return ThreadedExecutor(
@@ -52,10 +62,10 @@ def create_executor(
                 fainder_index=fainder_index,
                 hnsw_index=hnsw_index,
                 metadata=metadata,
-                fainder_mode=fainder_mode,
-                enable_highlighting=enable_highlighting,
                 min_usability_score=min_usability_score,
                 rank_by_usability=rank_by_usability,
+                leaf_cache=leaf_cache,
+                index_generation=index_generation,
                 max_workers=max_workers,
             )
         case ExecutorType.THREADED_PREFILTERING:
@@ -64,11 +74,24 @@ def create_executor(
                 fainder_index=fainder_index,
                 hnsw_index=hnsw_index,
                 metadata=metadata,
-                fainder_mode=fainder_mode,
-                enable_highlighting=enable_highlighting,
                 min_usability_score=min_usability_score,
                 rank_by_usability=rank_by_usability,
+                leaf_cache=leaf_cache,
+                index_generation=index_generation,
+                max_workers=max_workers,
+            )
+        case ExecutorType.AUTO:
+            return AutoExecutor(
+                tantivy_index=tantivy_index,
+                fainder_index=fainder_index,
+                hnsw_index=hnsw_index,
+                metadata=metadata,
+                min_usability_score=min_usability_score,
+                rank_by_usability=rank_by_usability,
+                leaf_cache=leaf_cache,
+                index_generation=index_generation,
                 max_workers=max_workers,
+                statistics=statistics,
             )
         case _:
             raise ValueError(f"Unknown executor type: {executor_type}")
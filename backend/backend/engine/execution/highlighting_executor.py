@@ -0,0 +1,83 @@
+from typing import Self
+
+import numpy as np
+from loguru import logger
+
+from backend.config import ColumnArray, DocumentArray, FainderMode, Highlights
+from backend.engine.conversion import doc_to_col_ids
+from backend.engine.plan import KeywordOp, NameOp, PercentileOp, QueryPlan
+
+from .common import ColResult, DocResult, contains_sorted, intersect_arrays
+from .context import ExecutionContext
+from .simple_executor import SimpleExecutor
+
+
+class HighlightingExecutor(SimpleExecutor):
+    """Computes the highlights of some result documents of a query plan, e.g., of a result page.
+
+    Every leaf predicate is only evaluated on the given documents and their columns: keyword
+    predicates are searched and highlighted among the documents only, and percentile predicates
+    use the columns of the documents as a histogram filter. Since all set operations of the
+    simple executor are element-wise, its junctions and negations yield the same highlights for
+    these documents as a highlighted execution of the whole plan, at a cost that depends on the
+    number of documents instead of the size of the result. Keyword scores are not computed.
+    """
+
+    # Only set on executors that are bound to a query, see `bind_documents`
+    doc_ids: DocumentArray
+    col_ids: ColumnArray
+
+    def highlight(
+        self,
+        plan: QueryPlan,
+        doc_ids: DocumentArray,
+        fainder_mode: FainderMode,
+        fainder_index_name: str = "default",
+    ) -> Highlights:
+        """Compute the highlights of documents of a plan, which must be sorted and unique."""
+        ctx = self.create_context(fainder_mode, True, fainder_index_name)
+        try:
+            bound: HighlightingExecutor = self.bind_documents(ctx, doc_ids)
+            _, (doc_highlights, col_highlights) = bound._evaluate(plan.root)
+        finally:
+            self.score_pool.release(ctx.scores)
+
+        page = set(doc_ids.tolist())
+        return (
+            {doc_id: fields for doc_id, fields in doc_highlights.items() if doc_id in page},
+            intersect_arrays(col_highlights, bound.col_ids),
+        )
+
+    def bind_documents(self, ctx: ExecutionContext, doc_ids: DocumentArray) -> Self:
+        """Return a copy of this executor that evaluates plans on the given documents only."""
+        bound = self.bind(ctx)
+        bound.doc_ids = doc_ids
+        bound.col_ids = doc_to_col_ids(doc_ids, self.metadata.doc_to_cols)
+        return bound
+
+    ##########################
+    # Operator implementations
+    ##########################
+
+    def keyword_op(self, op: KeywordOp) -> DocResult:
+        logger.trace("Highlighting keyword term: {}", op.query)
+
+        doc_ids, doc_highlights = self.tantivy_index.highlight(
+            op.query, self.doc_ids, self.min_usability_score
+        )
+        return doc_ids, (doc_highlights, np.array([], dtype=np.uint32))
+
+    def name_op(self, op: NameOp) -> ColResult:
+        logger.trace("Highlighting column term: {};{}", op.column, op.k)
+
+        col_ids = self._name_search(op.column, op.k)
+        return col_ids[contains_sorted(self.col_ids, col_ids)]
+
+    def percentile_op(self, op: PercentileOp) -> ColResult:
+        logger.trace(
+            "Highlighting percentile term: {};{};{}", op.percentile, op.comparison, op.reference
+        )
+
+        if self.col_ids.size == 0:
+            return self.col_ids
+        return self._percentile_search(op, hist_filter=self.col_ids)
@@ -1,32 +1,45 @@
-from collections import defaultdict
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
 
 import numpy as np
-from lark import ParseTree, Token, Transformer
 from loguru import logger
 from numpy.typing import NDArray
 
 from backend.config import (
     ColumnArray,
     ColumnHighlights,
+    CsrMapping,
     DocumentArray,
     DocumentHighlights,
     FainderMode,
     Metadata,
 )
+from backend.engine.cache import LeafCache
+from backend.engine.constants import FilteringStopPointsConfig
 from backend.engine.conversion import col_to_doc_ids, doc_to_col_ids
+from backend.engine.plan import (
+    ColumnOp,
+    Conjunction,
+    Disjunction,
+    KeywordOp,
+    NameOp,
+    Negation,
+    PercentileOp,
+    Query,
+    QueryPlan,
+)
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
 from .common import (
     ColResult,
     DocResult,
-    ResultGroupAnnotator,
     TResult,
     exceeds_filtering_limit,
     junction,
     negate_array,
     reduce_arrays,
 )
+from .context import ResultGroupContext, ScoreAccumulatorPool
 from .executor import Executor
 
 
@@ -39,11 +52,11 @@ class IntermediateResult:
 
     def __init__(
         self,
-        fainder_mode: FainderMode,
+        stop_points: FilteringStopPointsConfig,
         doc_ids: DocumentArray | None = None,
         col_ids: ColumnArray | None = None,
     ) -> None:
-        self.fainder_mode = fainder_mode
+        self.stop_points = stop_points
         if doc_ids is None and col_ids is None:
             raise ValueError("doc_ids and col_ids cannot both be None")
         if doc_ids is not None and col_ids is not None:
@@ -51,18 +64,16 @@ class IntermediateResult:
 
         self._doc_ids: DocumentArray | None = (
             None
-            if doc_ids is not None
-            and exceeds_filtering_limit(doc_ids, "num_doc_ids", fainder_mode)
+            if doc_ids is not None and exceeds_filtering_limit(doc_ids, "num_doc_ids", stop_points)
             else doc_ids
         )
         self._col_ids: ColumnArray | None = (
             None
-            if col_ids is not None
-            and exceeds_filtering_limit(col_ids, "num_col_ids", fainder_mode)
+            if col_ids is not None and exceeds_filtering_limit(col_ids, "num_col_ids", stop_points)
             else col_ids
         )
 
-    def add_col_ids(self, col_ids: ColumnArray, doc_to_cols: list[NDArray[np.uint32]]) -> None:
+    def add_col_ids(self, col_ids: ColumnArray, doc_to_cols: CsrMapping) -> None:
         if self._doc_ids is not None:
             helper_col_ids = doc_to_col_ids(self._doc_ids, doc_to_cols)
             col_ids = reduce_arrays([helper_col_ids, col_ids], "and")
@@ -83,11 +94,11 @@ class IntermediateResult:
     def build_hist_filter(self, metadata: Metadata) -> ColumnArray | None:
         """Build a histogram filter from the intermediate results."""
         if self._col_ids is not None:
-            if exceeds_filtering_limit(self._col_ids, "num_col_ids", self.fainder_mode):
+            if exceeds_filtering_limit(self._col_ids, "num_col_ids", self.stop_points):
                 return None
             return self._col_ids
         if self._doc_ids is not None:
-            if exceeds_filtering_limit(self._doc_ids, "num_doc_ids", self.fainder_mode):
+            if exceeds_filtering_limit(self._doc_ids, "num_doc_ids", self.stop_points):
                 return None
             return doc_to_col_ids(self._doc_ids, metadata.doc_to_cols)
         return None
@@ -104,14 +115,16 @@ class IntermediateResult:
 class IntermediateResultStore:
     """Store intermediate results for prefiltering per group."""
 
-    def __init__(self, fainder_mode: FainderMode, write_groups_used: dict[int, int]) -> None:
+    def __init__(
+        self, stop_points: FilteringStopPointsConfig, write_groups_used: Mapping[int, int]
+    ) -> None:
         self.results: dict[int, IntermediateResult] = {}
-        self.fainder_mode = fainder_mode
+        self.stop_points = stop_points
         self.write_groups_used = write_groups_used
         self.write_groups_actually_used: dict[int, int] = {}
 
     def add_col_id_results(
-        self, write_group: int, col_ids: ColumnArray, doc_to_cols: list[NDArray[np.uint32]]
+        self, write_group: int, col_ids: ColumnArray, doc_to_cols: CsrMapping
     ) -> None:
         logger.trace(
             "Adding column IDs to write group {} length of col_ids: {}", write_group, col_ids.size
@@ -123,7 +136,7 @@ class IntermediateResultStore:
             logger.trace("Write group {} is not used, skipping adding column IDs", write_group)
             return
 
-        if exceeds_filtering_limit(col_ids, "num_col_ids", self.fainder_mode):
+        if exceeds_filtering_limit(col_ids, "num_col_ids", self.stop_points):
             logger.trace("Column IDs exceed filtering limit, skipping adding column IDs")
             return
 
@@ -132,7 +145,7 @@ class IntermediateResultStore:
             self.results[write_group].add_col_ids(col_ids=col_ids, doc_to_cols=doc_to_cols)
         else:
             self.results[write_group] = IntermediateResult(
-                col_ids=col_ids, fainder_mode=self.fainder_mode
+                col_ids=col_ids, stop_points=self.stop_points
             )
 
     def add_doc_id_results(
@@ -150,7 +163,7 @@ class IntermediateResultStore:
             logger.trace("Write group {} is not used, skipping adding document IDs", write_group)
             return
 
-        if exceeds_filtering_limit(doc_ids, "num_doc_ids", self.fainder_mode):
+        if exceeds_filtering_limit(doc_ids, "num_doc_ids", self.stop_points):
             logger.trace("Document IDs exceed filtering limit, skipping adding document IDs")
             return
 
@@ -159,10 +172,12 @@ class IntermediateResultStore:
             self.results[write_group].add_doc_ids(doc_ids=doc_ids, col_to_doc=col_to_doc)
         else:
             self.results[write_group] = IntermediateResult(
-                doc_ids=doc_ids, fainder_mode=self.fainder_mode
+                doc_ids=doc_ids, stop_points=self.stop_points
             )
 
-    def build_hist_filter(self, read_groups: list[int], metadata: Metadata) -> ColumnArray | None:
+    def build_hist_filter(
+        self, read_groups: Sequence[int], metadata: Metadata
+    ) -> ColumnArray | None:
         """Build a histogram filter from the intermediate results."""
         hist_filters: list[ColumnArray] | None = None
         if len(read_groups) == 0:
@@ -205,19 +220,31 @@ class IntermediateResultStore:
         return reduce_arrays(hist_filters, "and")
 
 
-class PrefilteringExecutor(Transformer[Token, DocResult], Executor):
+@dataclass
+class PrefilteringContext(ResultGroupContext):
+    """Execution context of the prefiltering executor."""
+
+    intermediate_results: IntermediateResultStore = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.intermediate_results = IntermediateResultStore(self.filtering_stop_points(), {})
+
+
+class PrefilteringExecutor(Executor[PrefilteringContext]):
     """Uses prefiltering to reduce the number of documents before executing the query."""
 
+    uses_result_groups = True
+
     def __init__(
         self,
         tantivy_index: TantivyIndex,
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-        enable_highlighting: bool = False,
         min_usability_score: float = 0.0,
         rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
     ) -> None:
         self.tantivy_index = tantivy_index
         self.fainder_index = fainder_index
@@ -225,49 +252,26 @@ class PrefilteringExecutor(Transformer[Token, DocResult], Executor):
         self.metadata = metadata
         self.min_usability_score = min_usability_score
         self.rank_by_usability = rank_by_usability
+        self.leaf_cache = leaf_cache
+        self.index_generation = index_generation
+        self.score_pool = ScoreAccumulatorPool(len(metadata.doc_to_cols))
 
-        self.reset(fainder_mode, enable_highlighting)
-
-    def reset(
+    def create_context(
         self,
         fainder_mode: FainderMode,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> None:
-        logger.trace("Resetting executor")
-        self.fainder_index_name = fainder_index_name
-        self.scores: dict[int, float] = defaultdict(float)
-        self.fainder_mode = fainder_mode
-        self.enable_highlighting = enable_highlighting
-        self.intermediate_results = IntermediateResultStore(fainder_mode, {})
-        self.write_groups: dict[int, int] = {}
-        self.read_groups: dict[int, list[int]] = {}
-        self.parent_write_group: dict[int, int] = {}
-
-    def _get_write_group(self, node: ParseTree | Token) -> int:
-        """Get the write group for a node."""
-        node_id = id(node)
-        if node_id in self.write_groups:
-            return self.write_groups[node_id]
-        logger.warning("Node {} does not have a write group with id {}", node, node_id)
-        logger.warning("Write groups: {}", self.write_groups)
-        raise ValueError("Node does not have a write group")
-
-    def _get_read_groups(self, node: ParseTree | Token) -> list[int]:
-        """Get the read groups for a node."""
-        node_id = id(node)
-        if node_id in self.read_groups:
-            return self.read_groups[node_id]
-        logger.warning("Node {} does not have read groups", node)
-        logger.warning("Read groups: {}", self.read_groups)
-        raise ValueError("Node does not have read groups")
+    ) -> PrefilteringContext:
+        return PrefilteringContext(
+            self.score_pool.acquire(), fainder_mode, enable_highlighting, fainder_index_name
+        )
 
     def _get_parent_write_group(self, write_group: int) -> int:
         """Get the parent write group for a write group."""
-        if write_group in self.parent_write_group:
-            return self.parent_write_group[write_group]
+        if write_group in self.ctx.parent_write_group:
+            return self.ctx.parent_write_group[write_group]
         logger.warning("Write group {} does not have a parent write group", write_group)
-        logger.warning("Parent write groups: {}", self.parent_write_group)
+        logger.warning("Parent write groups: {}", self.ctx.parent_write_group)
         raise ValueError("Write group does not have a parent write group")
 
     def _clean_items(self, items: Sequence[tuple[TResult, int]]) -> tuple[Sequence[TResult], int]:
@@ -281,28 +285,23 @@ class PrefilteringExecutor(Transformer[Token, DocResult], Executor):
 
         return clean_times, write_group
 
-    def execute(self, tree: ParseTree) -> DocResult:
-        """Start processing the parse tree."""
-        self.write_groups = {}
-        self.read_groups = {}
-        logger.trace(tree.pretty())
-        groups = ResultGroupAnnotator()
-        groups.apply(tree, parallel=True)
-        self.write_groups = groups.write_groups
-        self.read_groups = groups.read_groups
-        self.parent_write_group = groups.parent_write_group
-        self.intermediate_results.write_groups_used = groups.write_groups_used
-        logger.trace("Write groups: {}", self.write_groups)
-        logger.trace("Read groups: {}", self.read_groups)
-        logger.trace("Parent write groups: {}", self.parent_write_group)
-        logger.trace("Write groups used: {}", self.intermediate_results.write_groups_used)
-
-        result = self.transform(tree)
-
-        self.write_groups_actually_used = self.intermediate_results.write_groups_actually_used
-        self.write_groups_used = self.intermediate_results.write_groups_used
-        logger.trace("Write groups actually used: {}", self.write_groups_actually_used)
-        logger.trace("Write groups used: {}", self.write_groups_used)
+    def execute(self, plan: QueryPlan, ctx: PrefilteringContext) -> DocResult:
+        """Evaluate a query plan in an execution context."""
+        ctx.parent_write_group = plan.parent_write_group
+        ctx.intermediate_results = IntermediateResultStore(
+            ctx.filtering_stop_points(), plan.write_groups_used
+        )
+        logger.trace("Parent write groups: {}", ctx.parent_write_group)
+        logger.trace("Write groups used: {}", ctx.intermediate_results.write_groups_used)
+
+        bound: PrefilteringExecutor = self.bind(ctx)
+        result: DocResult = bound._evaluate(plan.root)
+
+        logger.trace(
+            "Write groups actually used: {}",
+            ctx.intermediate_results.write_groups_actually_used,
+        )
+        logger.trace("Write groups used: {}", ctx.intermediate_results.write_groups_used)
 
         return result
 
@@ -310,16 +309,13 @@ class PrefilteringExecutor(Transformer[Token, DocResult], Executor):
     # Operator implementations
     ##########################
 
-    def keyword_op(self, items: list[Token]) -> tuple[DocResult, int]:
-        logger.trace("Evaluating keyword term: {}", items)
+    def keyword_op(self, op: KeywordOp) -> tuple[DocResult, int]:
+        logger.trace("Evaluating keyword term: {}", op.query)
 
-        result_docs, scores, highlights = self.tantivy_index.search(
-            items[0], self.enable_highlighting, self.min_usability_score, self.rank_by_usability
-        )
-        self.updates_scores(result_docs, scores)
+        result_docs, _, highlights = self._keyword_search(op.query, self._operator_stats(op))
 
-        write_group = self._get_write_group(items[0])
-        self.intermediate_results.add_doc_id_results(
+        write_group = op.write_group
+        self.ctx.intermediate_results.add_doc_id_results(
             write_group, result_docs, self.metadata.col_to_doc
         )
 
@@ -327,136 +323,141 @@ class PrefilteringExecutor(Transformer[Token, DocResult], Executor):
 
         return ((result_docs, (highlights, np.array([], dtype=np.uint32))), parent_write_group)
 
-    def col_op(self, items: list[tuple[ColResult, int]]) -> tuple[DocResult, int]:
+    def col_op(self, op: ColumnOp) -> tuple[DocResult, int]:
         logger.trace("Evaluating column term")
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Column term must have exactly one item")
-        col_ids = items[0][0]
-        write_group = items[0][1]
+        col_ids, write_group = self._evaluate(op.children[0])
         doc_ids = col_to_doc_ids(col_ids, self.metadata.col_to_doc)
-        logger.trace(f"Evaluating junction with items: {items}")
-        self.intermediate_results.add_doc_id_results(
+        self.ctx.intermediate_results.add_doc_id_results(
             write_group, doc_ids, self.metadata.col_to_doc
         )
         parent_write_group = self._get_parent_write_group(write_group)
-        if self.enable_highlighting:
+        if self.ctx.enable_highlighting:
             return (doc_ids, ({}, col_ids)), parent_write_group
 
         return (doc_ids, ({}, np.array([], dtype=np.uint32))), parent_write_group
 
-    def name_op(self, items: list[Token]) -> tuple[ColResult, int]:
-        logger.trace("Evaluating column term: {}", items)
-
-        column = items[0]
-        k = int(items[1])
+    def name_op(self, op: NameOp) -> tuple[ColResult, int]:
+        logger.trace("Evaluating column term: {};{}", op.column, op.k)
 
-        result = self.hnsw_index.search(column, k, None)
+        result = self._name_search(op.column, op.k, self._operator_stats(op))
 
-        write_group = self._get_write_group(items[0])
-        self.intermediate_results.add_col_id_results(
+        write_group = op.write_group
+        self.ctx.intermediate_results.add_col_id_results(
             write_group, result, self.metadata.doc_to_cols
         )
         parent_write_group = self._get_parent_write_group(write_group)
         return result, parent_write_group
 
-    def percentile_op(self, items: list[Token]) -> tuple[ColResult, int]:
-        logger.trace("Evaluating percentile term: {}", items)
+    def percentile_op(self, op: PercentileOp) -> tuple[ColResult, int]:
+        logger.trace(
+            "Evaluating percentile term: {};{};{}", op.percentile, op.comparison, op.reference
+        )
 
-        percentile = float(items[0])
-        comparison: str = items[1]
-        reference = float(items[2])
-        hist_filter = self.intermediate_results.build_hist_filter(
-            self._get_read_groups(items[0]), self.metadata
+        hist_filter = self.ctx.intermediate_results.build_hist_filter(
+            op.read_groups, self.metadata
         )
 
-        write_group = self._get_write_group(items[0])
+        write_group = op.write_group
+        stats = self._operator_stats(op)
         if hist_filter is not None and len(hist_filter) == 0:
             logger.trace("Empty histogram filter, returning empty result")
+            if stats is not None:
+                stats.hist_filter_size = 0
             return np.array([], dtype=np.uint32), write_group
 
         logger.trace(
             "Length of histogram filter: {}",
             len(hist_filter) if hist_filter is not None else "None",
         )
-        result = self.fainder_index.search(
-            percentile,
-            comparison,
-            reference,
-            self.fainder_mode,
-            self.fainder_index_name,
-            hist_filter,
-        )
-        self.intermediate_results.add_col_id_results(
+        result = self._percentile_search(op, hist_filter, stats)
+        self.ctx.intermediate_results.add_col_id_results(
             write_group, result, self.metadata.doc_to_cols
         )
         parent_write_group = self._get_parent_write_group(write_group)
         return result, parent_write_group
 
-    def conjunction(self, items: Sequence[tuple[TResult, int]]) -> tuple[TResult, int]:
-        logger.trace("Evaluating conjunction with items: {}", len(items))
+    def conjunction(self, op: Conjunction) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating conjunction with items: {}", len(op.children))
 
-        clean_items, write_group = self._clean_items(items)
-        result = junction(clean_items, "and", self.enable_highlighting, self.metadata.doc_to_cols)
+        children, cached = self._refined_children(op)
+        if cached is not None:
+            # The cached result of a refined query filters the histograms of the other operands
+            self.ctx.intermediate_results.add_doc_id_results(
+                op.write_group, cached[0], self.metadata.col_to_doc
+            )
+        clean_items, write_group = self._clean_items([self._evaluate(child) for child in children])
+        if cached is not None:
+            clean_items = [*clean_items, cached]
+        result = junction(
+            clean_items, "and", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
         if isinstance(result, tuple):
-            self.intermediate_results.add_doc_id_results(
+            self.ctx.intermediate_results.add_doc_id_results(
                 write_group, result[0], self.metadata.col_to_doc
             )
         else:
-            self.intermediate_results.add_col_id_results(
+            self.ctx.intermediate_results.add_col_id_results(
                 write_group, result, self.metadata.doc_to_cols
             )
 
         return result, self._get_parent_write_group(write_group)
 
-    def disjunction(self, items: Sequence[tuple[TResult, int]]) -> tuple[TResult, int]:
-        logger.trace("Evaluating disjunction with items: {}", len(items))
+    def disjunction(self, op: Disjunction) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating disjunction with items: {}", len(op.children))
 
-        clean_items, write_group = self._clean_items(items)
-        result = junction(clean_items, "or", self.enable_highlighting, self.metadata.doc_to_cols)
+        clean_items, write_group = self._clean_items(
+            [self._evaluate(child) for child in op.children]
+        )
+        result = junction(
+            clean_items, "or", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
 
         if isinstance(result, tuple):
-            self.intermediate_results.add_doc_id_results(
+            self.ctx.intermediate_results.add_doc_id_results(
                 write_group, result[0], self.metadata.col_to_doc
             )
         else:
-            self.intermediate_results.add_col_id_results(
+            self.ctx.intermediate_results.add_col_id_results(
                 write_group, result, self.metadata.doc_to_cols
             )
 
         return result, self._get_parent_write_group(write_group)
 
-    def negation(self, items: Sequence[tuple[TResult, int]]) -> tuple[TResult, int]:
-        logger.trace("Evaluating negation with {} items", len(items))
+    def negation(self, op: Negation) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating negation with {} items", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Negation term must have exactly one item")
 
-        clean_items, write_group = self._clean_items(items)
-        if isinstance(clean_items[0], tuple):
-            to_negate, _ = clean_items[0]
+        item, write_group = self._evaluate(op.children[0])
+        if isinstance(item, tuple):
+            to_negate, _ = item
             doc_result = negate_array(to_negate, len(self.metadata.doc_to_cols))
             # Result highlights are reset for negated results
             doc_highlights: DocumentHighlights = {}
             col_highlights: ColumnHighlights = np.array([], dtype=np.uint32)
-            self.intermediate_results.add_doc_id_results(
+            self.ctx.intermediate_results.add_doc_id_results(
                 write_group, doc_result, self.metadata.col_to_doc
             )
 
             result = (doc_result, (doc_highlights, col_highlights))
             return result, self._get_parent_write_group(write_group)
 
-        to_negate_cols: ColResult = clean_items[0]
+        to_negate_cols: ColResult = item
         negated_cols = negate_array(to_negate_cols, len(self.metadata.col_to_doc))
-        self.intermediate_results.add_col_id_results(
+        self.ctx.intermediate_results.add_col_id_results(
             write_group, negated_cols, self.metadata.doc_to_cols
         )
 
         return negated_cols, self._get_parent_write_group(write_group)
 
-    def query(self, items: list[tuple[DocResult, int]]) -> DocResult:
-        logger.trace("Evaluating query with {} items", len(items))
+    def query(self, op: Query) -> DocResult:
+        logger.trace("Evaluating query with {} items", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Query must have exactly one item")
-        return items[0][0]
+        result: DocResult = self._evaluate(op.children[0])[0]
+        return result
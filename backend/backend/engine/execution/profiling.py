@@ -0,0 +1,100 @@
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, ParamSpec, TypeVar
+
+import numpy as np
+
+from backend.config import PlanNode
+from backend.engine.plan import Operator, QueryPlan
+
+from .context import OperatorStats, QueryProfile
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def result_cardinality(result: object) -> int | None:
+    """Return the number of IDs in the result of an operator.
+
+    Operator results are ID arrays that may be wrapped in tuples together with their highlights
+    or write groups, so the first element of each tuple is unwrapped until an array is found.
+    """
+    while isinstance(result, tuple):
+        result = result[0]  # pyright: ignore[reportUnknownVariableType]
+    return len(result) if isinstance(result, np.ndarray) else None
+
+
+def evaluate_profiled(
+    evaluate: Callable[[Operator], Any], operator: Operator, stats: OperatorStats
+) -> Any:  # noqa: ANN401
+    """Evaluate an operator and record its wall time and output cardinality.
+
+    Operators that return futures are not recorded here because the time until a future is
+    submitted says nothing about its cost. Their tasks are wrapped with `profiled_task` instead.
+    """
+    start = time.perf_counter()
+    result = evaluate(operator)
+    if not isinstance(result, Future):
+        _record(stats, start, result)
+    return result
+
+
+def profiled_task(task: Callable[P, R], stats: OperatorStats | None) -> Callable[P, R]:
+    """Wrap a task that runs in a thread pool to record its wall time and output cardinality.
+
+    The statistics are recorded inside the task before it returns, so that they are complete as
+    soon as its future is resolved. Failed tasks are not recorded.
+    """
+    if stats is None:
+        return task
+
+    @wraps(task)
+    def _task(*args: P.args, **kwargs: P.kwargs) -> R:
+        start = time.perf_counter()
+        result = task(*args, **kwargs)
+        _record(stats, start, result)
+        return result
+
+    return _task
+
+
+def _record(stats: OperatorStats, start: float, result: object) -> None:
+    stats.wall_time = time.perf_counter() - start
+    stats.output_cardinality = result_cardinality(result)
+
+
+def explain_plan(
+    plan: QueryPlan, profile: QueryProfile | None = None, result_groups: bool = False
+) -> PlanNode:
+    """Convert a query plan into plan nodes that are annotated with the statistics of a profile.
+
+    Args:
+        plan: The query plan to explain.
+        profile: Runtime statistics of an execution of the plan.
+        result_groups: Whether to include the result groups of the prefiltering executors.
+    """
+    return _explain_operator(plan.root, profile, result_groups)
+
+
+def _explain_operator(
+    operator: Operator, profile: QueryProfile | None, result_groups: bool
+) -> PlanNode:
+    children = [_explain_operator(child, profile, result_groups) for child in operator.children]
+    node = PlanNode(operator=operator.name, arguments=operator.arguments(), children=children)
+    if result_groups:
+        node.write_group = operator.write_group
+        node.read_groups = list(operator.read_groups)
+    if profile is None:
+        return node
+
+    stats = profile.stats(operator)
+    node.wall_time = stats.wall_time
+    node.output_cardinality = stats.output_cardinality
+    node.hist_filter_size = stats.hist_filter_size
+    node.cache_hit = stats.cache_hit
+    node.input_cardinalities = [
+        child.output_cardinality for child in children if child.output_cardinality is not None
+    ]
+    return node
@@ -1,23 +1,38 @@
-from collections import defaultdict
-from collections.abc import Sequence
-
 import numpy as np
-from lark import ParseTree, Token, Transformer
 from loguru import logger
 
 from backend.config import ColumnHighlights, DocumentHighlights, FainderMode, Metadata
-from backend.engine.conversion import col_to_doc_ids
+from backend.engine.cache import LeafCache
+from backend.engine.conversion import col_complement_to_doc_ids, col_to_doc_ids
+from backend.engine.plan import (
+    ColumnOp,
+    Conjunction,
+    Disjunction,
+    KeywordOp,
+    NameOp,
+    Negation,
+    PercentileOp,
+    Query,
+    QueryPlan,
+)
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
-from .common import ColResult, DocResult, TResult, junction, negate_array
+from .common import (
+    ColResult,
+    Complement,
+    DocResult,
+    LazyDocResult,
+    LazyIds,
+    complement_ids,
+    lazy_junction,
+    materialize_ids,
+)
+from .context import ExecutionContext, ScoreAccumulatorPool
 from .executor import Executor
 
 
-class SimpleExecutor(Transformer[Token, DocResult], Executor):
-    """This transformer evaluates a parse tree bottom-up and computes the query result."""
-
-    fainder_mode: FainderMode
-    scores: dict[int, float]
+class SimpleExecutor(Executor[ExecutionContext]):
+    """This executor evaluates a query plan bottom-up and computes the query result."""
 
     def __init__(
         self,
@@ -25,113 +40,120 @@ class SimpleExecutor(Transformer[Token, DocResult], Executor):
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-        enable_highlighting: bool = False,
         min_usability_score: float = 0.0,
         rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
     ) -> None:
-        super().__init__(visit_tokens=False)
         self.tantivy_index = tantivy_index
         self.fainder_index = fainder_index
         self.hnsw_index = hnsw_index
         self.metadata = metadata
         self.min_usability_score = min_usability_score
         self.rank_by_usability = rank_by_usability
+        self.leaf_cache = leaf_cache
+        self.index_generation = index_generation
+        self.score_pool = ScoreAccumulatorPool(len(metadata.doc_to_cols))
+        # Number of columns of each document to convert complements of columns into documents
+        self.cols_per_doc = np.bincount(metadata.col_to_doc, minlength=len(metadata.doc_to_cols))
 
-        self.reset(fainder_mode, enable_highlighting)
-
-    def reset(
+    def create_context(
         self,
         fainder_mode: FainderMode,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> None:
-        self.fainder_index_name = fainder_index_name
-        self.scores = defaultdict(float)
-        self.fainder_mode = fainder_mode
-        self.enable_highlighting = enable_highlighting
+    ) -> ExecutionContext:
+        return ExecutionContext(
+            self.score_pool.acquire(), fainder_mode, enable_highlighting, fainder_index_name
+        )
 
-    def execute(self, tree: ParseTree) -> DocResult:
-        """Start processing the parse tree."""
-        return self.transform(tree)
+    def execute(self, plan: QueryPlan, ctx: ExecutionContext) -> DocResult:
+        """Evaluate a query plan in an execution context."""
+        bound: SimpleExecutor = self.bind(ctx)
+        result: DocResult = bound._evaluate(plan.root)
+        return result
 
     ##########################
     # Operator implementations
     ##########################
 
-    def keyword_op(self, items: list[Token]) -> DocResult:
-        logger.trace("Evaluating keyword term: {}", items)
+    def keyword_op(self, op: KeywordOp) -> DocResult:
+        logger.trace("Evaluating keyword term: {}", op.query)
 
-        result_docs, scores, highlights = self.tantivy_index.search(
-            items[0], self.enable_highlighting, self.min_usability_score, self.rank_by_usability
+        result_docs, _, highlights = self._keyword_search(
+            op.query, self._operator_stats(op), op.occurrences
         )
-        self.updates_scores(result_docs, scores)
 
         return result_docs, (
             highlights,
             np.array([], dtype=np.uint32),
         )  # Return empty array for column highlights
 
-    def col_op(self, items: list[ColResult]) -> DocResult:
-        logger.trace("Evaluating column term with items of length: {}", len(items))
+    def col_op(self, op: ColumnOp) -> DocResult:
+        logger.trace("Evaluating column term with items of length: {}", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Column term must have exactly one item")
-        col_ids = items[0]
+        col_ids: LazyIds = self._evaluate(op.children[0])
+        if isinstance(col_ids, Complement) and not self.ctx.enable_highlighting:
+            doc_ids = col_complement_to_doc_ids(
+                col_ids.excluded, self.metadata.col_to_doc, self.cols_per_doc
+            )
+            return doc_ids, ({}, np.array([], dtype=np.uint32))
+
+        col_ids = materialize_ids(col_ids, len(self.metadata.col_to_doc))
         doc_ids = col_to_doc_ids(col_ids, self.metadata.col_to_doc)
-        if self.enable_highlighting:
+        if self.ctx.enable_highlighting:
             return doc_ids, ({}, col_ids)
 
         return doc_ids, ({}, np.array([], dtype=np.uint32))
 
-    def name_op(self, items: list[Token]) -> ColResult:
-        logger.trace("Evaluating column term: {}", items)
-
-        column = items[0]
-        k = int(items[1])
-
-        return self.hnsw_index.search(column, k, None)
+    def name_op(self, op: NameOp) -> ColResult:
+        logger.trace("Evaluating column term: {};{}", op.column, op.k)
 
-    def percentile_op(self, items: list[Token]) -> ColResult:
-        logger.trace("Evaluating percentile term: {}", items)
+        return self._name_search(op.column, op.k, self._operator_stats(op))
 
-        percentile = float(items[0])
-        comparison: str = items[1]
-        reference = float(items[2])
-
-        return self.fainder_index.search(
-            percentile, comparison, reference, self.fainder_mode, self.fainder_index_name
+    def percentile_op(self, op: PercentileOp) -> ColResult:
+        logger.trace(
+            "Evaluating percentile term: {};{};{}", op.percentile, op.comparison, op.reference
         )
 
-    def conjunction(self, items: Sequence[TResult]) -> TResult:
-        logger.trace("Evaluating conjunction with items of length: {}", len(items))
+        return self._percentile_search(op, stats=self._operator_stats(op))
+
+    def conjunction(self, op: Conjunction) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating conjunction with items of length: {}", len(op.children))
 
-        return junction(items, "and", self.enable_highlighting, self.metadata.doc_to_cols)
+        children, cached = self._refined_children(op)
+        items = [self._evaluate(child) for child in children]
+        if cached is not None:
+            items.append(cached)
+        return lazy_junction(items, "and", self.ctx.enable_highlighting, self.metadata.doc_to_cols)
 
-    def disjunction(self, items: Sequence[TResult]) -> TResult:
-        logger.trace("Evaluating disjunction with items of length: {}", len(items))
+    def disjunction(self, op: Disjunction) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating disjunction with items of length: {}", len(op.children))
 
-        return junction(items, "or", self.enable_highlighting, self.metadata.doc_to_cols)
+        items = [self._evaluate(child) for child in op.children]
+        return lazy_junction(items, "or", self.ctx.enable_highlighting, self.metadata.doc_to_cols)
 
-    def negation(self, items: Sequence[TResult]) -> TResult:
-        logger.trace("Evaluating negation with items of length: {}", len(items))
+    def negation(self, op: Negation) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating negation with items of length: {}", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Negation term must have exactly one item")
-        if isinstance(items[0], tuple):
-            to_negate, _ = items[0]
-            doc_result = negate_array(to_negate, len(self.metadata.doc_to_cols))
+        item: LazyDocResult | LazyIds = self._evaluate(op.children[0])
+        if isinstance(item, tuple):
+            to_negate, _ = item
             # Result highlights are reset for negated results
             doc_highlights: DocumentHighlights = {}
             col_highlights: ColumnHighlights = np.array([], dtype=np.uint32)
-            return doc_result, (doc_highlights, col_highlights)
+            return complement_ids(to_negate), (doc_highlights, col_highlights)
 
-        to_negate_cols = items[0]
-        return negate_array(to_negate_cols, len(self.metadata.col_to_doc))
+        return complement_ids(item)
 
-    def query(self, items: Sequence[DocResult]) -> DocResult:
-        logger.trace("Evaluating query with {} items", len(items))
+    def query(self, op: Query) -> DocResult:
+        logger.trace("Evaluating query with {} items", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Query must have exactly one item")
-        return items[0]
+        doc_ids, highlights = self._evaluate(op.children[0])
+        return materialize_ids(doc_ids, len(self.metadata.doc_to_cols)), highlights
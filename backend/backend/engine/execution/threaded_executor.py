@@ -1,23 +1,47 @@
 import os
-from collections import defaultdict
+import weakref
 from collections.abc import Sequence
 from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
 
 import numpy as np
-from lark import ParseTree, Token, Transformer
 from loguru import logger
 
 from backend.config import ColumnHighlights, DocumentHighlights, FainderMode, Metadata
-from backend.engine.conversion import col_to_doc_ids
+from backend.engine.cache import LeafCache
+from backend.engine.conversion import col_complement_to_doc_ids, col_to_doc_ids
+from backend.engine.plan import (
+    ColumnOp,
+    Conjunction,
+    Disjunction,
+    KeywordOp,
+    NameOp,
+    Negation,
+    Operator,
+    PercentileOp,
+    Query,
+    QueryPlan,
+)
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
-from .common import ColResult, DocResult, TResult, junction, negate_array
+from .common import (
+    ColResult,
+    Complement,
+    DocResult,
+    LazyDocResult,
+    LazyIds,
+    TResult,
+    complement_ids,
+    lazy_junction,
+    materialize_ids,
+)
+from .context import ExecutionContext, ScoreAccumulatorPool
 from .executor import Executor
+from .profiling import profiled_task
 
 
-class ThreadedExecutor(Transformer[Token, DocResult], Executor):
-    """This transformer evaluates a query bottom-up and computes results in parallel threads."""
+class ThreadedExecutor(Executor[ExecutionContext]):
+    """This executor evaluates a query bottom-up and computes results in parallel threads."""
 
     def __init__(
         self,
@@ -25,11 +49,12 @@ class ThreadedExecutor(Transformer[Token, DocResult], Executor):
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-        enable_highlighting: bool = False,
         min_usability_score: float = 0.0,
         rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
         max_workers: int = os.cpu_count() or 1,
+        thread_pool: ThreadPoolExecutor | None = None,
     ) -> None:
         self.tantivy_index = tantivy_index
         self.fainder_index = fainder_index
@@ -37,35 +62,36 @@ class ThreadedExecutor(Transformer[Token, DocResult], Executor):
         self.metadata = metadata
         self.min_usability_score = min_usability_score
         self.rank_by_usability = rank_by_usability
+        self.leaf_cache = leaf_cache
+        self.index_generation = index_generation
+        self.score_pool = ScoreAccumulatorPool(len(metadata.doc_to_cols))
+        # Number of columns of each document to convert complements of columns into documents
+        self.cols_per_doc = np.bincount(metadata.col_to_doc, minlength=len(metadata.doc_to_cols))
         self.max_workers = max_workers
 
-        self.reset(fainder_mode, enable_highlighting)
-        self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
-
-    def __del__(self) -> None:
-        # Shutdown the thread pool if it is still running
-        # TODO: Migrate this to using the weakref module and a finalizer
-        if self._thread_pool:
-            self._thread_pool.shutdown(wait=True)
+        if thread_pool is not None:
+            # A shared thread pool is shut down by its owner
+            self._thread_pool = thread_pool
+        else:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            # Shut down the thread pool once the executor (but not one of its bound copies) is
+            # deleted
+            weakref.finalize(self, self._thread_pool.shutdown, wait=True)
 
-    def reset(
+    def create_context(
         self,
         fainder_mode: FainderMode,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> None:
-        self.scores = defaultdict(float)
-        self.fainder_mode = fainder_mode
-        self.enable_highlighting = enable_highlighting
-        self.fainder_index_name = fainder_index_name
-
-    def execute(self, tree: ParseTree) -> DocResult:
-        """Start processing the parse tree."""
-        # Create a new thread pool for this execution
+    ) -> ExecutionContext:
+        return ExecutionContext(
+            self.score_pool.acquire(), fainder_mode, enable_highlighting, fainder_index_name
+        )
 
-        self._thread_results: dict[int, Any] = {}
-
-        result = self.transform(tree)
+    def execute(self, plan: QueryPlan, ctx: ExecutionContext) -> DocResult:
+        """Evaluate a query plan in an execution context."""
+        bound: ThreadedExecutor = self.bind(ctx)
+        result: DocResult = bound._evaluate(plan.root)
 
         logger.debug("Result of query execution: ", result)
 
@@ -75,135 +101,132 @@ class ThreadedExecutor(Transformer[Token, DocResult], Executor):
         """Resolve item if it's a Future, otherwise return the item itself."""
         return item.result() if isinstance(item, Future) else item
 
-    def _resolve_items(self, items: Sequence[TResult | Future[TResult]]) -> list[TResult]:
-        """Resolve all items in the list if they are futures."""
+    def _evaluate_children(self, children: Sequence[Operator]) -> list[Any]:
+        """Evaluate the children of an operator and resolve their futures.
+
+        All children are started before the first future is resolved, so that the leaf
+        predicates of the operator run in parallel.
+        """
+        items = [self._evaluate(child) for child in children]
         return [self._resolve_item(item) for item in items]
 
     ##########################
     # Operator implementations
     ##########################
 
-    def keyword_op(self, items: list[Token]) -> Future[DocResult]:
-        def _keyword_task(token: Token) -> DocResult:
+    def keyword_op(self, op: KeywordOp) -> Future[DocResult]:
+        def _keyword_task(op: KeywordOp) -> DocResult:
             """Task function for keyword search to be run in a thread."""
-            logger.trace("Thread executing keyword search for: {}", token)
-            result_docs, scores, highlights = self.tantivy_index.search(
-                token, self.enable_highlighting, self.min_usability_score, self.rank_by_usability
+            logger.trace("Thread executing keyword search for: {}", op.query)
+            result_docs, _, highlights = self._keyword_search(
+                op.query, self._operator_stats(op), op.occurrences
             )
-            self.updates_scores(result_docs, scores)
             return result_docs, (highlights, np.array([], dtype=np.uint32))
 
-        logger.trace("Evaluating keyword term: {}", items)
-
-        # Submit task to thread pool and store the future with a unique ID
-        task_id = id(items[0])
-        future = self._thread_pool.submit(_keyword_task, items[0])
-        self._thread_results[task_id] = future
+        logger.trace("Evaluating keyword term: {}", op.query)
 
-        # Get result from future (immediate, non-blocking as result might not be ready yet)
-        return future
+        # Submit task to thread pool and return the future (non-blocking)
+        task = profiled_task(_keyword_task, self._operator_stats(op))
+        return self._thread_pool.submit(task, op)
 
-    def name_op(self, items: list[Token]) -> Future[ColResult]:
-        def _name_task(column: Token, k: int) -> ColResult:
+    def name_op(self, op: NameOp) -> Future[ColResult]:
+        def _name_task(op: NameOp) -> ColResult:
             """Task function for column name search to be run in a thread."""
-            logger.trace("Thread executing column name search for: {}", column)
-            return self.hnsw_index.search(column, k, None)
+            logger.trace("Thread executing column name search for: {}", op.column)
+            return self._name_search(op.column, op.k, self._operator_stats(op))
 
-        logger.trace("Evaluating column name term: {}", items)
+        logger.trace("Evaluating column name term: {};{}", op.column, op.k)
 
-        column = items[0]
-        k = int(items[1])
+        # Submit task to thread pool and return the future (non-blocking)
+        task = profiled_task(_name_task, self._operator_stats(op))
+        return self._thread_pool.submit(task, op)
 
-        # Submit task to thread pool and store the future with a unique ID
-        task_id = id(items[0])
-        future = self._thread_pool.submit(_name_task, column, k)
-        self._thread_results[task_id] = future
-
-        # Return future (non-blocking)
-        return future
-
-    def percentile_op(self, items: list[Token]) -> Future[ColResult]:
-        def _percentile_task(percentile: float, comparison: str, reference: float) -> ColResult:
+    def percentile_op(self, op: PercentileOp) -> Future[ColResult]:
+        def _percentile_task(op: PercentileOp) -> ColResult:
             """Task function for percentile search to be run in a thread."""
             logger.trace(
                 "Thread executing percentile search with {} {} {}",
-                percentile,
-                comparison,
-                reference,
-            )
-            return self.fainder_index.search(
-                percentile, comparison, reference, self.fainder_mode, self.fainder_index_name
+                op.percentile,
+                op.comparison,
+                op.reference,
             )
+            return self._percentile_search(op, stats=self._operator_stats(op))
 
-        logger.trace("Evaluating percentile term: {}", items)
+        logger.trace(
+            "Evaluating percentile term: {};{};{}", op.percentile, op.comparison, op.reference
+        )
 
-        percentile = float(items[0])
-        comparison: str = items[1]
-        reference = float(items[2])
+        # Submit task to thread pool and return the future (non-blocking)
+        task = profiled_task(_percentile_task, self._operator_stats(op))
+        return self._thread_pool.submit(task, op)
 
-        # Submit task to thread pool and store the future with a unique ID
-        task_id = id(items[0])
-        future = self._thread_pool.submit(_percentile_task, percentile, comparison, reference)
-        self._thread_results[task_id] = future
+    def col_op(self, op: ColumnOp) -> DocResult:
+        logger.trace("Evaluating column term with items of length: {}", len(op.children))
 
-        # Return future (non-blocking)
-        return future
-
-    def col_op(self, items: Sequence[ColResult | Future[ColResult]]) -> DocResult:
-        logger.trace("Evaluating column term with items of length: {}", len(items))
-
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Column term must have exactly one item")
 
         # Get actual result if it's a future
-        col_ids = self._resolve_item(items[0])
+        col_ids: LazyIds = self._evaluate_children(op.children)[0]
+        if isinstance(col_ids, Complement) and not self.ctx.enable_highlighting:
+            doc_ids = col_complement_to_doc_ids(
+                col_ids.excluded, self.metadata.col_to_doc, self.cols_per_doc
+            )
+            return doc_ids, ({}, np.array([], dtype=np.uint32))
 
+        col_ids = materialize_ids(col_ids, len(self.metadata.col_to_doc))
         doc_ids = col_to_doc_ids(col_ids, self.metadata.col_to_doc)
-        if self.enable_highlighting:
+        if self.ctx.enable_highlighting:
             return doc_ids, ({}, col_ids)
 
         return doc_ids, ({}, np.array([], dtype=np.uint32))
 
-    def conjunction(self, items: Sequence[TResult | Future[TResult]]) -> TResult:
-        logger.trace("Evaluating conjunction with items of length: {}", len(items))
+    def conjunction(self, op: Conjunction) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating conjunction with items of length: {}", len(op.children))
 
         # Resolve all futures in items
-        resolved_items = self._resolve_items(items)
+        children, cached = self._refined_children(op)
+        resolved_items = self._evaluate_children(children)
+        if cached is not None:
+            resolved_items.append(cached)
 
-        return junction(resolved_items, "and", self.enable_highlighting, self.metadata.doc_to_cols)
+        return lazy_junction(
+            resolved_items, "and", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
 
-    def disjunction(self, items: Sequence[TResult | Future[TResult]]) -> TResult:
-        logger.trace("Evaluating disjunction with items of length: {}", len(items))
+    def disjunction(self, op: Disjunction) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating disjunction with items of length: {}", len(op.children))
 
         # Resolve all futures in items
-        resolved_items = self._resolve_items(items)
+        resolved_items = self._evaluate_children(op.children)
 
-        return junction(resolved_items, "or", self.enable_highlighting, self.metadata.doc_to_cols)
+        return lazy_junction(
+            resolved_items, "or", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
 
-    def negation(self, items: Sequence[TResult | Future[TResult]]) -> TResult:
-        logger.trace("Evaluating negation with items of length: {}", len(items))
+    def negation(self, op: Negation) -> LazyDocResult | LazyIds:
+        logger.trace("Evaluating negation with items of length: {}", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Negation term must have exactly one item")
         # Resolve the item if it's a future
-        item = self._resolve_item(items[0])
+        item: LazyDocResult | LazyIds = self._evaluate_children(op.children)[0]
 
         if isinstance(item, tuple):
             to_negate, _ = item
-            doc_result = negate_array(to_negate, len(self.metadata.doc_to_cols))
             # Result highlights are reset for negated results
             doc_highlights: DocumentHighlights = {}
             col_highlights: ColumnHighlights = np.array([], dtype=np.uint32)
-            return doc_result, (doc_highlights, col_highlights)
+            return complement_ids(to_negate), (doc_highlights, col_highlights)
 
-        to_negate_cols = item
-        return negate_array(to_negate_cols, len(self.metadata.col_to_doc))
+        return complement_ids(item)
 
-    def query(self, items: Sequence[DocResult | Future[DocResult]]) -> DocResult:
-        logger.trace("Evaluating query with {} items", len(items))
+    def query(self, op: Query) -> DocResult:
+        logger.trace("Evaluating query with {} items", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Query must have exactly one item")
 
         # Resolve the item if it's a future
-        return self._resolve_item(items[0])
+        doc_ids, highlights = self._evaluate_children(op.children)[0]
+        return materialize_ids(doc_ids, len(self.metadata.doc_to_cols)), highlights
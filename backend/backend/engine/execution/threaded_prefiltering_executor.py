@@ -1,35 +1,52 @@
 import os
-from collections import defaultdict
-from collections.abc import Sequence
+import weakref
+from collections.abc import Mapping, Sequence
 from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
 
 import numpy as np
-from lark import ParseTree, Token, Transformer
 from loguru import logger
 from numpy.typing import NDArray
 
 from backend.config import (
     ColumnArray,
     ColumnHighlights,
+    CsrMapping,
     DocumentArray,
     DocumentHighlights,
     FainderMode,
     Metadata,
 )
-from backend.engine.conversion import col_to_doc_ids, col_to_hist_ids, doc_to_col_ids
+from backend.engine.cache import LeafCache
+from backend.engine.constants import FilteringStopPointsConfig
+from backend.engine.conversion import col_to_doc_ids, doc_to_col_ids
+from backend.engine.plan import (
+    ColumnOp,
+    Conjunction,
+    Disjunction,
+    KeywordOp,
+    NameOp,
+    Negation,
+    Operator,
+    PercentileOp,
+    Query,
+    QueryPlan,
+)
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
 from .common import (
     ColResult,
     DocResult,
-    ResultGroupAnnotator,
     TResult,
     exceeds_filtering_limit,
     junction,
     negate_array,
     reduce_arrays,
 )
+from .context import ResultGroupContext, ScoreAccumulatorPool
 from .executor import Executor
+from .profiling import profiled_task
 
 
 class IntermediateResultFuture:
@@ -38,7 +55,7 @@ class IntermediateResultFuture:
     def __init__(
         self,
         write_group: int,
-        fainder_mode: FainderMode,
+        stop_points: FilteringStopPointsConfig,
         doc_ids: DocumentArray | None = None,
         col_ids: ColumnArray | None = None,
     ) -> None:
@@ -50,18 +67,16 @@ class IntermediateResultFuture:
         # Store resolved results only one of these should be set
         self._doc_ids: DocumentArray | None = (
             None
-            if doc_ids is not None
-            and exceeds_filtering_limit(doc_ids, "num_doc_ids", fainder_mode)
+            if doc_ids is not None and exceeds_filtering_limit(doc_ids, "num_doc_ids", stop_points)
             else doc_ids
         )
         self._col_ids: ColumnArray | None = (
             None
-            if col_ids is not None
-            and exceeds_filtering_limit(col_ids, "num_col_ids", fainder_mode)
+            if col_ids is not None and exceeds_filtering_limit(col_ids, "num_col_ids", stop_points)
             else col_ids
         )
 
-        self.fainder_mode = fainder_mode
+        self.stop_points = stop_points
 
     def add_doc_future(self, future: Future[tuple[DocResult, int]]) -> None:
         """Add a future that will resolve to document IDs."""
@@ -71,7 +86,7 @@ class IntermediateResultFuture:
         """Add a future that will resolve to column IDs."""
         self.col_result_futures.append(future)
 
-    def add_col_ids(self, col_ids: ColumnArray, doc_to_cols: list[NDArray[np.uint32]]) -> None:
+    def add_col_ids(self, col_ids: ColumnArray, doc_to_cols: CsrMapping) -> None:
         if self._doc_ids is not None:
             helper_col_ids = doc_to_col_ids(self._doc_ids, doc_to_cols)
             col_ids = reduce_arrays([helper_col_ids, col_ids], "and")
@@ -91,11 +106,11 @@ class IntermediateResultFuture:
 
     def _build_hist_filter_resolved(self, metadata: Metadata) -> ColResult | None:
         if self._doc_ids is not None:
-            if exceeds_filtering_limit(self._doc_ids, "num_doc_ids", self.fainder_mode):
+            if exceeds_filtering_limit(self._doc_ids, "num_doc_ids", self.stop_points):
                 return None
             return doc_to_col_ids(self._doc_ids, metadata.doc_to_cols)
         if self._col_ids is not None:
-            if exceeds_filtering_limit(self._col_ids, "num_col_ids", self.fainder_mode):
+            if exceeds_filtering_limit(self._col_ids, "num_col_ids", self.stop_points):
                 return None
             return self._col_ids
         return None
@@ -105,10 +120,10 @@ class IntermediateResultFuture:
         first = True
         for kw_future in self.kw_result_futures:
             doc_ids, _ = kw_future.result()
-            if exceeds_filtering_limit(doc_ids[0], "num_doc_ids", self.fainder_mode):
+            if exceeds_filtering_limit(doc_ids[0], "num_doc_ids", self.stop_points):
                 continue
-            col_ids = doc_to_col_ids(doc_ids[0], metadata.doc_to_cols)
-            new_hist_ids = col_to_hist_ids(col_ids, metadata.num_hists)
+            # Column IDs without histograms are kept for inverted percentile predicates
+            new_hist_ids = doc_to_col_ids(doc_ids[0], metadata.doc_to_cols)
             if first:
                 hist_ids = [new_hist_ids]
                 first = False
@@ -117,21 +132,20 @@ class IntermediateResultFuture:
 
         for col_future in self.col_result_futures:
             col_ids, _ = col_future.result()
-            if exceeds_filtering_limit(col_ids, "num_col_ids", self.fainder_mode):
+            if exceeds_filtering_limit(col_ids, "num_col_ids", self.stop_points):
                 continue
-            new_hist_ids = col_to_hist_ids(col_ids, metadata.num_hists)
             if first:
-                hist_ids = [new_hist_ids]
+                hist_ids = [col_ids]
                 first = False
             else:
-                hist_ids.append(new_hist_ids)
+                hist_ids.append(col_ids)
 
         # not resolve the pp_result_futures
 
         if first:
             return None
         filter_result = reduce_arrays(hist_ids, "and")
-        if exceeds_filtering_limit(filter_result, "num_col_ids", self.fainder_mode):
+        if exceeds_filtering_limit(filter_result, "num_col_ids", self.stop_points):
             return None
         return filter_result
 
@@ -165,9 +179,11 @@ class IntermediateResultFuture:
 class IntermediateResultStoreFuture:
     """Stores futures and results for intermediate results during parallel execution."""
 
-    def __init__(self, fainder_mode: FainderMode, write_groups_used: dict[int, int]) -> None:
+    def __init__(
+        self, stop_points: FilteringStopPointsConfig, write_groups_used: Mapping[int, int]
+    ) -> None:
         self.results: dict[int, IntermediateResultFuture] = {}
-        self.fainder_mode = fainder_mode
+        self.stop_points = stop_points
         self.write_groups_used = write_groups_used
         self.write_groups_actually_used: dict[int, int] = {}
 
@@ -184,7 +200,7 @@ class IntermediateResultStoreFuture:
 
         if write_group not in self.results:
             self.results[write_group] = IntermediateResultFuture(
-                write_group, fainder_mode=self.fainder_mode
+                write_group, stop_points=self.stop_points
             )
         self.results[write_group].add_doc_future(future)
 
@@ -201,13 +217,11 @@ class IntermediateResultStoreFuture:
 
         if write_group not in self.results:
             self.results[write_group] = IntermediateResultFuture(
-                write_group, fainder_mode=self.fainder_mode
+                write_group, stop_points=self.stop_points
             )
         self.results[write_group].add_col_future(future)
 
-    def add_col_ids(
-        self, write_group: int, col_ids: ColumnArray, doc_to_cols: list[NDArray[np.uint32]]
-    ) -> None:
+    def add_col_ids(self, write_group: int, col_ids: ColumnArray, doc_to_cols: CsrMapping) -> None:
         """Add column IDs to the intermediate result."""
         if write_group not in self.write_groups_used:
             raise ValueError(f"Write group {write_group} is not used")
@@ -216,14 +230,14 @@ class IntermediateResultStoreFuture:
             logger.trace("Write group {} is not used, skipping adding column IDs", write_group)
             return
 
-        if exceeds_filtering_limit(col_ids, "num_col_ids", self.fainder_mode):
+        if exceeds_filtering_limit(col_ids, "num_col_ids", self.stop_points):
             logger.trace("Column IDs exceed filtering limit: {}", len(col_ids))
             return
 
         logger.trace("Write group {} is used, adding column IDs", write_group)
         if write_group not in self.results:
             self.results[write_group] = IntermediateResultFuture(
-                write_group, col_ids=col_ids, fainder_mode=self.fainder_mode
+                write_group, col_ids=col_ids, stop_points=self.stop_points
             )
         else:
             self.results[write_group].add_col_ids(col_ids, doc_to_cols)
@@ -240,20 +254,20 @@ class IntermediateResultStoreFuture:
             logger.trace("Write group {} is not used, skipping adding document IDs", write_group)
             return
 
-        if exceeds_filtering_limit(doc_ids, "num_doc_ids", self.fainder_mode):
+        if exceeds_filtering_limit(doc_ids, "num_doc_ids", self.stop_points):
             logger.trace("Document IDs exceed filtering limit: {}", len(doc_ids))
             return
 
         logger.trace("Write group {} is used, adding document IDs", write_group)
         if write_group not in self.results:
             self.results[write_group] = IntermediateResultFuture(
-                write_group, doc_ids=doc_ids, fainder_mode=self.fainder_mode
+                write_group, doc_ids=doc_ids, stop_points=self.stop_points
             )
         else:
             self.results[write_group].add_doc_ids(doc_ids, col_to_doc)
         logger.trace("Adding document IDs to write group {}: length {}", write_group, len(doc_ids))
 
-    def get_hist_filter(self, read_groups: list[int], metadata: Metadata) -> ColResult | None:
+    def get_hist_filter(self, read_groups: Sequence[int], metadata: Metadata) -> ColResult | None:
         """Build a histogram filter from the intermediate results."""
         hist_filter: ColResult | None = None
         if len(read_groups) == 0:
@@ -294,121 +308,115 @@ class IntermediateResultStoreFuture:
         return hist_filter
 
 
-class ThreadedPrefilteringExecutor(Transformer[Token, DocResult], Executor):
-    """This transformer evaluates a parse tree bottom-up and computes results in parallel threads.
+@dataclass
+class ThreadedPrefilteringContext(ResultGroupContext):
+    """Execution context of the threaded prefiltering executor."""
+
+    intermediate_results: IntermediateResultStoreFuture = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.intermediate_results = IntermediateResultStoreFuture(
+            stop_points=self.filtering_stop_points(), write_groups_used={}
+        )
+
+
+class ThreadedPrefilteringExecutor(Executor[ThreadedPrefilteringContext]):
+    """This executor evaluates a query plan bottom-up and computes results in parallel threads.
 
     It also uses prefiltering to reduce the number of documents before executing the query for
     percentile predicates.
     """
 
+    uses_result_groups = True
+
     def __init__(
         self,
         tantivy_index: TantivyIndex,
         fainder_index: FainderIndex,
         hnsw_index: HnswIndex,
         metadata: Metadata,
-        fainder_mode: FainderMode = FainderMode.LOW_MEMORY,
-        enable_highlighting: bool = False,
         min_usability_score: float = 0.0,
         rank_by_usability: bool = True,
+        leaf_cache: LeafCache | None = None,
+        index_generation: int = 0,
         max_workers: int = os.cpu_count() or 1,
+        thread_pool: ThreadPoolExecutor | None = None,
     ) -> None:
         self.tantivy_index = tantivy_index
         self.fainder_index = fainder_index
         self.hnsw_index = hnsw_index
         self.metadata = metadata
-        self.write_groups: dict[int, int] = {}
-        self.read_groups: dict[int, list[int]] = {}
-        self.parent_write_group: dict[int, int] = {}
         self.min_usability_score = min_usability_score
         self.rank_by_usability = rank_by_usability
+        self.leaf_cache = leaf_cache
+        self.index_generation = index_generation
+        self.score_pool = ScoreAccumulatorPool(len(metadata.doc_to_cols))
         self.max_workers = max_workers
-        # Create a new thread pool for this execution
-        self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
-
-        self.reset(fainder_mode, enable_highlighting)
 
-    def __del__(self) -> None:
-        """Clean up the thread pool when the executor is deleted."""
-        self._thread_pool.shutdown(wait=True)
-        logger.debug("Thread pool shut down")
+        if thread_pool is not None:
+            # A shared thread pool is shut down by its owner
+            self._thread_pool = thread_pool
+        else:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            # Shut down the thread pool once the executor (but not one of its bound copies) is
+            # deleted
+            weakref.finalize(self, self._thread_pool.shutdown, wait=True)
 
-    def reset(
+    def create_context(
         self,
         fainder_mode: FainderMode,
         enable_highlighting: bool = False,
         fainder_index_name: str = "default",
-    ) -> None:
-        self.fainder_index_name = fainder_index_name
-        self.scores = defaultdict(float)
-        self.fainder_mode = fainder_mode
-        self.enable_highlighting = enable_highlighting
-        self.intermediate_results = IntermediateResultStoreFuture(
-            fainder_mode=fainder_mode, write_groups_used={}
+    ) -> ThreadedPrefilteringContext:
+        return ThreadedPrefilteringContext(
+            self.score_pool.acquire(), fainder_mode, enable_highlighting, fainder_index_name
         )
 
-    def execute(self, tree: ParseTree) -> DocResult:
-        """Start processing the parse tree."""
-        self.write_groups = {}
-        self.read_groups = {}
-        logger.trace(tree.pretty())
-        groups = ResultGroupAnnotator()
-        groups.apply(tree, parallel=True)
-
-        self.write_groups = groups.write_groups
-        self.read_groups = groups.read_groups
-        self.parent_write_group = groups.parent_write_group
-        self.intermediate_results.write_groups_used = groups.write_groups_used
-        logger.trace("Write groups used: {}", groups.write_groups_used)
-        logger.trace("Write groups: {}", self.write_groups)
-        logger.trace("Read groups: {}", self.read_groups)
-        logger.trace("Parent write groups: {}", self.parent_write_group)
+    def execute(self, plan: QueryPlan, ctx: ThreadedPrefilteringContext) -> DocResult:
+        """Evaluate a query plan in an execution context."""
+        ctx.parent_write_group = plan.parent_write_group
+        stop_points = ctx.filtering_stop_points()
+        ctx.intermediate_results = IntermediateResultStoreFuture(
+            stop_points=stop_points, write_groups_used=plan.write_groups_used
+        )
+        logger.trace("Write groups used: {}", plan.write_groups_used)
+        logger.trace("Parent write groups: {}", ctx.parent_write_group)
         # create intermediate results for all write groups
-        for write_group in self.write_groups.values():
-            self.intermediate_results.results[write_group] = IntermediateResultFuture(
-                write_group, self.fainder_mode
+        for write_group in {op.write_group for op in plan.operators}:
+            ctx.intermediate_results.results[write_group] = IntermediateResultFuture(
+                write_group, stop_points
             )
 
-        result = self.transform(tree)
+        bound: ThreadedPrefilteringExecutor = self.bind(ctx)
+        result: DocResult = bound._evaluate(plan.root)
 
-        self.write_groups_actually_used = self.intermediate_results.write_groups_actually_used
-        self.write_groups_used = self.intermediate_results.write_groups_used
-        logger.trace("Write groups actually used: {}", self.write_groups_actually_used)
-        logger.trace("Write groups used: {}", self.write_groups_used)
+        logger.trace(
+            "Write groups actually used: {}",
+            ctx.intermediate_results.write_groups_actually_used,
+        )
+        logger.trace("Write groups used: {}", ctx.intermediate_results.write_groups_used)
 
         return result
 
-    def _get_write_group(self, node: ParseTree | Token) -> int:
-        """Get the write group for a node."""
-        node_id = id(node)
-        if node_id in self.write_groups:
-            return self.write_groups[node_id]
-        logger.warning("Node {} does not have a write group with id {}", node, node_id)
-        logger.warning("Write groups: {}", self.write_groups)
-        raise ValueError("Node does not have a write group")
-
-    def _get_read_groups(self, node: ParseTree | Token) -> list[int]:
-        """Get the read groups for a node."""
-        node_id = id(node)
-        if node_id in self.read_groups:
-            return self.read_groups[node_id]
-        logger.warning("Node {} does not have read groups", node)
-        logger.warning("Read groups: {}", self.read_groups)
-        raise ValueError("Node does not have read groups")
-
     def _get_parent_write_group(self, write_group: int) -> int:
         """Get the parent write group for a write group."""
-        if write_group in self.parent_write_group:
-            return self.parent_write_group[write_group]
+        if write_group in self.ctx.parent_write_group:
+            return self.ctx.parent_write_group[write_group]
         logger.warning("Write group {} does not have a parent write group", write_group)
-        logger.warning("Parent write groups: {}", self.parent_write_group)
+        logger.warning("Parent write groups: {}", self.ctx.parent_write_group)
         raise ValueError("Write group does not have a parent write group")
 
-    def _resolve_items(
-        self, items: Sequence[tuple[TResult, int] | Future[tuple[TResult, int]]]
-    ) -> tuple[Sequence[TResult], int]:
-        """Resolve items from futures."""
-        clean_item: list[TResult] = []
+    def _resolve_items(self, children: Sequence[Operator]) -> tuple[list[Any], int]:
+        """Evaluate the children of an operator and resolve their futures.
+
+        Percentile tasks block on the keyword and name futures of their read groups, so they are
+        submitted after their siblings. Otherwise, a percentile task could occupy a worker while
+        the futures it waits for are still queued behind it, which deadlocks a saturated pool.
+        """
+        order = sorted(range(len(children)), key=lambda i: isinstance(children[i], PercentileOp))
+        evaluated = {i: self._evaluate(children[i]) for i in order}
+        items = [evaluated[i] for i in range(len(children))]
+        clean_item: list[Any] = []
         write_group = 0
         for item in items:
             resolved_item = item.result() if isinstance(item, Future) else item
@@ -428,149 +436,146 @@ class ThreadedPrefilteringExecutor(Transformer[Token, DocResult], Executor):
     # Operator implementations
     ##########################
 
-    def keyword_op(self, items: list[Token]) -> Future[tuple[DocResult, int]]:
-        def _keyword_task(token: Token) -> tuple[DocResult, int]:
+    def keyword_op(self, op: KeywordOp) -> Future[tuple[DocResult, int]]:
+        def _keyword_task(op: KeywordOp) -> tuple[DocResult, int]:
             """Task function for keyword search to be run in a thread."""
-            logger.trace("Thread executing keyword search for: {}", token)
-            write_group = self._get_write_group(token)
-            result_docs, scores, highlights = self.tantivy_index.search(
-                token, self.enable_highlighting, self.min_usability_score, self.rank_by_usability
-            )
-            self.updates_scores(result_docs, scores)
-            parent_write_group = self._get_parent_write_group(write_group)
+            logger.trace("Thread executing keyword search for: {}", op.query)
+            result_docs, _, highlights = self._keyword_search(op.query, self._operator_stats(op))
+            parent_write_group = self._get_parent_write_group(op.write_group)
             return (result_docs, (highlights, np.array([], dtype=np.uint32))), parent_write_group
 
-        logger.trace("Evaluating keyword term: {}", items)
+        logger.trace("Evaluating keyword term: {}", op.query)
 
         # Submit task to thread pool and store the future with a unique ID
-        future = self._thread_pool.submit(_keyword_task, items[0])
+        task = profiled_task(_keyword_task, self._operator_stats(op))
+        future = self._thread_pool.submit(task, op)
 
-        write_group = self._get_write_group(items[0])
-        self.intermediate_results.add_future_kw_result(write_group, future)
+        self.ctx.intermediate_results.add_future_kw_result(op.write_group, future)
         return future
 
-    def name_op(self, items: list[Token]) -> Future[tuple[ColResult, int]]:
-        def _name_task(column: Token, k: int) -> tuple[ColResult, int]:
+    def name_op(self, op: NameOp) -> Future[tuple[ColResult, int]]:
+        def _name_task(op: NameOp) -> tuple[ColResult, int]:
             """Task function for column name search to be run in a thread."""
-            logger.trace("Thread executing column name search for: {}", column)
-            write_group = self._get_write_group(column)
-            parent_write_group = self._get_parent_write_group(write_group)
-            return self.hnsw_index.search(column, k, None), parent_write_group
-
-        logger.trace("Evaluating column name term: {}", items)
+            logger.trace("Thread executing column name search for: {}", op.column)
+            parent_write_group = self._get_parent_write_group(op.write_group)
+            result = self._name_search(op.column, op.k, self._operator_stats(op))
+            return result, parent_write_group
 
-        column = items[0]
-        k = int(items[1])
+        logger.trace("Evaluating column name term: {};{}", op.column, op.k)
 
         # Submit task to thread pool and store the future with a unique ID
-        future = self._thread_pool.submit(_name_task, column, k)
-        write_group = self._get_write_group(items[0])
-        self.intermediate_results.add_future_col_result(write_group, future)
+        task = profiled_task(_name_task, self._operator_stats(op))
+        future = self._thread_pool.submit(task, op)
+        self.ctx.intermediate_results.add_future_col_result(op.write_group, future)
         return future
 
-    def percentile_op(self, items: list[Token]) -> Future[tuple[ColResult, int]]:
-        def _percentile_task(items: list[Token]) -> tuple[ColResult, int]:
+    def percentile_op(self, op: PercentileOp) -> Future[tuple[ColResult, int]]:
+        def _percentile_task(op: PercentileOp) -> tuple[ColResult, int]:
             """Task function for percentile search to be run in a thread."""
-            percentile = float(items[0])
-            comparison: str = items[1]
-            reference = float(items[2])
             logger.trace(
                 "Thread executing percentile search with {} {} {}",
-                percentile,
-                comparison,
-                reference,
+                op.percentile,
+                op.comparison,
+                op.reference,
             )
-            hist_filter = self.intermediate_results.get_hist_filter(
-                self._get_read_groups(items[0]), self.metadata
+            hist_filter = self.ctx.intermediate_results.get_hist_filter(
+                op.read_groups, self.metadata
             )
             logger.trace(
                 "Length hist filter: {}", len(hist_filter) if hist_filter is not None else "None"
             )
-            write_group = self._get_write_group(items[0])
+            write_group = op.write_group
+            stats = self._operator_stats(op)
             if hist_filter is not None and len(hist_filter) == 0:
+                if stats is not None:
+                    stats.hist_filter_size = 0
                 return np.array([], dtype=np.uint32), write_group
-            result_hists = self.fainder_index.search(
-                percentile,
-                comparison,
-                reference,
-                self.fainder_mode,
-                self.fainder_index_name,
-                hist_filter,
-            )
+            result_hists = self._percentile_search(op, hist_filter, stats)
             parent_write_group = self._get_parent_write_group(write_group)
-            self.intermediate_results.add_col_ids(
+            self.ctx.intermediate_results.add_col_ids(
                 write_group, result_hists, self.metadata.doc_to_cols
             )
             return result_hists, parent_write_group
 
-        logger.trace("Evaluating percentile term: {}", items)
+        logger.trace(
+            "Evaluating percentile term: {};{};{}", op.percentile, op.comparison, op.reference
+        )
 
         # Submit task to thread pool and store the future with a unique ID
-        return self._thread_pool.submit(_percentile_task, items)
+        task = profiled_task(_percentile_task, self._operator_stats(op))
+        return self._thread_pool.submit(task, op)
 
-    def col_op(
-        self, items: list[tuple[ColResult, int] | Future[tuple[ColResult, int]]]
-    ) -> tuple[DocResult, int]:
+    def col_op(self, op: ColumnOp) -> tuple[DocResult, int]:
         logger.trace("Evaluating column term")
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Column term must have exactly one item")
-        if isinstance(items[0], Future):
-            col_ids, write_group = items[0].result()
-        else:
-            col_ids = items[0][0]
-            write_group = items[0][1]
+        col_ids, write_group = self._resolve_item(self._evaluate(op.children[0]))
 
         doc_ids = col_to_doc_ids(col_ids, self.metadata.col_to_doc)
-        self.intermediate_results.add_doc_ids(write_group, doc_ids, self.metadata.col_to_doc)
+        self.ctx.intermediate_results.add_doc_ids(write_group, doc_ids, self.metadata.col_to_doc)
         parent_write_group = self._get_parent_write_group(write_group)
-        if self.enable_highlighting:
+        if self.ctx.enable_highlighting:
             return (doc_ids, ({}, col_ids)), parent_write_group
 
         return ((doc_ids, ({}, np.array([], dtype=np.uint32))), parent_write_group)
 
-    def conjunction(
-        self, items: Sequence[tuple[TResult, int] | Future[tuple[TResult, int]]]
-    ) -> tuple[TResult, int]:
-        logger.trace("Evaluating conjunction with number of items: {}", len(items))
+    def conjunction(self, op: Conjunction) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating conjunction with number of items: {}", len(op.children))
 
-        clean_items, write_group = self._resolve_items(items)
-        result = junction(clean_items, "and", self.enable_highlighting, self.metadata.doc_to_cols)
+        children, cached = self._refined_children(op)
+        if cached is not None:
+            # The cached result of a refined query filters the histograms of the other operands
+            self.ctx.intermediate_results.add_doc_ids(
+                op.write_group, cached[0], self.metadata.col_to_doc
+            )
+        clean_items, write_group = self._resolve_items(children)
+        if cached is not None:
+            clean_items.append(cached)
+        result = junction(
+            clean_items, "and", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
 
         if isinstance(result, tuple):
-            self.intermediate_results.add_doc_ids(write_group, result[0], self.metadata.col_to_doc)
+            self.ctx.intermediate_results.add_doc_ids(
+                write_group, result[0], self.metadata.col_to_doc
+            )
         else:
-            self.intermediate_results.add_col_ids(write_group, result, self.metadata.doc_to_cols)
+            self.ctx.intermediate_results.add_col_ids(
+                write_group, result, self.metadata.doc_to_cols
+            )
 
         parent_write_group = self._get_parent_write_group(write_group)
 
         return result, parent_write_group
 
-    def disjunction(
-        self, items: Sequence[tuple[TResult, int] | Future[tuple[TResult, int]]]
-    ) -> tuple[TResult, int]:
-        logger.trace("Evaluating disjunction with number of items: {}", len(items))
+    def disjunction(self, op: Disjunction) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating disjunction with number of items: {}", len(op.children))
 
-        clean_items, write_group = self._resolve_items(items)
-        result = junction(clean_items, "or", self.enable_highlighting, self.metadata.doc_to_cols)
+        clean_items, write_group = self._resolve_items(op.children)
+        result = junction(
+            clean_items, "or", self.ctx.enable_highlighting, self.metadata.doc_to_cols
+        )
 
         if isinstance(result, tuple):
-            self.intermediate_results.add_doc_ids(write_group, result[0], self.metadata.col_to_doc)
+            self.ctx.intermediate_results.add_doc_ids(
+                write_group, result[0], self.metadata.col_to_doc
+            )
         else:
-            self.intermediate_results.add_col_ids(write_group, result, self.metadata.doc_to_cols)
+            self.ctx.intermediate_results.add_col_ids(
+                write_group, result, self.metadata.doc_to_cols
+            )
 
         parent_write_group = self._get_parent_write_group(write_group)
         return result, parent_write_group
 
-    def negation(
-        self, items: Sequence[tuple[TResult, int] | Future[tuple[TResult, int]]]
-    ) -> tuple[TResult, int]:
-        logger.trace("Evaluating negation with {} items", len(items))
+    def negation(self, op: Negation) -> tuple[DocResult | ColResult, int]:
+        logger.trace("Evaluating negation with {} items", len(op.children))
 
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Negation term must have exactly one item")
         # Resolve the item if it's a future
-        item, write_group = self._resolve_item(items[0])
+        item, write_group = self._resolve_item(self._evaluate(op.children[0]))
 
         if isinstance(item, tuple):
             to_negate, _ = item
@@ -579,7 +584,7 @@ class ThreadedPrefilteringExecutor(Transformer[Token, DocResult], Executor):
             col_highlights: ColumnHighlights = np.array([], dtype=np.uint32)
             doc_result = negate_array(to_negate, len(self.metadata.doc_to_cols))
             result = (doc_result, (doc_highlights, col_highlights))
-            self.intermediate_results.add_doc_ids(
+            self.ctx.intermediate_results.add_doc_ids(
                 write_group, doc_result, self.metadata.col_to_doc
             )
             return result, self._get_parent_write_group(write_group)
@@ -587,17 +592,17 @@ class ThreadedPrefilteringExecutor(Transformer[Token, DocResult], Executor):
         to_negate_cols: ColResult = item
 
         negated_cols = negate_array(to_negate_cols, len(self.metadata.col_to_doc))
-        self.intermediate_results.add_col_ids(write_group, negated_cols, self.metadata.doc_to_cols)
+        self.ctx.intermediate_results.add_col_ids(
+            write_group, negated_cols, self.metadata.doc_to_cols
+        )
 
         return negated_cols, self._get_parent_write_group(write_group)
 
-    def query(
-        self, items: list[tuple[DocResult, int] | Future[tuple[DocResult, int]]]
-    ) -> DocResult:
-        logger.trace(f"Evaluating query with {len(items)} items")
+    def query(self, op: Query) -> DocResult:
+        logger.trace("Evaluating query with {} items", len(op.children))
 
-        clean_item = items[0].result() if isinstance(items[0], Future) else items[0]
-
-        if len(items) != 1:
+        if len(op.children) != 1:
             raise ValueError("Query must have exactly one item")
-        return clean_item[0]
+        clean_item = self._resolve_item(self._evaluate(op.children[0]))
+        result: DocResult = clean_item[0]
+        return result
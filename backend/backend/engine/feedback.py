@@ -0,0 +1,268 @@
+import math
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NamedTuple
+
+from loguru import logger
+from pydantic import ValidationError
+
+from backend.config import CostModelInfo, FainderMode, OperatorCostInfo
+from backend.engine.constants import FILTERING_STOP_POINTS, FilteringStopPointsConfig
+
+from .execution.context import QueryProfile
+from .optimizer import LEAF_COSTS
+from .plan import KeywordOp, NameOp, PercentileOp, QueryPlan
+
+# Weight of a new observation in the moving averages
+EWMA_ALPHA = 0.1
+# Number of observations before learned costs replace the default costs
+MIN_OBSERVATIONS = 20
+# Number of recorded queries after which the learned costs are persisted
+SAVE_INTERVAL = 100
+
+
+class CostKey(NamedTuple):
+    """Key of the learned costs of a leaf operator."""
+
+    operator: str
+    fainder_mode: FainderMode | None
+    fainder_index_name: str | None
+
+
+@dataclass
+class OperatorCosts:
+    """Moving averages of the observed costs of a leaf operator.
+
+    Evaluations without a histogram filter update the latency and cardinality, while filtered
+    evaluations of percentile predicates update the latency per histogram in the filter.
+    """
+
+    observations: int = 0
+    latency: float = 0.0
+    cardinality: float = 0.0
+    filtered_observations: int = 0
+    latency_per_filtered_hist: float = 0.0
+
+    def observe(self, latency: float, cardinality: int, alpha: float) -> None:
+        self.observations += 1
+        # Early observations are weighted like in a plain average so that the first values do
+        # not dominate the average
+        weight = max(alpha, 1 / self.observations)
+        self.latency += weight * (latency - self.latency)
+        self.cardinality += weight * (cardinality - self.cardinality)
+
+    def observe_filtered(self, latency: float, hist_filter_size: int, alpha: float) -> None:
+        self.filtered_observations += 1
+        weight = max(alpha, 1 / self.filtered_observations)
+        self.latency_per_filtered_hist += weight * (
+            latency / hist_filter_size - self.latency_per_filtered_hist
+        )
+
+
+class RuntimeCostModel:
+    """Learns the costs of leaf operators from the runtime statistics of executed queries.
+
+    The costs of percentile predicates are learned per Fainder mode and index since they differ by
+    orders of magnitude between them. The learned costs are used in two places:
+    - The optimizer sorts predicates by their learned latency relative to the cheapest operator
+      instead of the fixed `LEAF_COSTS`
+    - The prefiltering executors stop filtering once a histogram filter is so large that a
+      filtered search is slower than a search over all histograms
+
+    Learned costs only take effect once each involved operator has been observed
+    `min_observations` times. Results from the leaf cache are not observed.
+
+    Args:
+        path: JSON file that the learned costs are loaded from and persisted to. None disables
+            persistence.
+        alpha: Weight of a new observation in the moving averages.
+        min_observations: Number of observations before a learned cost is used.
+        save_interval: Number of recorded queries after which the costs are persisted.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        alpha: float = EWMA_ALPHA,
+        min_observations: int = MIN_OBSERVATIONS,
+        save_interval: int = SAVE_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.alpha = alpha
+        self.min_observations = min_observations
+        self.save_interval = save_interval
+
+        self._costs: dict[CostKey, OperatorCosts] = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        # Serializes writers so that concurrent saves never interleave on disk
+        self._save_lock = threading.Lock()
+        if path is not None and path.exists():
+            self._load(path)
+
+    @staticmethod
+    def _key(operator: str, fainder_mode: FainderMode, fainder_index_name: str) -> CostKey:
+        if operator == "percentile_op":
+            return CostKey(operator, fainder_mode, fainder_index_name)
+        return CostKey(operator, None, None)
+
+    def record(
+        self,
+        plan: QueryPlan,
+        profile: QueryProfile,
+        fainder_mode: FainderMode,
+        fainder_index_name: str,
+    ) -> None:
+        """Update the learned costs with the runtime statistics of a profiled query."""
+        with self._lock:
+            for op in plan.operators:
+                if not isinstance(op, KeywordOp | NameOp | PercentileOp):
+                    continue
+                stats = profile.stats(op)
+                # Cache hits and operators whose statistics are incomplete say nothing about the
+                # cost of an operator
+                if stats.wall_time is None or stats.output_cardinality is None or stats.cache_hit:
+                    continue
+
+                key = self._key(op.name, fainder_mode, fainder_index_name)
+                costs = self._costs.setdefault(key, OperatorCosts())
+                if stats.hist_filter_size is None:
+                    costs.observe(stats.wall_time, stats.output_cardinality, self.alpha)
+                elif stats.hist_filter_size > 0:
+                    costs.observe_filtered(stats.wall_time, stats.hist_filter_size, self.alpha)
+
+            self._unsaved += 1
+            save = self.path is not None and self._unsaved >= self.save_interval
+            if save:
+                self._unsaved = 0
+
+        if save:
+            # Persisting the costs is a side effect of query execution and must never fail a query
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning("Failed to save the cost model to {}: {}", self.path, e)
+
+    def leaf_costs(
+        self, fainder_mode: FainderMode, fainder_index_name: str
+    ) -> dict[str, float] | None:
+        """Return the learned costs of the leaf operators in a Fainder mode and index.
+
+        Costs are relative to the cheapest operator and rounded to powers of two so that
+        optimized plans only change once the cost of an operator changes substantially. Returns
+        None if an operator has not been observed often enough.
+        """
+        latencies: dict[str, float] = {}
+        with self._lock:
+            for operator in LEAF_COSTS:
+                costs = self._costs.get(self._key(operator, fainder_mode, fainder_index_name))
+                if costs is None or costs.observations < self.min_observations:
+                    return None
+                latencies[operator] = costs.latency
+
+        cheapest = min(latencies.values())
+        if cheapest <= 0:
+            return None
+        return {
+            operator: 2.0 ** round(math.log2(latency / cheapest))
+            for operator, latency in latencies.items()
+        }
+
+    def stop_points(
+        self, fainder_mode: FainderMode, fainder_index_name: str
+    ) -> FilteringStopPointsConfig:
+        """Return the sizes at which the prefiltering executors stop filtering.
+
+        Histogram filters pay off as long as a filtered search is faster than a search over all
+        histograms, so the learned stop point for column and histogram IDs is the filter size at
+        which both take the same time.
+        """
+        defaults = FILTERING_STOP_POINTS[fainder_mode]
+        with self._lock:
+            stop_point = self._stop_point(
+                self._costs.get(self._key("percentile_op", fainder_mode, fainder_index_name))
+            )
+        if stop_point is None:
+            return defaults
+        return FilteringStopPointsConfig(
+            num_doc_ids=defaults["num_doc_ids"], num_col_ids=stop_point, num_hist_ids=stop_point
+        )
+
+    def _stop_point(self, costs: OperatorCosts | None) -> int | None:
+        if (
+            costs is None
+            or costs.observations < self.min_observations
+            or costs.filtered_observations < self.min_observations
+            or costs.latency_per_filtered_hist <= 0
+        ):
+            return None
+        return int(costs.latency / costs.latency_per_filtered_hist)
+
+    def info(self) -> CostModelInfo:
+        with self._lock:
+            return self._info()
+
+    def _info(self) -> CostModelInfo:
+        return CostModelInfo(
+            operators=[
+                OperatorCostInfo(
+                    operator=key.operator,
+                    fainder_mode=key.fainder_mode,
+                    fainder_index_name=key.fainder_index_name,
+                    observations=costs.observations,
+                    latency=costs.latency,
+                    cardinality=costs.cardinality,
+                    filtered_observations=costs.filtered_observations,
+                    latency_per_filtered_hist=costs.latency_per_filtered_hist,
+                    stop_point=self._stop_point(costs),
+                )
+                for key, costs in self._costs.items()
+            ]
+        )
+
+    def save(self, path: Path | None = None) -> None:
+        """Persist the learned costs to a JSON file, which defaults to the path of the model."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the cost model to")
+
+        with self._save_lock:
+            with self._lock:
+                info = self._info()
+                self._unsaved = 0
+            # Write to a unique temporary file first so that a crash never leaves a partial file
+            # behind and concurrent writers never share a file
+            tmp_path: Path | None = None
+            try:
+                with tempfile.NamedTemporaryFile(
+                    dir=path.parent, prefix=f".{path.name}.", delete=False
+                ) as tmp_file:
+                    tmp_path = Path(tmp_file.name)
+                    tmp_file.write(info.model_dump_json().encode())
+                tmp_path.replace(path)
+            except OSError:
+                if tmp_path is not None:
+                    tmp_path.unlink(missing_ok=True)
+                raise
+        logger.debug("Saved the costs of {} operators to {}", len(info.operators), path)
+
+    def _load(self, path: Path) -> None:
+        try:
+            info = CostModelInfo.model_validate_json(path.read_bytes())
+        except (OSError, ValidationError) as e:
+            logger.warning("Failed to load the cost model from {}: {}", path, e)
+            return
+
+        for operator in info.operators:
+            self._costs[
+                CostKey(operator.operator, operator.fainder_mode, operator.fainder_index_name)
+            ] = OperatorCosts(
+                observations=operator.observations,
+                latency=operator.latency,
+                cardinality=operator.cardinality,
+                filtered_observations=operator.filtered_observations,
+                latency_per_filtered_hist=operator.latency_per_filtered_hist,
+            )
+        logger.info("Loaded the costs of {} operators from {}", len(info.operators), path)
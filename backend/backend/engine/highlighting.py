@@ -0,0 +1,69 @@
+from collections.abc import Iterable
+
+from backend.config import DocumentHighlights, FieldHighlight, RenderedDocumentHighlights
+
+MARK_START = "<mark>"
+MARK_END = "</mark>"
+
+
+def union_spans(
+    left: tuple[tuple[int, int], ...], right: tuple[tuple[int, int], ...]
+) -> tuple[tuple[int, int], ...]:
+    """Unite two sets of sorted, disjoint spans into sorted, disjoint spans.
+
+    Overlapping and adjacent spans are coalesced into one span.
+    """
+    if not left:
+        return right
+    if not right:
+        return left
+
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(left + right):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+def merge_field_highlights(
+    left: dict[str, FieldHighlight], right: dict[str, FieldHighlight]
+) -> dict[str, FieldHighlight]:
+    """Merge the highlighted fields of a document, which does not depend on the operand order."""
+    merged = dict(left)
+    for field, highlight in right.items():
+        other = merged.get(field)
+        merged[field] = (
+            highlight
+            if other is None
+            else FieldHighlight(other.text, union_spans(other.spans, highlight.spans))
+        )
+    return merged
+
+
+def render_field(highlight: FieldHighlight) -> str:
+    """Render a highlighted field to HTML with a mark element around each span."""
+    text = highlight.text
+    parts: list[str] = []
+    position = 0
+    for start, end in highlight.spans:
+        parts.extend((text[position:start], MARK_START, text[start:end], MARK_END))
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def render_highlights(
+    doc_highlights: DocumentHighlights, doc_ids: Iterable[int] | None = None
+) -> RenderedDocumentHighlights:
+    """Render the highlights of the given documents, or of all documents, to HTML."""
+    if doc_ids is not None:
+        doc_highlights = {
+            doc_id: doc_highlights[doc_id] for doc_id in doc_ids if doc_id in doc_highlights
+        }
+    return {
+        doc_id: {field: render_field(highlight) for field, highlight in fields.items()}
+        for doc_id, fields in doc_highlights.items()
+    }
@@ -1,5 +1,7 @@
+import math
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, TypeGuard
 
 from lark import ParseTree, Token, Tree, Visitor
 from loguru import logger
@@ -9,12 +11,23 @@ from backend.config import ExecutorType
 if TYPE_CHECKING:
     from lark.tree import Branch
 
+    from .statistics import StatisticsCatalog
+
 """
-Costs for each operator in the query tree. Currently, we define operator costs as a hand-picked
-magic number. In the future, we may want to use a more sophisticated cost model.
+Base costs for each operator in the query tree. Without a statistics catalog, these are the
+operator costs. With a catalog, the cost of a leaf also grows with its estimated selectivity.
+Leaf costs that were learned from executed queries replace these defaults, see `RuntimeCostModel`.
 """
 LEAF_COSTS = {"keyword_op": 1, "percentile_op": 2, "name_op": 1}
 NODE_COSTS = {"col_op": 1, "negation": 0}
+COMMUTATIVE_OPS = {"conjunction", "disjunction"}
+DUAL_OPS = {"conjunction": "disjunction", "disjunction": "conjunction"}
+LOWER_BOUNDS = {"ge", "gt"}
+INVERTED_COMPARISONS = {"ge": "lt", "gt": "le", "le": "gt", "lt": "ge"}
+# Marker token of percentile predicates that replace a negated percentile predicate
+INVERTED_MARKER = "inverted"
+# Number of tokens of a percentile predicate that has not been fused into a range predicate
+PERCENTILE_OP_TOKENS = 3
 
 
 class OptimizationRule(ABC):
@@ -29,14 +42,41 @@ class Optimizer:
     """This class is a wrapper around individual optimization rules that operate on a ParseTree.
 
     Currently, we support the following optimization techniques:
+    - Push-down of negations
+    - Canonical ordering of commutative operators
+    - Elimination of duplicate operands of commutative operators
+    - Inversion of negated percentile predicates
+    - Fusion of percentile predicates on the same percentile
     - Cost-based sorting of sibling operators
     - Keyword merging
+
+    Cost-based sorting uses the estimates of a statistics catalog if one is given.
     """
 
-    def __init__(self, cost_sorting: bool = True, keyword_merging: bool = True) -> None:
+    def __init__(
+        self,
+        cost_sorting: bool = True,
+        keyword_merging: bool = True,
+        canonicalization: bool = True,
+        statistics: "StatisticsCatalog | None" = None,
+        predicate_fusion: bool = True,
+        subexpression_elimination: bool = True,
+        negation_pushdown: bool = True,
+        percentile_inversion: bool = True,
+    ) -> None:
         self.opt_rules: list[OptimizationRule] = [QuoteRemover()]
+        if negation_pushdown:
+            self.opt_rules.append(NegationPushDown())
+        if canonicalization:
+            self.opt_rules.append(Canonicalizer())
+        if subexpression_elimination:
+            self.opt_rules.append(DuplicateEliminator())
+        if percentile_inversion:
+            self.opt_rules.append(PercentileInversion())
+        if predicate_fusion:
+            self.opt_rules.append(PercentileFusion())
         if cost_sorting:
-            self.opt_rules.append(CostSorter())
+            self.opt_rules.append(CostSorter(statistics))
         if keyword_merging:
             if cost_sorting is False:
                 logger.warning(
@@ -44,21 +84,75 @@ class Optimizer:
                 )
             self.opt_rules.append(MergeKeywords())
 
-    def optimize(self, tree: ParseTree) -> ParseTree:
-        """Optimizes the given ParseTree in-place using a sequence of optimization techniques."""
+    def optimize(
+        self, tree: ParseTree, leaf_costs: Mapping[str, float] | None = None
+    ) -> ParseTree:
+        """Optimizes the given ParseTree in-place using a sequence of optimization techniques.
+
+        Args:
+            tree: The tree to optimize.
+            leaf_costs: Costs of the leaf operators that replace `LEAF_COSTS` for cost sorting.
+        """
         for rule in self.opt_rules:
-            rule.apply(tree)
+            if leaf_costs is not None and isinstance(rule, CostSorter):
+                rule.with_leaf_costs(leaf_costs).apply(tree)
+            else:
+                rule.apply(tree)
         return tree
 
 
 def create_optimizer(
-    executor_type: ExecutorType, cost_sorting: bool = True, keyword_merging: bool = True
+    executor_type: ExecutorType,
+    cost_sorting: bool = True,
+    keyword_merging: bool = True,
+    canonicalization: bool = True,
+    statistics: "StatisticsCatalog | None" = None,
 ) -> Optimizer:
     """Creates an optimizer based on the executor type."""
     if executor_type == ExecutorType.PREFILTERING:
-        return Optimizer(cost_sorting=True, keyword_merging=True)
+        return Optimizer(
+            cost_sorting=True,
+            keyword_merging=True,
+            canonicalization=canonicalization,
+            statistics=statistics,
+        )
     # TODO: Handle other executor types properly
-    return Optimizer(cost_sorting=cost_sorting, keyword_merging=keyword_merging)
+    return Optimizer(
+        cost_sorting=cost_sorting,
+        keyword_merging=keyword_merging,
+        canonicalization=canonicalization,
+        statistics=statistics,
+    )
+
+
+def canonical_form(tree: ParseTree | Token, memo: dict[int, str] | None = None) -> str:
+    """Serialize a (sub)tree into a canonical string.
+
+    Children of commutative operators are serialized in sorted order and numeric tokens are
+    normalized, so that logically identical plans that only differ in their surface form (operand
+    order, number formatting, quoting, keyword aliases) share the same canonical form.
+
+    Args:
+        tree: The (sub)tree to serialize.
+        memo: Optional dictionary that receives the canonical form of every subtree, keyed by the
+            ID of the subtree.
+    """
+    if isinstance(tree, Token):
+        match tree.type:
+            case "FLOAT" | "SIGNED_NUMBER":
+                return repr(float(tree))
+            case "INT":
+                return str(int(tree))
+            case _:
+                return repr(str(tree))
+
+    children = [canonical_form(child, memo) for child in tree.children]
+    if tree.data in COMMUTATIVE_OPS:
+        children.sort()
+    form = f"{tree.data}({','.join(children)})"
+    if memo is not None:
+        memo[id(tree)] = form
+    return form
 
 
 class QuoteRemover(Visitor[Token], OptimizationRule):
@@ -81,6 +175,230 @@ class QuoteRemover(Visitor[Token], OptimizationRule):
         self.visit(tree)
 
 
+class NegationPushDown(Visitor[Token], OptimizationRule):
+    """This visitor pushes negations down to the operators below junctions.
+
+    Double negations are removed and negated junctions are rewritten with De Morgan's laws, e.g.,
+    `X AND NOT (Y OR Z)` → `X AND NOT Y AND NOT Z`. Junctions that end up below a junction of the
+    same type are flattened into it, so that the executors can evaluate the conjunction as a set
+    difference of X and the negated operands. Negations are not pushed into column operators since
+    `NOT col(X)` differs from `col(NOT X)`.
+    """
+
+    def negation(self, tree: ParseTree) -> None:
+        while tree.data == "negation":
+            child = tree.children[0]
+            if not isinstance(child, Tree):
+                return
+            if child.data == "negation":
+                # NOT NOT X → X
+                grandchild = child.children[0]
+                if not isinstance(grandchild, Tree):
+                    return
+                tree.data = grandchild.data
+                tree.children = grandchild.children
+            elif child.data in DUAL_OPS:
+                # NOT (X AND Y) → NOT X OR NOT Y and NOT (X OR Y) → NOT X AND NOT Y
+                tree.data = DUAL_OPS[child.data]
+                tree.children = [Tree("negation", [operand]) for operand in child.children]
+            else:
+                return
+
+        if tree.data in COMMUTATIVE_OPS:
+            self._flatten(tree)
+
+    def conjunction(self, tree: ParseTree) -> None:
+        self._flatten(tree)
+
+    def disjunction(self, tree: ParseTree) -> None:
+        self._flatten(tree)
+
+    def _flatten(self, tree: ParseTree) -> None:
+        """Push down negated operands and merge operands of the same type into a junction."""
+        flattened = False
+        while not flattened:
+            flattened = True
+            children: list[Branch[Token]] = []
+            for child in tree.children:
+                if isinstance(child, Tree) and child.data == "negation":
+                    self.negation(child)
+                if isinstance(child, Tree) and child.data == tree.data:
+                    children.extend(child.children)
+                    flattened = False
+                else:
+                    children.append(child)
+            tree.children = children
+
+    def apply(self, tree: ParseTree) -> None:
+        # Junctions are flattened before their operands are visited
+        self.visit_topdown(tree)
+
+
+class Canonicalizer(Visitor[Token], OptimizationRule):
+    """This visitor sorts the children of commutative operators by their canonical form.
+
+    Running it before cost sorting and keyword merging makes the optimized plan independent of the
+    operand order in the query string. Since cost sorting is stable, siblings with equal costs
+    keep their canonical order.
+    """
+
+    def __default__(self, tree: ParseTree) -> ParseTree:  # noqa: PLW3201
+        if tree.data in COMMUTATIVE_OPS:
+            tree.children.sort(key=canonical_form)
+        return tree
+
+    def apply(self, tree: ParseTree) -> None:
+        self.visit(tree)
+
+
+class DuplicateEliminator(Visitor[Token], OptimizationRule):
+    """This visitor removes operands of commutative operators that occur more than once.
+
+    Operands are identified by their canonical form, so `X AND X` becomes `X` even if the two
+    operands only differ in their surface form. Identical subtrees under different parents are
+    kept since the query plan marks them as shared, see `Operator.occurrences`.
+
+    Operands with keyword predicates are kept as well, because each occurrence of a keyword
+    predicate adds its scores to the ranking. They are still evaluated only once as shared
+    subplans, which add their scores once per occurrence.
+    """
+
+    def __default__(self, tree: ParseTree) -> ParseTree:  # noqa: PLW3201
+        if tree.data not in COMMUTATIVE_OPS:
+            return tree
+
+        seen: set[str] = set()
+        children: list[Branch[Token]] = []
+        for child in tree.children:
+            form = canonical_form(child)
+            if form not in seen or _has_keyword_op(child):
+                seen.add(form)
+                children.append(child)
+        if len(children) == len(tree.children):
+            return tree
+
+        logger.trace("Removed {} duplicate operands", len(tree.children) - len(children))
+        if len(children) == 1 and isinstance(children[0], Tree):
+            # A junction of a single operand is replaced by the operand
+            tree.data = children[0].data
+            tree.children = children[0].children
+        else:
+            tree.children = children
+        return tree
+
+    def apply(self, tree: ParseTree) -> None:
+        self.visit(tree)
+
+
+def _has_keyword_op(tree: "Branch[Token]") -> bool:
+    return isinstance(tree, Tree) and any(
+        subtree.data == "keyword_op" for subtree in tree.iter_subtrees()
+    )
+
+
+class PercentileInversion(Visitor[Token], OptimizationRule):
+    """This visitor rewrites negated percentile predicates into the inverted comparison.
+
+    A column matches `NOT pp(0.5;ge;10)` if its histogram matches `pp(0.5;lt;10)` or if it has no
+    histogram. The rewritten predicate ends with an `inverted` marker token, for which the
+    executors add the columns without histograms to the result and search the Fainder index with
+    the opposite guarantee (see `FainderIndex.search`). Unlike a negation, the rewritten predicate
+    does not open a result group of its own, so the prefiltering executors can filter it.
+    Example: `NOT pp(0.5;ge;10)` → `pp(0.5;lt;10;inverted)`
+    """
+
+    def negation(self, tree: ParseTree) -> None:
+        child = tree.children[0]
+        if not _is_single_percentile_op(child):
+            return
+
+        percentile, comparison, reference = child.children
+        tree.data = "percentile_op"
+        tree.children = [
+            percentile,
+            Token("COMPARISON", INVERTED_COMPARISONS[str(comparison)]),
+            reference,
+            Token("INVERTED", INVERTED_MARKER),
+        ]
+
+    def apply(self, tree: ParseTree) -> None:
+        self.visit(tree)
+
+
+class PercentileFusion(Visitor[Token], OptimizationRule):
+    """This visitor fuses the percentile predicates of a conjunction that share a percentile.
+
+    Of all lower bounds (ge, gt) and all upper bounds (le, lt) on a percentile, only the most
+    restrictive one is kept since it subsumes the others. A remaining pair of lower and upper
+    bound is fused into a range predicate with the tokens of both comparisons, which the Fainder
+    index evaluates in a single search.
+    Example: `pp(0.5;gt;10) AND pp(0.5;gt;20) AND pp(0.5;le;30)` → `pp(0.5;gt;20;le;30)`
+    """
+
+    def conjunction(self, tree: ParseTree) -> None:
+        # Predicates are grouped by their percentile at the position of the first one
+        slots: list[Branch[Token] | float] = []
+        bounds: dict[float, dict[bool, ParseTree]] = {}
+        for child in tree.children:
+            if not _is_single_percentile_op(child):
+                slots.append(child)
+                continue
+
+            percentile = float(str(child.children[0]))
+            if percentile not in bounds:
+                slots.append(percentile)
+                bounds[percentile] = {}
+            is_lower = str(child.children[1]) in LOWER_BOUNDS
+            current = bounds[percentile].get(is_lower)
+            if current is None or _is_more_restrictive(child, current, is_lower):
+                bounds[percentile][is_lower] = child
+
+        if len(slots) == len(tree.children):
+            return
+
+        children: list[Branch[Token]] = []
+        for slot in slots:
+            if not isinstance(slot, float):
+                children.append(slot)
+                continue
+            lower = bounds[slot].get(True)
+            upper = bounds[slot].get(False)
+            if lower is not None and upper is not None:
+                lower.children.extend(upper.children[1:])
+                children.append(lower)
+            else:
+                children.extend(bound for bound in (lower, upper) if bound is not None)
+        logger.trace("Fused percentile predicates into: {}", children)
+
+        if len(children) == 1 and isinstance(children[0], Tree):
+            # A conjunction of a single predicate is replaced by the predicate
+            tree.data = children[0].data
+            tree.children = children[0].children
+        else:
+            tree.children = children
+
+    def apply(self, tree: ParseTree) -> None:
+        self.visit(tree)
+
+
+def _is_single_percentile_op(tree: "Branch[Token]") -> TypeGuard[ParseTree]:
+    return (
+        isinstance(tree, Tree)
+        and tree.data == "percentile_op"
+        and len(tree.children) == PERCENTILE_OP_TOKENS
+    )
+
+
+def _is_more_restrictive(tree: ParseTree, other: ParseTree, is_lower: bool) -> bool:
+    """Check if a lower (or upper) bound on a percentile subsumes another one."""
+    comparison, reference = str(tree.children[1]), float(str(tree.children[2]))
+    other_comparison, other_reference = str(other.children[1]), float(str(other.children[2]))
+    if reference != other_reference:
+        return reference > other_reference if is_lower else reference < other_reference
+    # For equal references, strict comparisons are more restrictive
+    return comparison in {"gt", "lt"} and other_comparison in {"ge", "le"}
+
+
 class ParentAnnotator(Visitor[Token], OptimizationRule):
     """This visitor annotates each node with its parent node's operator type."""
 
@@ -99,12 +417,36 @@ class ParentAnnotator(Visitor[Token], OptimizationRule):
 
 
 class CostSorter(Visitor[Token], OptimizationRule):
-    """This visitor annotates each node with a cost value and sorts children by cost."""
+    """This visitor annotates each node with a cost value and sorts children by cost.
+
+    With a statistics catalog, each node is also annotated with its estimated selectivity, i.e.,
+    the fraction of documents or columns in its result. The children of a conjunction are then
+    sorted by `cost / (1 - selectivity)` so that cheap predicates that remove many results come
+    first, which gives the prefiltering executors the smallest histogram filters.
+    """
+
+    def __init__(
+        self,
+        statistics: "StatisticsCatalog | None" = None,
+        leaf_costs: Mapping[str, float] = LEAF_COSTS,
+    ) -> None:
+        super().__init__()
+        self.statistics = statistics
+        self.leaf_costs = leaf_costs
+
+    def with_leaf_costs(self, leaf_costs: Mapping[str, float]) -> "CostSorter":
+        """Return a copy of this rule that uses other leaf costs, e.g., learned ones."""
+        return CostSorter(self.statistics, leaf_costs)
 
     def __default__(self, tree: ParseTree) -> ParseTree:  # noqa: PLW3201
-        if tree.data in LEAF_COSTS:
+        if tree.data in self.leaf_costs:
             # If the node is a leaf node, set its cost and return
-            tree.cost = LEAF_COSTS[tree.data]  # type: ignore[attr-defined]
+            cost: float = self.leaf_costs[tree.data]
+            if self.statistics is not None:
+                selectivity = self._leaf_selectivity(tree, self.statistics)
+                tree.selectivity = selectivity  # type: ignore[attr-defined]
+                cost *= 1 + selectivity
+            tree.cost = cost  # type: ignore[attr-defined]
             return tree
 
         # Compute the cost of the current node
@@ -115,7 +457,14 @@ class CostSorter(Visitor[Token], OptimizationRule):
 
         # Sort children by cost
         logger.trace("Before sorting: {}", tree.children)
-        tree.children.sort(key=lambda x: getattr(x, "cost", 0))
+        if self.statistics is not None:
+            tree.selectivity = self._node_selectivity(tree, self.statistics)  # type: ignore[attr-defined]
+            if tree.data == "conjunction":
+                tree.children.sort(key=_conjunction_rank)
+            else:
+                tree.children.sort(key=lambda x: getattr(x, "cost", 0))
+        else:
+            tree.children.sort(key=lambda x: getattr(x, "cost", 0))
         logger.trace("After sorting: {}", tree.children)
 
         # Store the cost on the tree node
@@ -123,10 +472,58 @@ class CostSorter(Visitor[Token], OptimizationRule):
 
         return tree
 
+    def _leaf_selectivity(self, tree: ParseTree, statistics: "StatisticsCatalog") -> float:
+        tokens = [str(child) for child in tree.children]
+        match tree.data:
+            case "keyword_op":
+                return statistics.keyword_selectivity(tokens[0])
+            case "name_op":
+                return statistics.name_selectivity(tokens[0], int(tokens[1]))
+            case "percentile_op" if tokens[-1] == INVERTED_MARKER:
+                return statistics.inverted_percentile_selectivity(
+                    float(tokens[0]), tokens[1], float(tokens[2])
+                )
+            case "percentile_op" if len(tokens) > PERCENTILE_OP_TOKENS:
+                return statistics.percentile_range_selectivity(
+                    float(tokens[0]), (tokens[1], float(tokens[2])), (tokens[3], float(tokens[4]))
+                )
+            case "percentile_op":
+                return statistics.percentile_selectivity(
+                    float(tokens[0]), tokens[1], float(tokens[2])
+                )
+            case _:
+                raise ValueError(f"Unknown leaf operator: {tree.data}")
+
+    def _node_selectivity(self, tree: ParseTree, statistics: "StatisticsCatalog") -> float:
+        selectivities = [
+            getattr(child, "selectivity", 0.5)
+            for child in tree.children
+            if isinstance(child, Tree)
+        ]
+        match tree.data:
+            case "conjunction":
+                # Predicates are assumed to be independent
+                return math.prod(selectivities)
+            case "disjunction":
+                return 1 - math.prod(1 - selectivity for selectivity in selectivities)
+            case "negation":
+                return 1 - selectivities[0]
+            case "col_op":
+                return statistics.doc_selectivity(selectivities[0])
+            case _:
+                return selectivities[0] if selectivities else 1.0
+
     def apply(self, tree: ParseTree) -> None:
         self.visit(tree)
 
 
+def _conjunction_rank(tree: "Branch[Token]") -> float:
+    """Rank a child of a conjunction by its cost per removed fraction of results."""
+    cost: float = getattr(tree, "cost", 0)
+    removed = 1 - getattr(tree, "selectivity", 0.5)
+    return cost / removed if removed > 0 else math.inf
+
+
 class MergeKeywords(Visitor[Token], OptimizationRule):
     """This transformer merges sibling keyword queries into a single query string."""
 
@@ -0,0 +1,276 @@
+from collections import Counter
+from collections.abc import Mapping
+from dataclasses import dataclass
+from enum import StrEnum
+from types import MappingProxyType
+from typing import ClassVar
+
+from lark import ParseTree, Token, Tree
+
+from backend.engine.execution.common import ResultGroupAnnotator
+from backend.engine.optimizer import INVERTED_MARKER, canonical_form
+
+# Rough memory footprint of a plan operator without its canonical form
+OPERATOR_NBYTES = 160
+
+
+class Comparison(StrEnum):
+    GE = "ge"
+    GT = "gt"
+    LE = "le"
+    LT = "lt"
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Operator:
+    """An immutable operator of a compiled query plan.
+
+    Attributes:
+        id: Position of the operator in `QueryPlan.operators`, in pre-order.
+        canonical: Canonical form of the subplan rooted at this operator.
+        occurrences: Number of operators in the plan with the same canonical form. Executors
+            evaluate subplans that occur more than once only once per query.
+        write_group: Result group that the prefiltering executors write the result to.
+        read_groups: Result groups that the prefiltering executors build histogram filters from.
+        parent_write_group: Result group that the result is propagated to.
+        children: Operators whose results this operator depends on.
+    """
+
+    name: ClassVar[str]
+
+    id: int
+    canonical: str
+    occurrences: int
+    write_group: int
+    read_groups: tuple[int, ...]
+    parent_write_group: int
+    children: tuple["Operator", ...]
+
+    @property
+    def shared(self) -> bool:
+        return self.occurrences > 1
+
+    def arguments(self) -> list[str]:
+        return []
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Query(Operator):
+    name: ClassVar[str] = "query"
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Conjunction(Operator):
+    """Intersection of the results of its children, which are columns if `columns` is set."""
+
+    name: ClassVar[str] = "conjunction"
+
+    columns: bool
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Disjunction(Operator):
+    """Union of the results of its children, which are columns if `columns` is set."""
+
+    name: ClassVar[str] = "disjunction"
+
+    columns: bool
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Negation(Operator):
+    """Complement of the result of its child, which is a column result if `columns` is set."""
+
+    name: ClassVar[str] = "negation"
+
+    columns: bool
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class ColumnOp(Operator):
+    """Converts the column result of its child into the documents that contain the columns."""
+
+    name: ClassVar[str] = "col_op"
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class KeywordOp(Operator):
+    name: ClassVar[str] = "keyword_op"
+
+    query: str
+
+    def arguments(self) -> list[str]:
+        return [self.query]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class NameOp(Operator):
+    name: ClassVar[str] = "name_op"
+
+    column: str
+    k: int
+
+    def arguments(self) -> list[str]:
+        return [self.column, str(self.k)]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class PercentileOp(Operator):
+    """Percentile predicate, which is a range predicate if the optimizer fused an upper bound.
+
+    Inverted predicates replace a negated predicate with the inverted comparison. They also match
+    all columns without a histogram and search the Fainder index with the opposite guarantee.
+    """
+
+    name: ClassVar[str] = "percentile_op"
+
+    percentile: float
+    comparison: Comparison
+    reference: float
+    upper_comparison: Comparison | None = None
+    upper_reference: float | None = None
+    inverted: bool = False
+
+    @property
+    def upper_bound(self) -> tuple[Comparison, float] | None:
+        if self.upper_comparison is None or self.upper_reference is None:
+            return None
+        return self.upper_comparison, self.upper_reference
+
+    def arguments(self) -> list[str]:
+        arguments = [str(self.percentile), str(self.comparison), str(self.reference)]
+        if self.upper_bound is not None:
+            arguments += [str(self.upper_comparison), str(self.upper_reference)]
+        if self.inverted:
+            arguments.append(INVERTED_MARKER)
+        return arguments
+
+
+LeafOperator = KeywordOp | NameOp | PercentileOp
+Junction = Conjunction | Disjunction
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class QueryPlan:
+    """A compiled query plan that is shared by all executions of a query.
+
+    Attributes:
+        root: Root operator of the plan.
+        operators: All operators of the plan, indexed by their ID.
+        parent_write_group: Parent of each result group.
+        write_groups_used: Number of percentile predicates that read each result group.
+        nbytes: Estimated memory footprint of the plan in bytes.
+    """
+
+    root: Query
+    operators: tuple[Operator, ...]
+    parent_write_group: Mapping[int, int]
+    write_groups_used: Mapping[int, int]
+    nbytes: int
+
+    @property
+    def canonical(self) -> str:
+        return self.root.canonical
+
+
+def compile_plan(tree: ParseTree) -> QueryPlan:
+    """Compile an optimized parse tree into an immutable query plan.
+
+    Token arguments are parsed once and the result groups of the prefiltering executors are
+    assigned to the operators, so that executors never inspect parse trees.
+    """
+    canonical_forms: dict[int, str] = {}
+    canonical_form(tree, canonical_forms)
+    groups = ResultGroupAnnotator()
+    groups.apply(tree, parallel=True)
+
+    # Structurally identical subtrees share a canonical form and thus a result
+    occurrences = Counter(canonical_forms.values())
+    compiler = _PlanCompiler(canonical_forms, occurrences, groups)
+    root = compiler.compile(tree, columns=False)
+    if not isinstance(root, Query):
+        raise TypeError(f"Plan must start with a query operator, not {root.name}")
+
+    operators = tuple(sorted(compiler.operators, key=lambda operator: operator.id))
+    return QueryPlan(
+        root=root,
+        operators=operators,
+        parent_write_group=MappingProxyType(dict(groups.parent_write_group)),
+        write_groups_used=MappingProxyType(dict(groups.write_groups_used)),
+        nbytes=sum(OPERATOR_NBYTES + len(operator.canonical) for operator in operators),
+    )
+
+
+class _PlanCompiler:
+    def __init__(
+        self,
+        canonical_forms: dict[int, str],
+        occurrences: Mapping[str, int],
+        groups: ResultGroupAnnotator,
+    ) -> None:
+        self.canonical_forms = canonical_forms
+        self.occurrences = occurrences
+        self.groups = groups
+        self.operators: list[Operator] = []
+        self._next_id = 0
+
+    def compile(self, tree: ParseTree, columns: bool) -> Operator:
+        # IDs are assigned in pre-order, i.e., before the children are compiled
+        node_id = self._next_id
+        self._next_id += 1
+
+        # Operators below a column operator evaluate to column IDs
+        child_columns = columns or tree.data == "col_op"
+        children = tuple(
+            self.compile(child, child_columns)
+            for child in tree.children
+            if isinstance(child, Tree)
+        )
+        tokens = [child for child in tree.children if isinstance(child, Token)]
+
+        write_group = self.groups.write_groups[id(tree)]
+        canonical = self.canonical_forms[id(tree)]
+        base = (
+            node_id,
+            canonical,
+            self.occurrences[canonical],
+            write_group,
+            tuple(self.groups.read_groups[id(tree)]),
+            self.groups.parent_write_group[write_group],
+            children,
+        )
+        operator: Operator
+        match tree.data:
+            case "query":
+                operator = Query(*base)
+            case "conjunction":
+                operator = Conjunction(*base, columns=columns)
+            case "disjunction":
+                operator = Disjunction(*base, columns=columns)
+            case "negation":
+                operator = Negation(*base, columns=columns)
+            case "col_op":
+                operator = ColumnOp(*base)
+            case "keyword_op":
+                operator = KeywordOp(*base, query=str(tokens[0]))
+            case "name_op":
+                operator = NameOp(*base, column=str(tokens[0]), k=int(tokens[1]))
+            case "percentile_op":
+                # Inverted predicates of the optimizer end with a marker and range predicates have
+                # a second comparison and reference
+                inverted = str(tokens[-1]) == INVERTED_MARKER
+                upper = tokens[3:5] if not inverted else []
+                operator = PercentileOp(
+                    *base,
+                    percentile=float(tokens[0]),
+                    comparison=Comparison(tokens[1]),
+                    reference=float(tokens[2]),
+                    upper_comparison=Comparison(upper[0]) if upper else None,
+                    upper_reference=float(upper[1]) if upper else None,
+                    inverted=inverted,
+                )
+            case _:
+                raise ValueError(f"Unknown operator: {tree.data}")
+
+        self.operators.append(operator)
+        return operator
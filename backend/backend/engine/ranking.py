@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+from numpy.typing import NDArray
+
+from backend.config import DocumentArray
+
+
+class Ranking:
+    """Lazily ranks documents by descending score.
+
+    Only the prefix of the ranking that has been requested so far is sorted. Requests for deeper
+    pages select the next best documents from the unranked remainder with `np.argpartition`
+    instead of sorting all documents upfront. The prefix grows geometrically so that paging
+    through a result costs amortized O(n) partitioning work.
+
+    Documents with equal scores keep their order in the input array, i.e., the ranking matches a
+    stable sort by descending score.
+
+    Args:
+        doc_ids: Document IDs of the result.
+        scores: Score of each document in `doc_ids`.
+    """
+
+    def __init__(self, doc_ids: DocumentArray, scores: NDArray[np.float32]) -> None:
+        if doc_ids.shape != scores.shape:
+            raise ValueError("Document IDs and scores must have the same shape")
+
+        self.doc_ids = doc_ids
+        self.scores = scores
+        # Positions in the input arrays, ranked prefix first and the unranked remainder after it
+        self._order: NDArray[np.intp] = np.arange(len(doc_ids), dtype=np.intp)
+        self._num_ranked = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.doc_ids.nbytes + self.scores.nbytes + self._order.nbytes
+
+    def top(self, k: int) -> DocumentArray:
+        """Return the IDs of the k documents with the highest scores in ranked order."""
+        return self.slice(0, k)
+
+    def page(self, page: int, per_page: int) -> DocumentArray:
+        """Return the IDs of the documents on a page, starting with page 1."""
+        start = (page - 1) * per_page
+        return self.slice(start, start + per_page)
+
+    def slice(self, start: int, stop: int) -> DocumentArray:
+        """Return the IDs of the documents at ranks [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return np.array([], dtype=np.uint32)
+
+        self._extend(stop)
+        return self.doc_ids[self._order[start:stop]]
+
+    def ranked_scores(self, start: int, stop: int) -> NDArray[np.float32]:
+        """Return the scores of the documents at ranks [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return np.array([], dtype=np.float32)
+
+        self._extend(stop)
+        return self.scores[self._order[start:stop]]
+
+    def _extend(self, k: int) -> None:
+        """Make sure that at least the first k documents are ranked."""
+        if k <= self._num_ranked:
+            return
+
+        with self._lock:
+            num_ranked = self._num_ranked
+            if k <= num_ranked:
+                return
+
+            rest = self._order[num_ranked:]
+            # Grow geometrically so that paging through all results stays linear
+            num_new = min(max(k - num_ranked, num_ranked), len(rest))
+            rest_scores = self.scores[rest]
+
+            if num_new < len(rest):
+                # Select the num_new best documents of the remainder. Ties at the boundary are
+                # resolved by input position to keep the ranking stable.
+                kth = np.argpartition(-rest_scores, num_new - 1)[num_new - 1]
+                threshold = rest_scores[kth]
+                better = rest_scores > threshold
+                ties = np.flatnonzero(rest_scores == threshold)
+                better[ties[: num_new - np.count_nonzero(better)]] = True
+                selected = rest[better]
+                remainder = rest[~better]
+            else:
+                selected = rest
+                remainder = rest[:0]
+
+            # lexsort uses the last key as primary key
+            selected = selected[np.lexsort((selected, -self.scores[selected]))]
+            order = self._order.copy()
+            order[num_ranked : num_ranked + num_new] = selected
+            order[num_ranked + num_new :] = remainder
+
+            # Publish the new order before the prefix length for concurrent readers
+            self._order = order
+            self._num_ranked = num_ranked + num_new
@@ -0,0 +1,240 @@
+import re
+import time
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+import tantivy
+from loguru import logger
+
+from backend.config import Metadata
+from backend.indices.keyword_op import DOC_FIELDS
+
+if TYPE_CHECKING:
+    from fainder.typing import Histogram
+    from numpy.typing import NDArray
+
+    from backend.indices import TantivyIndex
+
+# Percentiles at which the value distributions of the histograms are sampled
+PERCENTILE_GRID = np.linspace(0.0, 1.0, 21)
+# Number of histograms that are sampled for the value distributions
+HISTOGRAM_SAMPLE_SIZE = 10_000
+
+# Keyword query syntax that does not contribute terms to the cardinality estimate
+_NEGATED_TERMS = re.compile(r"-\([^)]*\)|-\S+")
+_QUERY_OPERATORS = re.compile(r"\b(?:AND|OR|NOT)\b|\w+:")
+_CONJUNCTIVE_QUERY = re.compile(r"\bAND\b")
+
+
+class StatisticsCatalog:
+    """Statistics about the indexed collection that the optimizer uses to estimate cardinalities.
+
+    The catalog is built when the indices are loaded and contains:
+    - Document frequencies of keyword terms, which are looked up in the Tantivy index on first use
+    - The fan-out of column names, i.e., the number of columns that share a name vector
+    - The distribution of the values at each percentile of `PERCENTILE_GRID`, sampled from the
+      histograms of the Fainder index
+
+    All estimates are fractions of the documents or columns of the collection. Without Tantivy
+    index or histograms, the corresponding estimates fall back to a selectivity of 0.5.
+
+    Args:
+        metadata: Metadata of the collection.
+        hists: Histograms of the Fainder index.
+        tantivy_index: Keyword index whose document frequencies are used.
+        sample_size: Maximum number of histograms that are sampled.
+        seed: Seed for sampling the histograms.
+    """
+
+    def __init__(
+        self,
+        metadata: Metadata,
+        hists: Sequence[tuple[int | np.integer[Any], "Histogram"]] | None = None,
+        tantivy_index: "TantivyIndex | None" = None,
+        sample_size: int = HISTOGRAM_SAMPLE_SIZE,
+        seed: int = 42,
+    ) -> None:
+        start = time.perf_counter()
+        self.num_docs = len(metadata.doc_to_cols)
+        self.num_cols = len(metadata.col_to_doc)
+        self.num_hists = metadata.num_hists
+        self.cols_per_doc = self.num_cols / self.num_docs if self.num_docs > 0 else 0.0
+
+        # Name statistics
+        self.name_to_vector = metadata.name_to_vector
+        self.name_fanout = {
+            vector_id: len(col_ids) for vector_id, col_ids in metadata.vector_to_cols.items()
+        }
+        self.mean_name_fanout = (
+            sum(self.name_fanout.values()) / len(self.name_fanout) if self.name_fanout else 0.0
+        )
+
+        # Keyword statistics
+        self._searcher = tantivy_index.index.searcher() if tantivy_index is not None else None
+        self._analyzer = (
+            tantivy.TextAnalyzerBuilder(tantivy.Tokenizer.simple())
+            .filter(tantivy.Filter.remove_long(40))
+            .filter(tantivy.Filter.lowercase())
+            .filter(tantivy.Filter.stemmer("english"))
+            .build()
+        )
+        self._doc_freqs: dict[str, int] = {}
+
+        # Percentile statistics
+        self.percentile_values = (
+            self._sample_percentile_values(hists, sample_size, seed) if hists else None
+        )
+
+        logger.debug(
+            "Built statistics catalog for {} documents and {} columns in {:.3f}s",
+            self.num_docs,
+            self.num_cols,
+            time.perf_counter() - start,
+        )
+
+    @staticmethod
+    def _sample_percentile_values(
+        hists: Sequence[tuple[int | np.integer[Any], "Histogram"]], sample_size: int, seed: int
+    ) -> "NDArray[np.float64]":
+        """Compute the sorted values of sampled histograms at each percentile of the grid."""
+        rng = np.random.default_rng(seed)
+        sample = (
+            rng.choice(len(hists), size=sample_size, replace=False)
+            if len(hists) > sample_size
+            else np.arange(len(hists))
+        )
+        values = np.empty((len(PERCENTILE_GRID), len(sample)), dtype=np.float64)
+        for i, hist_idx in enumerate(sample):
+            densities, bins = hists[hist_idx][1]
+            masses = np.asarray(densities, dtype=np.float64) * np.diff(bins)
+            total = masses.sum()
+            if total <= 0:
+                values[:, i] = bins[0]
+                continue
+            cdf = np.concatenate(([0.0], np.cumsum(masses) / total))
+            values[:, i] = np.interp(PERCENTILE_GRID, cdf, bins)
+        values.sort(axis=1)
+        return values
+
+    def doc_freq(self, term: str) -> int:
+        """Return the maximum document frequency of an analyzed term over all keyword fields."""
+        freq = self._doc_freqs.get(term)
+        if freq is None:
+            searcher = self._searcher
+            freq = (
+                max(searcher.doc_freq(field, term) for field in DOC_FIELDS)
+                if searcher is not None
+                else 0
+            )
+            self._doc_freqs[term] = freq
+        return freq
+
+    def keyword_selectivity(self, query: str) -> float:
+        """Estimate the fraction of documents that match a keyword query."""
+        if self._searcher is None or self.num_docs == 0:
+            return 0.5
+
+        text = _QUERY_OPERATORS.sub(" ", _NEGATED_TERMS.sub(" ", query))
+        freqs = [self.doc_freq(term) for term in self._analyzer.analyze(text)]
+        if not freqs:
+            # Queries that consist of negations only match most documents
+            return 1.0
+        if _CONJUNCTIVE_QUERY.search(query):
+            return min(freqs) / self.num_docs
+        return min(sum(freqs), self.num_docs) / self.num_docs
+
+    def name_selectivity(self, column: str, k: int) -> float:
+        """Estimate the fraction of columns that match a column name predicate."""
+        if self.num_cols == 0:
+            return 0.0
+
+        vector_id = self.name_to_vector.get(column)
+        if k == 0:
+            matches = self.name_fanout.get(vector_id, 0) if vector_id is not None else 0
+        else:
+            # The exact match is returned in addition to the k nearest neighbors
+            neighbors = k + 1 if vector_id is not None else k
+            matches = round(neighbors * self.mean_name_fanout)
+        return min(matches, self.num_cols) / self.num_cols
+
+    def percentile_selectivity(
+        self, percentile: float, comparison: str, reference: float
+    ) -> float:
+        """Estimate the fraction of columns that match a percentile predicate."""
+        if self.num_cols == 0:
+            return 0.0
+        if self.percentile_values is None:
+            return 0.5
+        return self._percentile_fraction(percentile, comparison, reference) * self._hist_fraction
+
+    def inverted_percentile_selectivity(
+        self, percentile: float, comparison: str, reference: float
+    ) -> float:
+        """Estimate the fraction of columns that match an inverted percentile predicate.
+
+        Inverted predicates replace negated ones and thus also match all columns without
+        histograms.
+        """
+        if self.num_cols == 0:
+            return 0.0
+        return self.percentile_selectivity(percentile, comparison, reference) + (
+            1 - self._hist_fraction
+        )
+
+    def percentile_range_selectivity(
+        self, percentile: float, lower: tuple[str, float], upper: tuple[str, float]
+    ) -> float:
+        """Estimate the fraction of columns whose value at a percentile lies within a range."""
+        if self.num_cols == 0:
+            return 0.0
+        if self.percentile_values is None:
+            return 0.25
+        # Histograms below the lower bound and above the upper bound do not overlap
+        fraction = (
+            self._percentile_fraction(percentile, *lower)
+            + self._percentile_fraction(percentile, *upper)
+            - 1
+        )
+        return max(fraction, 0.0) * self._hist_fraction
+
+    @property
+    def _hist_fraction(self) -> float:
+        return self.num_hists / self.num_cols
+
+    def _percentile_fraction(self, percentile: float, comparison: str, reference: float) -> float:
+        """Compute the fraction of sampled histograms that match a percentile predicate.
+
+        The fraction is interpolated between the two closest percentiles of the grid.
+        """
+        position = np.clip(percentile, 0.0, 1.0) * (len(PERCENTILE_GRID) - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, len(PERCENTILE_GRID) - 1)
+        weight = position - lower
+        lower_fraction = self._match_fraction(lower, comparison, reference)
+        upper_fraction = self._match_fraction(upper, comparison, reference)
+        return float((1 - weight) * lower_fraction + weight * upper_fraction)
+
+    def _match_fraction(self, grid_idx: int, comparison: str, reference: float) -> float:
+        if self.percentile_values is None:
+            return 0.5
+
+        values = self.percentile_values[grid_idx]
+        if len(values) == 0:
+            return 0.0
+        match comparison:
+            case "ge":
+                matches = len(values) - np.searchsorted(values, reference, side="left")
+            case "gt":
+                matches = len(values) - np.searchsorted(values, reference, side="right")
+            case "le":
+                matches = np.searchsorted(values, reference, side="right")
+            case "lt":
+                matches = np.searchsorted(values, reference, side="left")
+            case _:
+                raise ValueError(f"Unknown comparison: {comparison}")
+        return float(matches) / len(values)
+
+    def doc_selectivity(self, col_selectivity: float) -> float:
+        """Estimate the fraction of documents that contain at least one of a set of columns."""
+        return float(1.0 - (1.0 - col_selectivity) ** self.cols_per_doc)
@@ -1,13 +1,12 @@
 import shutil
 import time
-from collections import defaultdict
 from pathlib import Path
 
 import numpy as np
 import tantivy
 from loguru import logger
 
-from backend.config import DocumentArray, DocumentHighlights
+from backend.config import DocumentArray, DocumentHighlights, FieldHighlight
 
 MAX_DOCS = 1000000
 DOC_FIELDS: list[str] = [
@@ -78,7 +77,7 @@ class TantivyIndex:
 
         results: list[int] = []
         scores: list[float] = []
-        highlights: DocumentHighlights = defaultdict(dict)
+        highlights: DocumentHighlights = {}
 
         process_start = time.perf_counter()
         for score, doc_address in search_result:
@@ -102,34 +101,68 @@ class TantivyIndex:
             results.append(doc_id)
 
             if enable_highlighting:
-                for field in DOC_FIELDS:
-                    # NOTE: Recreating the snippet generators for each result doc is inefficient
-                    snippet_generator = tantivy.SnippetGenerator.create(
-                        searcher, parsed_query, self.schema, field
-                    )
-                    snippet_generator.set_max_num_chars(10000)
-                    snippet = snippet_generator.snippet_from_doc(doc)
-                    highlighted = snippet.highlighted()
-                    if len(highlighted) == 0:
-                        continue
-                    html_snippet: str = doc.get_first(field) or ""
-                    offset = 0
-                    for fragment in highlighted:
-                        start = fragment.start
-                        end = fragment.end
-                        html_snippet = (
-                            html_snippet[: start + offset]
-                            + "<mark>"
-                            + html_snippet[start + offset : end + offset]
-                            + "</mark>"
-                            + html_snippet[end + offset :]
-                        )
-                        offset += len("<mark></mark>")
-
-                    field_name = field
-                    if field in {"creator", "publisher"}:
-                        field_name += "-name"
-                    highlights[doc_id][field_name] = html_snippet
+                field_highlights = self._highlight_fields(searcher, parsed_query, doc)
+                if field_highlights:
+                    highlights[doc_id] = field_highlights
 
         logger.info("Processing results took {:.5f}s", time.perf_counter() - process_start)
         return np.array(results, dtype=np.uint32), scores, highlights
+
+    def highlight(
+        self, query: str, doc_ids: DocumentArray, min_usability_score: float = 0.0
+    ) -> tuple[DocumentArray, DocumentHighlights]:
+        """Search a query among the given documents only and highlight the matched documents.
+
+        Unlike `search`, this only loads and highlights the given documents, e.g., the documents of
+        a result page, instead of all documents that match the query.
+        """
+        matched: list[int] = []
+        highlights: DocumentHighlights = {}
+        if doc_ids.size == 0:
+            return np.array(matched, dtype=np.uint32), highlights
+
+        parsed_query = self.index.parse_query(query, default_field_names=DOC_FIELDS)
+        id_query = self.index.parse_query(f"id: IN [{' '.join(map(str, doc_ids.tolist()))}]")
+        searcher = self.index.searcher()
+        search_result = searcher.search(
+            tantivy.Query.boolean_query(
+                [(tantivy.Occur.Must, parsed_query), (tantivy.Occur.Must, id_query)]
+            ),
+            limit=doc_ids.size,
+        ).hits
+
+        for _, doc_address in search_result:
+            doc = searcher.doc(doc_address)
+            doc_id: int | None = doc.get_first("id")
+            usability_score: int | None = doc.get_first("usability")
+            if doc_id is None or usability_score is None or usability_score < min_usability_score:
+                continue
+            matched.append(doc_id)
+            field_highlights = self._highlight_fields(searcher, parsed_query, doc)
+            if field_highlights:
+                highlights[doc_id] = field_highlights
+
+        return np.sort(np.array(matched, dtype=np.uint32)), highlights
+
+    def _highlight_fields(
+        self, searcher: tantivy.Searcher, parsed_query: tantivy.Query, doc: tantivy.Document
+    ) -> dict[str, FieldHighlight]:
+        """Return the spans of the fields of a document that match a query."""
+        field_highlights: dict[str, FieldHighlight] = {}
+        for field in DOC_FIELDS:
+            # NOTE: Recreating the snippet generators for each result doc is inefficient
+            snippet_generator = tantivy.SnippetGenerator.create(
+                searcher, parsed_query, self.schema, field
+            )
+            snippet_generator.set_max_num_chars(10000)
+            snippet = snippet_generator.snippet_from_doc(doc)
+            highlighted = snippet.highlighted()
+            if len(highlighted) == 0:
+                continue
+            spans = tuple((fragment.start, fragment.end) for fragment in highlighted)
+
+            field_name = field
+            if field in {"creator", "publisher"}:
+                field_name += "-name"
+            field_highlights[field_name] = FieldHighlight(doc.get_first(field) or "", spans)
+        return field_highlights
@@ -98,7 +98,15 @@ class FainderIndex:
         fainder_mode: FainderMode,
         index_name: str,
         hist_filter: ColumnArray | None = None,
+        inverted: bool = False,
     ) -> ColumnArray:
+        """Search for histograms that match a percentile predicate.
+
+        Inverted predicates are the complement of a negated predicate, whose guarantee is the
+        opposite of the mode: the complement of a result with full recall has full precision and
+        vice versa. Approximate modes therefore search inverted predicates with the opposite
+        index mode, so that the result matches the negation of the original predicate.
+        """
         # Data validation
         if not (0 < percentile <= 1) or comparison not in {"ge", "gt", "le", "lt"}:
             raise FainderError(
@@ -120,7 +128,7 @@ class FainderIndex:
                 result, runtime = run_approx(
                     fainder_index=rebinning_index,
                     query=query,
-                    index_mode="recall",
+                    index_mode="precision" if inverted else "recall",
                     id_filter=hist_filter,
                 )
             case FainderMode.FULL_PRECISION:
@@ -134,7 +142,7 @@ class FainderIndex:
                 result, runtime = run_approx(
                     fainder_index=conversion_index,
                     query=query,
-                    index_mode="precision",
+                    index_mode="recall" if inverted else "precision",
                     id_filter=hist_filter,
                 )
             case FainderMode.FULL_RECALL:
@@ -148,7 +156,7 @@ class FainderIndex:
                 result, runtime = run_approx(
                     fainder_index=conversion_index,
                     query=query,
-                    index_mode="recall",
+                    index_mode="precision" if inverted else "recall",
                     id_filter=hist_filter,
                 )
             case FainderMode.EXACT:
@@ -202,3 +210,23 @@ class FainderIndex:
         )
 
         return result
+
+    def search_range(
+        self,
+        percentile: float,
+        lower: tuple[str, float],
+        upper: tuple[str, float],
+        fainder_mode: FainderMode,
+        index_name: str,
+        hist_filter: ColumnArray | None = None,
+    ) -> ColumnArray:
+        """Search for histograms whose value at a percentile lies within a range.
+
+        Fainder evaluates one comparison per query, so the result of the lower bound becomes the
+        filter of the upper bound. Only the first search scans all (filtered) histograms and the
+        results need not be intersected afterwards.
+        """
+        result = self.search(percentile, *lower, fainder_mode, index_name, hist_filter)
+        if len(result) == 0:
+            return result
+        return self.search(percentile, *upper, fainder_mode, index_name, result)
@@ -1,36 +1,72 @@
+import asyncio
 import copy
-import time
 import traceback
+from collections.abc import AsyncIterator, Iterable, Iterator
+from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any
 
 import orjson
 from fastapi import FastAPI, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from lark import UnexpectedInput
 from loguru import logger
 
 from backend.app_state import ApplicationState
 from backend.config import (
-    CacheInfo,
+    BatchQueryRequest,
+    BatchQueryResponse,
+    CacheStatistics,
     ColumnHighlights,
     ColumnSearchError,
+    CostModelInfo,
     DocumentHighlights,
+    ExplainResponse,
     FainderConfigsResponse,
     FainderError,
     IndexingError,
     MessageResponse,
+    PlanNode,
+    QueryMetadata,
+    QueryPoolFullError,
+    QueryPoolInfo,
     QueryRequest,
     QueryResponse,
+    StreamFormat,
 )
 from backend.croissant_store import Document
+from backend.engine.cache import QueryResult
+from backend.engine.highlighting import render_field
+from backend.query_pool import QueryPool
+from backend.result_sessions import ResultSession, ResultSessionStore, SessionKey
 from backend.utils import load_json
 
 logger.info("Starting backend")
 app_state = ApplicationState()
 app_state.initialize()
 
+query_pool = QueryPool(
+    max_workers=app_state.settings.query_workers,
+    max_queue_size=app_state.settings.query_queue_size,
+)
+
+result_sessions = ResultSessionStore(
+    max_bytes=app_state.settings.result_session_max_bytes,
+    ttl=app_state.settings.result_session_ttl,
+    prefetch=app_state.settings.result_prefetch,
+)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:  # noqa: RUF029
+    yield
+    # Learned operator costs survive restarts
+    app_state.save_cost_model()
+
+
 logger.info("Starting FastAPI app")
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
@@ -74,8 +110,8 @@ def _apply_highlighting(
     """Apply highlighting to the documents."""
     for doc, doc_id in zip(docs, paginated_doc_ids, strict=True):
         if doc_id in doc_highlights:
-            for field, highlighted in doc_highlights[doc_id].items():
-                _apply_field_highlighting(doc, field, highlighted)
+            for field, highlight in doc_highlights[doc_id].items():
+                _apply_field_highlighting(doc, field, render_field(highlight))
 
         record_set: list[dict[str, Any]] | None = doc.get("recordSet", None)
         if record_set is not None:
@@ -84,82 +120,338 @@ def _apply_highlighting(
     return docs
 
 
-@app.post("/query")
-async def query(request: QueryRequest) -> QueryResponse:
-    """Execute a query and return the results."""
-    logger.info("Received query: {}", request)
-
-    try:
-        start_time = time.perf_counter()
-
-        fainder_index_name = request.fainder_index_name
-        if fainder_index_name not in app_state.settings.fainder_configs.configs:
-            fainder_index_name = next(iter(app_state.settings.fainder_configs.configs.keys()))
-            logger.warning(
-                "Using default Fainder index '{}' as '{}' is not available.",
-                fainder_index_name,
-                request.fainder_index_name,
-            )
-
-        doc_ids, (doc_highlights, col_highlights) = app_state.engine.execute(
+def _iter_page(
+    result: QueryResult, page: int, per_page: int, *, key: SessionKey
+) -> Iterator[Document]:
+    """Load and highlight the documents of a page of a ranked query result one by one.
+
+    Queries are executed without highlighting, so only the documents of the page are highlighted.
+    """
+    doc_ids = result.ranking.page(page, per_page).tolist()
+    highlights = (
+        app_state.engine.highlight(key.query, doc_ids, key.fainder_mode, key.fainder_index_name)
+        if key.enable_highlighting
+        else None
+    )
+    for doc_id in doc_ids:
+        doc = app_state.croissant_store.get_document(doc_id)
+        if highlights is not None:
+            # Make a deep copy of the document to avoid modifying the original
+            doc = copy.deepcopy(doc)
+            # Only add highlights if they exist for the document
+            _apply_highlighting([doc], *highlights, [doc_id])
+        yield doc
+
+
+def _load_page(
+    result: QueryResult, page: int, per_page: int, *, key: SessionKey
+) -> list[Document]:
+    """Load and highlight the documents of a page of a ranked query result."""
+    return list(_iter_page(result, page, per_page, key=key))
+
+
+def _resolve_fainder_index(fainder_index_name: str) -> str:
+    """Fall back to the default Fainder index if the requested one is not available."""
+    if fainder_index_name in app_state.settings.fainder_configs.configs:
+        return fainder_index_name
+
+    default_index_name = next(iter(app_state.settings.fainder_configs.configs.keys()))
+    logger.warning(
+        "Using default Fainder index '{}' as '{}' is not available.",
+        default_index_name,
+        fainder_index_name,
+    )
+    return default_index_name
+
+
+def _open_session(request: QueryRequest) -> tuple[ResultSession, PlanNode | None]:
+    """Execute a query or resume its result session if the request contains a valid handle.
+
+    Analyzed queries are always executed and also return their plan with runtime statistics.
+    """
+    fainder_index_name = _resolve_fainder_index(request.fainder_index_name)
+    key = SessionKey(
+        request.query, request.fainder_mode, request.result_highlighting, fainder_index_name
+    )
+    session = (
+        result_sessions.get(request.result_handle, key)
+        if request.result_handle is not None and not request.analyze
+        else None
+    )
+    if session is not None:
+        logger.debug("Resuming result session {}", session.handle)
+        return session, None
+
+    plan: PlanNode | None = None
+    result: QueryResult | None = None
+    if request.analyze:
+        plan, result = app_state.engine.explain(
             query=request.query,
             fainder_mode=request.fainder_mode,
-            enable_highlighting=request.result_highlighting,
             fainder_index_name=fainder_index_name,
+            analyze=True,
         )
-
-        # Calculate pagination
-        start_idx = (request.page - 1) * request.per_page
-        end_idx = start_idx + request.per_page
-        paginated_doc_ids = doc_ids[start_idx:end_idx]
-        total_pages = (len(doc_ids) + request.per_page - 1) // request.per_page
-
-        docs = app_state.croissant_store.get_documents(paginated_doc_ids)
-        if request.result_highlighting:
-            # Make a deep copy of the documents to avoid modifying the original
-            docs = copy.deepcopy(docs)
-            # Only add highlights if enabled and they exist for the document
-            docs = _apply_highlighting(docs, doc_highlights, col_highlights, paginated_doc_ids)
-
-        search_time = time.perf_counter() - start_time
-        logger.info(
-            "Query '{}' returned {} results and {} paginated documents in {:.4f} seconds.",
-            request.query,
-            len(doc_ids),
-            len(docs),
-            search_time,
-        )
-        return QueryResponse(
+    if result is None:
+        result = app_state.engine.execute_ranked(
             query=request.query,
-            results=docs,
-            search_time=search_time,
-            result_count=len(doc_ids),
-            page=request.page,
-            total_pages=total_pages,
+            fainder_mode=request.fainder_mode,
+            fainder_index_name=fainder_index_name,
         )
-    except UnexpectedInput as e:
+    session = result_sessions.create(key, result, partial(_load_page, key=key))
+    return session, plan
+
+
+def _execute_query(
+    request: QueryRequest,
+) -> tuple[list[Document], ResultSession, PlanNode | None]:
+    """Execute a query or resume its result session and load the requested page of documents."""
+    session, plan = _open_session(request)
+
+    # Only the requested page is ranked, loaded, and highlighted
+    docs = session.page(request.page, request.per_page)
+    result_sessions.prefetch(session, request.page + 1, request.per_page)
+
+    return docs, session, plan
+
+
+def _explain_query(request: QueryRequest) -> tuple[PlanNode, QueryResult | None]:
+    return app_state.engine.explain(
+        query=request.query,
+        fainder_mode=request.fainder_mode,
+        enable_highlighting=request.result_highlighting,
+        fainder_index_name=_resolve_fainder_index(request.fainder_index_name),
+        analyze=request.analyze,
+    )
+
+
+def _execute_batch(
+    request: BatchQueryRequest,
+) -> list[tuple[list[Document], ResultSession]]:
+    """Execute a batch of queries and load the requested page of documents for each of them."""
+    fainder_index_name = _resolve_fainder_index(request.fainder_index_name)
+    results = app_state.engine.execute_batch(
+        queries=request.queries,
+        fainder_mode=request.fainder_mode,
+        fainder_index_name=fainder_index_name,
+    )
+
+    pages: list[tuple[list[Document], ResultSession]] = []
+    for query, result in zip(request.queries, results, strict=True):
+        key = SessionKey(
+            query, request.fainder_mode, request.result_highlighting, fainder_index_name
+        )
+        # Every query gets its own session so that clients can page through it with /query
+        session = result_sessions.create(key, result, partial(_load_page, key=key))
+        pages.append((session.page(request.page, request.per_page), session))
+    return pages
+
+
+def _failed_query(e: Exception, queries: list[str]) -> str:
+    """Return the query of a batch that caused an error, or all queries if it is unknown."""
+    if isinstance(e, UnexpectedInput):
+        for query in queries:
+            try:
+                app_state.engine.parser.parse(query)
+            except UnexpectedInput:
+                return query
+    return "; ".join(queries)
+
+
+def _query_error(e: Exception, query: str) -> HTTPException:
+    """Log an error that occurred during query execution and convert it to an HTTP error."""
+    if isinstance(e, QueryPoolFullError):
+        logger.warning("Rejecting query '{}': {}", query, e)
+        return HTTPException(
+            status_code=503,
+            detail="Too many queries are pending, please try again later",
+            headers={"Retry-After": str(app_state.settings.query_retry_after)},
+        )
+    if isinstance(e, UnexpectedInput):
         logger.info(
             "Bad user query:\n{}\n(line {}, column {})",
-            e.get_context(request.query).strip(),
+            e.get_context(query).strip(),
             e.line,
             e.column,
         )
-        raise HTTPException(
-            status_code=400, detail=f"Invalid query: {e.get_context(request.query)}"
-        ) from e
-    except FainderError as e:
+        return HTTPException(status_code=400, detail=f"Invalid query: {e.get_context(query)}")
+    if isinstance(e, FainderError):
         logger.info("Error executing percentile predicate: {}", e)
-        raise HTTPException(
-            status_code=400, detail=f"Error executing percentile predicate: {e}"
-        ) from e
-    except ColumnSearchError as e:
+        return HTTPException(status_code=400, detail=f"Error executing percentile predicate: {e}")
+    if isinstance(e, ColumnSearchError):
         logger.info("Column search error: {}", e)
-        raise HTTPException(status_code=400, detail=f"Column search error: {e}") from e
+        return HTTPException(status_code=400, detail=f"Column search error: {e}")
     # TODO: Add other known errors for specific error handling
+    logger.error("Unknown query execution error: {}", e)
+    logger.error(traceback.format_exc())
+    return HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.post("/query")
+async def query(request: QueryRequest) -> QueryResponse:
+    """Execute a query and return the results."""
+    logger.info("Received query: {}", request)
+
+    try:
+        # Queries run on a bounded thread pool so that they do not block the event loop
+        (docs, session, plan), queue_time, search_time = await query_pool.run(
+            partial(_execute_query, request)
+        )
     except Exception as e:
-        logger.error("Unknown query execution error: {}", e)
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail="Internal server error") from e
+        raise _query_error(e, request.query) from e
+
+    logger.info(
+        "Query '{}' returned {} results and {} paginated documents in {:.4f} seconds "
+        "after waiting {:.4f} seconds.",
+        request.query,
+        session.result_count,
+        len(docs),
+        search_time,
+        queue_time,
+    )
+    return QueryResponse(
+        query=request.query,
+        results=docs,
+        search_time=search_time,
+        queue_time=queue_time,
+        result_count=session.result_count,
+        page=request.page,
+        total_pages=session.num_pages(request.per_page),
+        result_handle=session.handle,
+        plan=plan,
+    )
+
+
+@app.post("/explain")
+async def explain(request: QueryRequest) -> ExplainResponse:
+    """Return the optimized plan of a query.
+
+    If `analyze` is set, the query is executed and every node of the plan is annotated with its
+    wall time, input and output cardinalities, histogram filter size, result groups, and whether
+    the leaf cache was hit.
+    """
+    logger.info("Received explain request: {}", request)
+
+    try:
+        (plan, result), _, search_time = await query_pool.run(partial(_explain_query, request))
+    except Exception as e:
+        raise _query_error(e, request.query) from e
+
+    return ExplainResponse(
+        query=request.query,
+        executor_type=app_state.engine.executor_type,
+        analyzed=request.analyze,
+        plan=plan,
+        search_time=search_time if request.analyze else None,
+        result_count=len(result.ranking) if result is not None else None,
+    )
+
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest) -> BatchQueryResponse:
+    """Execute a batch of queries and return the results of each query.
+
+    Predicates and subexpressions that occur in several queries of the batch are only evaluated
+    once. Each response contains a result handle to request further pages with `/query`.
+    """
+    logger.info("Received batch of {} queries", len(request.queries))
+
+    try:
+        # The whole batch counts as a single task for the admission control of the query pool
+        pages, queue_time, search_time = await query_pool.run(partial(_execute_batch, request))
+    except Exception as e:
+        raise _query_error(e, _failed_query(e, request.queries)) from e
+
+    logger.info(
+        "Batch of {} queries returned {} results in {:.4f} seconds after waiting {:.4f} seconds.",
+        len(request.queries),
+        sum(session.result_count for _, session in pages),
+        search_time,
+        queue_time,
+    )
+    return BatchQueryResponse(
+        responses=[
+            QueryResponse(
+                query=query,
+                results=docs,
+                search_time=search_time,
+                queue_time=queue_time,
+                result_count=session.result_count,
+                page=request.page,
+                total_pages=session.num_pages(request.per_page),
+                result_handle=session.handle,
+            )
+            for query, (docs, session) in zip(request.queries, pages, strict=True)
+        ],
+        search_time=search_time,
+        queue_time=queue_time,
+    )
+
+
+def _encode_event(event: str, data: dict[str, Any], stream_format: StreamFormat) -> bytes:
+    """Encode an event of a streamed query response."""
+    if stream_format == StreamFormat.SSE:
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+    return orjson.dumps({"event": event, "data": data}) + b"\n"
+
+
+@app.post("/query/stream")
+async def query_stream(
+    request: QueryRequest, stream_format: StreamFormat = StreamFormat.NDJSON
+) -> StreamingResponse:
+    """Execute a query and stream the results.
+
+    The response starts with a `metadata` event as soon as the result is ranked. It is followed
+    by one `document` event per document of the requested page and a final `end` event. Events
+    are sent as newline-delimited JSON objects or as server-sent events.
+    """
+    logger.info("Received streaming query: {}", request)
+
+    try:
+        (session, plan), queue_time, search_time = await query_pool.run(
+            partial(_open_session, request)
+        )
+    except Exception as e:
+        raise _query_error(e, request.query) from e
+
+    metadata = QueryMetadata(
+        query=request.query,
+        search_time=search_time,
+        queue_time=queue_time,
+        result_count=session.result_count,
+        page=request.page,
+        total_pages=session.num_pages(request.per_page),
+        result_handle=session.handle,
+        plan=plan,
+    )
+
+    def _events() -> Iterator[bytes]:
+        yield _encode_event("metadata", metadata.model_dump(), stream_format)
+
+        # Serve prefetched documents if available, otherwise load them as they are streamed
+        docs: Iterable[Document] | None = session.take_prefetched(request.page, request.per_page)
+        if docs is None:
+            docs = _iter_page(session.result, request.page, request.per_page, key=session.key)
+        num_docs = 0
+        for doc in docs:
+            yield _encode_event("document", doc, stream_format)
+            num_docs += 1
+
+        result_sessions.prefetch(session, request.page + 1, request.per_page)
+        logger.info(
+            "Streamed {} of {} results for query '{}'",
+            num_docs,
+            session.result_count,
+            request.query,
+        )
+        yield _encode_event("end", {"document_count": num_docs}, stream_format)
+
+    # Starlette iterates over synchronous generators in a thread pool
+    return StreamingResponse(
+        _events(),
+        media_type=(
+            "text/event-stream" if stream_format == StreamFormat.SSE else "application/x-ndjson"
+        ),
+    )
 
 
 @app.post("/upload")
@@ -192,7 +484,9 @@ async def update_indices() -> MessageResponse:
         # NOTE: Our approach increases memory usage since we load the new indices without deleting
         # the old ones, we should consider optimizing this in the future
 
-        app_state.update_indices()
+        # Rebuilding the indices blocks for a long time, so it must not run on the event loop
+        await asyncio.to_thread(app_state.update_indices)
+        result_sessions.clear()
         logger.info("Indices updated successfully")
         return MessageResponse(message="Indices updated successfully")
     except IndexingError as e:
@@ -220,14 +514,26 @@ async def get_fainder_configs() -> FainderConfigsResponse:
 
 
 @app.get("/cache_statistics")
-async def cache_statistics() -> CacheInfo:
-    """Return statistics about the query result cache."""
+async def cache_statistics() -> CacheStatistics:
+    """Return statistics about the query result and leaf operator caches."""
     return app_state.engine.cache_info()
 
 
+@app.get("/cost_model")
+async def cost_model() -> CostModelInfo:
+    """Return the operator costs that were learned from executed queries."""
+    return app_state.engine.cost_info()
+
+
+@app.get("/query_pool_statistics")
+async def query_pool_statistics() -> QueryPoolInfo:
+    """Return the number of running, queued, and rejected queries."""
+    return query_pool.info()
+
+
 @app.get("/clear_cache")
 async def clear_cache() -> MessageResponse:
-    """Clear the query result cache."""
+    """Clear the query result and leaf operator caches."""
     app_state.engine.clear_cache()
     logger.info("Cache cleared successfully")
     return MessageResponse(message="Cache cleared successfully")
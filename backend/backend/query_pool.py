@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generic, NamedTuple, TypeVar
+
+from backend.config import QueryPoolFullError, QueryPoolInfo
+
+T = TypeVar("T")
+
+
+class PoolResult(NamedTuple, Generic[T]):
+    """Result of a task together with the time it waited in the queue and ran on a worker."""
+
+    value: T
+    queue_time: float
+    execution_time: float
+
+
+class QueryPool:
+    """A bounded thread pool that runs blocking query execution outside of the event loop.
+
+    At most `max_workers` tasks run at the same time and at most `max_queue_size` further tasks
+    wait for a free worker. Tasks that arrive while the queue is full are rejected right away so
+    that overloaded servers answer quickly instead of letting latencies pile up.
+
+    Args:
+        max_workers: Number of tasks that are executed concurrently.
+        max_queue_size: Number of tasks that may wait for a worker.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int) -> None:
+        if max_workers < 1:
+            raise ValueError("The query pool needs at least one worker")
+        if max_queue_size < 0:
+            raise ValueError("The query queue size must not be negative")
+
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._rejected = 0
+
+    async def run(self, func: Callable[[], T]) -> PoolResult[T]:
+        """Run a blocking function on the pool without blocking the event loop.
+
+        Raises:
+            QueryPoolFullError: If all workers are busy and the queue is full.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_size:
+                self._rejected += 1
+                raise QueryPoolFullError(
+                    f"{self._pending} queries are pending, "
+                    f"the limit is {self.max_workers + self.max_queue_size}"
+                )
+            self._pending += 1
+
+        submit_time = time.perf_counter()
+
+        def _task() -> PoolResult[T]:
+            start_time = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                value = func()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+            return PoolResult(value, start_time - submit_time, time.perf_counter() - start_time)
+
+        try:
+            future = self._executor.submit(_task)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def info(self) -> QueryPoolInfo:
+        with self._lock:
+            return QueryPoolInfo(
+                running=self._running,
+                queued=self._pending - self._running,
+                rejected=self._rejected,
+                max_workers=self.max_workers,
+                max_queue_size=self.max_queue_size,
+            )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
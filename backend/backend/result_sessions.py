@@ -0,0 +1,129 @@
+import threading
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+
+from loguru import logger
+
+from backend.config import CacheInfo, FainderMode
+from backend.croissant_store import Document
+from backend.engine.cache import QueryResult, ResultCache, query_result_nbytes
+
+PageLoader = Callable[[QueryResult, int, int], list[Document]]
+
+
+class SessionKey(NamedTuple):
+    """Parameters of a query that determine its result."""
+
+    query: str
+    fainder_mode: FainderMode
+    enable_highlighting: bool
+    fainder_index_name: str
+
+
+class ResultSession:
+    """The ranked result of a query that a client pages through.
+
+    Args:
+        handle: Identifier of the session that clients pass to request further pages.
+        key: Parameters of the query that produced the result.
+        result: Ranked result of the query.
+        load_page: Function that loads the documents of a page of the result.
+    """
+
+    def __init__(
+        self, handle: str, key: SessionKey, result: QueryResult, load_page: PageLoader
+    ) -> None:
+        self.handle = handle
+        self.key = key
+        self.result = result
+        self._load_page = load_page
+        self._lock = threading.Lock()
+        # Only the most recently prefetched page is kept to bound the memory of a session
+        self._prefetched: tuple[tuple[int, int], Future[list[Document]]] | None = None
+
+    @property
+    def result_count(self) -> int:
+        return len(self.result.ranking)
+
+    def num_pages(self, per_page: int) -> int:
+        return (self.result_count + per_page - 1) // per_page
+
+    def page(self, page: int, per_page: int) -> list[Document]:
+        """Return the documents of a page, using the prefetched documents if available."""
+        docs = self.take_prefetched(page, per_page)
+        if docs is not None:
+            return docs
+        return self._load_page(self.result, page, per_page)
+
+    def take_prefetched(self, page: int, per_page: int) -> list[Document] | None:
+        """Return the documents of a page if they have been prefetched, otherwise None."""
+        with self._lock:
+            prefetched = self._prefetched
+            if prefetched is None or prefetched[0] != (page, per_page):
+                return None
+            self._prefetched = None
+
+        try:
+            return prefetched[1].result()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Prefetching page {} of session {} failed: {}", page, self.handle, e)
+            return None
+
+    def prefetch(self, page: int, per_page: int, executor: ThreadPoolExecutor) -> None:
+        """Load the documents of a page in the background."""
+        if page < 1 or page > self.num_pages(per_page):
+            return
+
+        with self._lock:
+            if self._prefetched is not None and self._prefetched[0] == (page, per_page):
+                return
+            future = executor.submit(self._load_page, self.result, page, per_page)
+            self._prefetched = ((page, per_page), future)
+
+
+class ResultSessionStore:
+    """A thread-safe store for result sessions that expire after a while.
+
+    Sessions are evicted in LRU order once the ranked results of all sessions exceed `max_bytes`.
+
+    Args:
+        max_bytes: Maximum total size of the stored query results. A non-positive value disables
+            result sessions.
+        ttl: Time in seconds after which a session expires. None means that sessions only expire
+            by eviction.
+        prefetch: Whether to load the documents of the next page in the background.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float | None = None, prefetch: bool = True) -> None:
+        self._sessions: ResultCache[str, ResultSession] = ResultCache(
+            max_bytes=max_bytes,
+            sizeof=lambda session: query_result_nbytes(session.result),
+            ttl=ttl,
+        )
+        self._prefetch_pool = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") if prefetch else None
+        )
+
+    def create(self, key: SessionKey, result: QueryResult, load_page: PageLoader) -> ResultSession:
+        session = ResultSession(uuid.uuid4().hex, key, result, load_page)
+        self._sessions.put(session.handle, session)
+        return session
+
+    def get(self, handle: str, key: SessionKey) -> ResultSession | None:
+        """Return the session with the given handle if it belongs to a query with the same key."""
+        session = self._sessions.get(handle)
+        if session is None or session.key != key:
+            return None
+        return session
+
+    def prefetch(self, session: ResultSession, page: int, per_page: int) -> None:
+        if self._prefetch_pool is not None:
+            session.prefetch(page, per_page, self._prefetch_pool)
+
+    def clear(self) -> None:
+        self._sessions.clear()
+
+    def info(self) -> CacheInfo:
+        return self._sessions.info()
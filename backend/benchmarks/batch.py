@@ -0,0 +1,100 @@
+"""Benchmark of batched query execution against executing the same queries one at a time.
+
+The workload consists of the executor test queries and of synthetic queries that combine their
+predicates, so that many predicates and subexpressions occur in several queries of a batch.
+
+Example:
+    python -m benchmarks.batch --batch-sizes 1 8 32 --repetitions 5
+"""
+
+import argparse
+from functools import partial
+
+import numpy as np
+from loguru import logger
+
+from backend.config import configure_logging
+from backend.engine import Engine
+from backend.engine.cache import QueryResult
+
+from .common import add_engine_args, executor_queries, load_engine, timed
+
+
+def overlapping_queries(queries: list[str], num_queries: int, seed: int) -> list[str]:
+    """Create queries that share predicates by combining pairs of existing queries."""
+    rng = np.random.default_rng(seed)
+    operators = ["AND", "OR"]
+    return [
+        f"({queries[left]}) {operators[operator]} ({queries[right]})"
+        for left, operator, right in zip(
+            rng.integers(len(queries), size=num_queries),
+            rng.integers(len(operators), size=num_queries),
+            rng.integers(len(queries), size=num_queries),
+            strict=True,
+        )
+    ]
+
+
+def execute_sequential(engine: Engine, queries: list[str]) -> list[list[int]]:
+    return [engine.execute(query)[0] for query in queries]
+
+
+def execute_batch(engine: Engine, queries: list[str]) -> list[list[int]]:
+    return [to_list(result) for result in engine.execute_batch(queries)]
+
+
+def to_list(result: QueryResult) -> list[int]:
+    ranking = result.ranking
+    doc_ids: list[int] = ranking.top(len(ranking)).tolist()
+    return doc_ids
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark batched query execution")
+    add_engine_args(parser)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+
+    engine = load_engine(args.data_dir, args.collection_name, args.executor_type)
+    base_queries = executor_queries()
+
+    # Parse errors would abort a whole batch
+    valid_queries: list[str] = []
+    for query in base_queries:
+        try:
+            engine.execute(query)
+            valid_queries.append(query)
+        except Exception:  # noqa: BLE001
+            logger.debug("Skipping query that cannot be executed: {}", query)
+
+    for batch_size in args.batch_sizes:
+        queries = overlapping_queries(valid_queries, batch_size, args.seed)
+
+        expected, sequential_time = timed(
+            partial(execute_sequential, engine, queries), args.repetitions
+        )
+        results, batch_time = timed(partial(execute_batch, engine, queries), args.repetitions)
+
+        mismatches = sum(
+            result != reference for result, reference in zip(results, expected, strict=True)
+        )
+        if mismatches:
+            logger.error("{} batched results differ from sequential execution", mismatches)
+        logger.info(
+            "batch size={:>4} | sequential {:.4f}s | batch {:.4f}s | speedup {:.2f}x",
+            batch_size,
+            sequential_time,
+            batch_time,
+            sequential_time / batch_time,
+        )
+
+
+if __name__ == "__main__":
+    main()
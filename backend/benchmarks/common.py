@@ -0,0 +1,90 @@
+import argparse
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import TypeVar
+
+from backend.config import ExecutorType, Metadata, Settings
+from backend.engine import Engine
+from backend.indices import FainderIndex, HnswIndex, TantivyIndex
+from tests.assets.test_cases_executor import EXECUTOR_CASES
+
+T = TypeVar("T")
+
+DEFAULT_DATA_DIR = Path(__file__).parent.parent / "tests" / "assets"
+DEFAULT_COLLECTION = "toy_collection"
+
+
+def add_engine_args(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments that are needed to load an engine to an argument parser."""
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--collection-name", type=str, default=DEFAULT_COLLECTION)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    parser.add_argument(
+        "--executor-type",
+        type=ExecutorType,
+        choices=list(ExecutorType),
+        default=ExecutorType.SIMPLE,
+    )
+
+
+def load_engine(
+    data_dir: Path,
+    collection_name: str,
+    executor_type: ExecutorType = ExecutorType.SIMPLE,
+    max_workers: int | None = None,
+    cache_max_bytes: int = 0,
+    leaf_cache_max_bytes: int = 0,
+    plan_cache_max_bytes: int = 0,
+) -> Engine:
+    """Load the indices of a collection and create an engine on top of them.
+
+    Caches are disabled by default so that benchmarks measure query execution.
+    """
+    settings = Settings(
+        data_dir=data_dir,
+        collection_name=collection_name,
+        _env_file=None,  # type: ignore[call-arg]
+    )
+
+    with settings.metadata_path.open("rb") as f:
+        metadata = Metadata.model_validate_json(f.read())
+
+    tantivy_index = TantivyIndex(index_path=settings.tantivy_path, recreate=False)
+    fainder_index = FainderIndex(
+        rebinning_paths={"default": settings.rebinning_index_path},
+        conversion_paths={"default": settings.conversion_index_path},
+        histogram_path=settings.histogram_path,
+        num_workers=0,
+    )
+    hnsw_index = HnswIndex(path=settings.hnsw_index_path, metadata=metadata, use_embeddings=False)
+    return Engine(
+        tantivy_index=tantivy_index,
+        fainder_index=fainder_index,
+        hnsw_index=hnsw_index,
+        metadata=metadata,
+        cache_max_bytes=cache_max_bytes,
+        leaf_cache_max_bytes=leaf_cache_max_bytes,
+        plan_cache_max_bytes=plan_cache_max_bytes,
+        min_usability_score=settings.min_usability_score,
+        rank_by_usability=settings.rank_by_usability,
+        executor_type=executor_type,
+        max_workers=max_workers or settings.max_workers,
+    )
+
+
+def executor_queries() -> list[str]:
+    """Return the queries of the executor test cases as a benchmark workload."""
+    return [case["query"] for cases in EXECUTOR_CASES.values() for case in cases.values()]
+
+
+def timed(func: Callable[[], T], repetitions: int = 1) -> tuple[T, float]:
+    """Run a function repeatedly and return its last result and the mean runtime in seconds."""
+    if repetitions < 1:
+        raise ValueError("The number of repetitions must be positive")
+
+    start = time.perf_counter()
+    result = func()
+    for _ in range(repetitions - 1):
+        result = func()
+    return result, (time.perf_counter() - start) / repetitions
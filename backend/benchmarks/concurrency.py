@@ -0,0 +1,74 @@
+"""Stress test for concurrent query execution on a single engine.
+
+Runs the executor test queries from several client threads against one shared engine and reports
+the query throughput for each number of client threads. Results of the concurrent runs are checked
+against a sequential run to detect interference between queries.
+
+Example:
+    python -m benchmarks.concurrency --executor-type threaded --threads 1 2 4 8
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from loguru import logger
+
+from backend.config import configure_logging
+from backend.engine import Engine
+
+from .common import add_engine_args, executor_queries, load_engine, timed
+
+
+def run_concurrent(engine: Engine, queries: list[str], num_threads: int) -> list[list[int]]:
+    """Execute all queries with the given number of client threads and return their results."""
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        return list(pool.map(lambda query: engine.execute(query)[0], queries))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark concurrent query execution")
+    add_engine_args(parser)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="numbers of concurrent client threads to benchmark",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=10,
+        help="number of times the query workload is repeated per client thread setting",
+    )
+    parser.add_argument(
+        "--repetitions", type=int, default=3, help="number of timed runs per setting"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+    engine = load_engine(args.data_dir, args.collection_name, args.executor_type)
+    queries = executor_queries() * args.rounds
+    expected = [engine.execute(query)[0] for query in queries]
+
+    logger.info("Running {} queries with the {} executor", len(queries), args.executor_type.value)
+    for num_threads in args.threads:
+        results, runtime = timed(
+            partial(run_concurrent, engine, queries, num_threads), args.repetitions
+        )
+        mismatches = sum(result != exp for result, exp in zip(results, expected, strict=True))
+        logger.info(
+            "threads={:>3} | runtime={:.3f}s | throughput={:.1f} queries/s | mismatches={}",
+            num_threads,
+            runtime,
+            len(queries) / runtime,
+            mismatches,
+        )
+
+
+if __name__ == "__main__":
+    main()
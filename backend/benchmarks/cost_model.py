@@ -0,0 +1,211 @@
+"""Benchmark of the predicate order chosen with and without the statistics catalog.
+
+The workload consists of synthetic histograms and of column conjunctions of percentile predicates
+with widely varying selectivities. Each plan is evaluated like the prefiltering executors evaluate
+it: every predicate only scans the histograms that passed the predicates before it. The benchmark
+reports the number of scanned histograms and the runtime of this evaluation on exact percentile
+values for plans with fixed operator costs and for plans with statistics-based costs.
+
+Example:
+    python -m benchmarks.cost_model --num-hists 100000 --num-queries 200
+"""
+
+import argparse
+from functools import partial
+
+import numpy as np
+from loguru import logger
+from numpy.typing import NDArray
+
+from backend.config import CsrMapping, Metadata, configure_logging
+from backend.engine import Optimizer, Parser
+from backend.engine.plan import PercentileOp, compile_plan
+from backend.engine.statistics import StatisticsCatalog
+
+from .common import timed
+
+PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+COMPARISONS = ["ge", "gt", "le", "lt"]
+COLS_PER_DOC = 5
+
+
+def synthetic_histograms(
+    num_hists: int, num_bins: int, rng: np.random.Generator
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Create bell-shaped histograms whose locations and scales span several magnitudes."""
+    locations = rng.lognormal(mean=3.0, sigma=1.5, size=num_hists)
+    scales = locations * rng.uniform(0.05, 0.5, size=num_hists)
+    bins = locations[:, None] + scales[:, None] * np.linspace(-3, 3, num_bins + 1)
+    centers = np.linspace(-3, 3, num_bins + 1)[:-1] + 3 / num_bins
+    densities = np.exp(-(centers**2) / 2) * rng.uniform(0.5, 1.5, size=(num_hists, num_bins))
+    densities /= (densities * np.diff(bins, axis=1)).sum(axis=1, keepdims=True)
+    return densities, bins
+
+
+def percentile_values(
+    densities: NDArray[np.float64], bins: NDArray[np.float64], percentile: float
+) -> NDArray[np.float64]:
+    """Compute the value of each histogram at a percentile."""
+    masses = densities * np.diff(bins, axis=1)
+    cdf = np.concatenate(
+        (np.zeros((len(masses), 1)), np.cumsum(masses, axis=1) / masses.sum(axis=1)[:, None]),
+        axis=1,
+    )
+    rows = np.arange(len(cdf))
+    upper = np.clip((cdf < percentile).sum(axis=1), 1, cdf.shape[1] - 1)
+    lower = upper - 1
+    width = np.maximum(cdf[rows, upper] - cdf[rows, lower], np.finfo(np.float64).eps)
+    fraction = np.clip((percentile - cdf[rows, lower]) / width, 0, 1)
+    values: NDArray[np.float64] = bins[rows, lower] + fraction * (
+        bins[rows, upper] - bins[rows, lower]
+    )
+    return values
+
+
+def synthetic_metadata(num_hists: int) -> Metadata:
+    """Create metadata for documents that each consist of a few histogram columns."""
+    col_ids = np.arange(num_hists, dtype=np.uint32)
+    return Metadata(
+        doc_to_cols=CsrMapping.from_lists(
+            np.array_split(col_ids, max(num_hists // COLS_PER_DOC, 1))
+        ),
+        doc_to_path=[""] * max(num_hists // COLS_PER_DOC, 1),
+        col_to_doc=col_ids // COLS_PER_DOC,
+        name_to_vector={},
+        vector_to_cols={},
+        num_hists=num_hists,
+    )
+
+
+def synthetic_queries(
+    values: dict[float, NDArray[np.float64]], num_queries: int, rng: np.random.Generator
+) -> list[str]:
+    """Create column conjunctions of percentile predicates with references at random quantiles."""
+    queries: list[str] = []
+    for _ in range(num_queries):
+        predicates: list[str] = []
+        for _ in range(rng.integers(3, 6)):
+            percentile = float(rng.choice(PERCENTILES))
+            comparison = str(rng.choice(COMPARISONS))
+            reference = float(np.quantile(values[percentile], rng.uniform(0.02, 0.98)))
+            predicates.append(f"pp({percentile};{comparison};{reference:.6g})")
+        queries.append(f"col({' AND '.join(predicates)})")
+    return queries
+
+
+def predicate_order(optimizer: Optimizer, parser: Parser, query: str) -> list[PercentileOp]:
+    plan = compile_plan(optimizer.optimize(parser.parse(query)))
+    return [op for op in plan.operators if isinstance(op, PercentileOp)]
+
+
+def matches(values: NDArray[np.float64], comparison: str, reference: float) -> NDArray[np.bool_]:
+    match comparison:
+        case "ge":
+            return values >= reference
+        case "gt":
+            return values > reference
+        case "le":
+            return values <= reference
+        case _:
+            return values < reference
+
+
+def evaluate(
+    orders: list[list[PercentileOp]], values: dict[float, NDArray[np.float64]]
+) -> tuple[int, list[NDArray[np.int64]]]:
+    """Evaluate predicates in order, where each predicate only scans the remaining histograms."""
+    num_hists = len(next(iter(values.values())))
+    scanned = 0
+    results: list[NDArray[np.int64]] = []
+    for predicates in orders:
+        candidates = np.arange(num_hists)
+        for op in predicates:
+            scanned += len(candidates)
+            candidate_values = values[op.percentile][candidates]
+            candidates = candidates[matches(candidate_values, op.comparison, op.reference)]
+        results.append(candidates)
+    return scanned, results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the statistics-based cost model")
+    parser.add_argument("--num-hists", type=int, default=100_000)
+    parser.add_argument("--num-bins", type=int, default=16)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+    rng = np.random.default_rng(args.seed)
+
+    densities, bins = synthetic_histograms(args.num_hists, args.num_bins, rng)
+    values = {
+        percentile: percentile_values(densities, bins, percentile) for percentile in PERCENTILES
+    }
+    hists = [(np.uint32(i), (densities[i], bins[i])) for i in range(args.num_hists)]
+    statistics, build_time = timed(
+        partial(StatisticsCatalog, synthetic_metadata(args.num_hists), hists, seed=args.seed)
+    )
+    logger.info("Built statistics catalog in {:.3f}s", build_time)
+
+    queries = synthetic_queries(values, args.num_queries, rng)
+    parser = Parser()
+    # Fused range predicates would hide the predicate order that is compared here
+    optimizers = {
+        "fixed costs": Optimizer(canonicalization=True, predicate_fusion=False),
+        "statistics": Optimizer(
+            canonicalization=True, statistics=statistics, predicate_fusion=False
+        ),
+    }
+
+    # Estimation error of the individual predicates
+    predicates = [
+        op for query in queries for op in predicate_order(optimizers["fixed costs"], parser, query)
+    ]
+    errors = [
+        abs(
+            statistics.percentile_selectivity(op.percentile, op.comparison, op.reference)
+            - matches(values[op.percentile], op.comparison, op.reference).mean()
+        )
+        for op in predicates
+    ]
+    logger.info(
+        "Selectivity estimates of {} predicates | mean absolute error {:.4f} | max {:.4f}",
+        len(errors),
+        np.mean(errors),
+        np.max(errors),
+    )
+
+    reference_results: list[NDArray[np.int64]] | None = None
+    baseline: tuple[int, float] | None = None
+    for name, optimizer in optimizers.items():
+        orders = [predicate_order(optimizer, parser, query) for query in queries]
+        (scanned, results), runtime = timed(partial(evaluate, orders, values), args.repetitions)
+
+        if reference_results is None:
+            reference_results = results
+        elif any(
+            not np.array_equal(result, reference)
+            for result, reference in zip(results, reference_results, strict=True)
+        ):
+            logger.error("Plans with {} return different results", name)
+
+        if baseline is None:
+            baseline = (scanned, runtime)
+        logger.info(
+            "{:>11} | scanned histograms {:>11,} ({:.2f}x) | evaluation {:.4f}s ({:.2f}x)",
+            name,
+            scanned,
+            baseline[0] / scanned,
+            runtime,
+            baseline[1] / runtime,
+        )
+
+
+if __name__ == "__main__":
+    main()
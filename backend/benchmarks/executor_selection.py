@@ -0,0 +1,146 @@
+"""Benchmark of the automatic executor selection against each fixed executor type.
+
+The workload consists of the executor test queries, which are executed by an engine per executor
+type with all caches disabled. The benchmark reports the total runtime of each executor type, the
+runtime of an oracle that picks the fastest executor for each query, and the executor that the
+automatic selection picked for each query next to the fastest one.
+
+The automatic selection falls back to the simple executor on collections with fewer than
+`--min-hists` histograms. Lower the threshold (e.g., to 0) to evaluate the selection on small
+collections and to find the collection size from which on the other executors pay off.
+
+Example:
+    python -m benchmarks.executor_selection --fainder-mode exact --repetitions 5 --min-hists 0
+"""
+
+import argparse
+from collections import Counter
+from functools import partial
+
+from loguru import logger
+
+from backend.config import ExecutorType, FainderMode, configure_logging
+from backend.engine import Engine
+from backend.engine.execution.auto_executor import MIN_HISTS, AutoExecutor
+
+from .common import add_engine_args, executor_queries, load_engine, timed
+
+
+def execute(engine: Engine, query: str, fainder_mode: FainderMode) -> list[int]:
+    return engine.execute(query, fainder_mode=fainder_mode)[0]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the automatic executor selection")
+    add_engine_args(parser)
+    parser.add_argument(
+        "--fainder-mode",
+        type=FainderMode,
+        choices=list(FainderMode),
+        default=FainderMode.LOW_MEMORY,
+    )
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument(
+        "--min-hists",
+        type=int,
+        default=MIN_HISTS,
+        help="number of histograms from which on the automatic selection considers all executors",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+
+    engines = {
+        executor_type: load_engine(args.data_dir, args.collection_name, executor_type)
+        for executor_type in ExecutorType
+    }
+    auto_engine = engines[ExecutorType.AUTO]
+    auto_executor = auto_engine.executor
+    if not isinstance(auto_executor, AutoExecutor):
+        raise TypeError("The engine of the automatic executor selection has another executor")
+    auto_executor.min_hists = args.min_hists
+    logger.info(
+        "The collection has {} histograms, the selection threshold is {}",
+        auto_executor.metadata.num_hists,
+        args.min_hists,
+    )
+
+    runtimes: dict[ExecutorType, list[float]] = {executor_type: [] for executor_type in engines}
+    selected: Counter[ExecutorType] = Counter()
+    num_fastest = 0
+    for query in executor_queries():
+        try:
+            expected = set(execute(auto_engine, query, args.fainder_mode))
+        except Exception:  # noqa: BLE001
+            logger.debug("Skipping query that cannot be executed: {}", query)
+            continue
+
+        ctx = auto_executor.create_context(args.fainder_mode)
+        selected_type = auto_executor.select(auto_engine.plan(query), ctx)
+        auto_executor.score_pool.release(ctx.scores)
+        selected[selected_type] += 1
+
+        current_runtimes: dict[ExecutorType, float] = {}
+        for executor_type, engine in engines.items():
+            result, runtime = timed(
+                partial(execute, engine, query, args.fainder_mode), args.repetitions
+            )
+            if set(result) != expected:
+                logger.error(
+                    "The {} executor returns a different result: {}", executor_type, query
+                )
+            runtimes[executor_type].append(runtime)
+            current_runtimes[executor_type] = runtime
+
+        fastest = min(
+            (t for t in current_runtimes if t != ExecutorType.AUTO),
+            key=current_runtimes.__getitem__,
+        )
+        num_fastest += selected_type == fastest
+        logger.info(
+            "selected {:>21} ({:.4f}s) | fastest {:>21} ({:.4f}s) | {}",
+            selected_type,
+            current_runtimes[selected_type],
+            fastest,
+            current_runtimes[fastest],
+            query,
+        )
+
+    fixed_types = [
+        executor_type for executor_type in engines if executor_type != ExecutorType.AUTO
+    ]
+    oracle = sum(
+        min(query_runtimes)
+        for query_runtimes in zip(*(runtimes[t] for t in fixed_types), strict=True)
+    )
+    best_fixed = min(fixed_types, key=lambda executor_type: sum(runtimes[executor_type]))
+    auto_runtime = sum(runtimes[ExecutorType.AUTO])
+
+    for executor_type, query_runtimes in runtimes.items():
+        logger.info(
+            "{:>21} | total {:.4f}s | {:.2f}x of the oracle",
+            executor_type,
+            sum(query_runtimes),
+            sum(query_runtimes) / oracle,
+        )
+    logger.info(
+        "Automatic selection takes {:.2f}x the time of the best fixed executor ({})",
+        auto_runtime / sum(runtimes[best_fixed]),
+        best_fixed,
+    )
+    logger.info(
+        "Selected executors: {}",
+        ", ".join(f"{executor_type}={count}" for executor_type, count in selected.items()),
+    )
+    logger.info(
+        "The selected executor is the fastest one for {} of {} queries",
+        num_fastest,
+        sum(selected.values()),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark of highlighting only the documents of a result page.
+
+The workload consists of the executor test queries. For each query, the benchmark reports the
+runtime of an execution without highlighting, of a highlighted execution, and of an execution
+without highlighting followed by highlighting the first page of the ranked result.
+
+Example:
+    python -m benchmarks.highlighting --per-page 10 --repetitions 5
+"""
+
+import argparse
+from functools import partial
+
+from loguru import logger
+
+from backend.config import configure_logging
+from backend.engine import Engine
+
+from .common import add_engine_args, executor_queries, load_engine, timed
+
+
+def execute(engine: Engine, query: str, enable_highlighting: bool) -> int:
+    return len(engine.execute_ranked(query, enable_highlighting=enable_highlighting).ranking)
+
+
+def execute_and_highlight_page(engine: Engine, query: str, per_page: int) -> int:
+    result = engine.execute_ranked(query)
+    doc_ids = result.ranking.page(1, per_page)
+    engine.highlight(query, doc_ids)
+    return len(result.ranking)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark highlighting of result pages")
+    add_engine_args(parser)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--repetitions", type=int, default=3)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+    engine = load_engine(args.data_dir, args.collection_name, args.executor_type)
+
+    totals = {"plain": 0.0, "highlighted": 0.0, "page highlighted": 0.0}
+    for query in executor_queries():
+        try:
+            execute(engine, query, enable_highlighting=False)
+        except Exception:  # noqa: BLE001
+            logger.debug("Skipping query that cannot be executed: {}", query)
+            continue
+
+        runs = {
+            "plain": partial(execute, engine, query, False),
+            "highlighted": partial(execute, engine, query, True),
+            "page highlighted": partial(execute_and_highlight_page, engine, query, args.per_page),
+        }
+        for name, func in runs.items():
+            _, runtime = timed(func, args.repetitions)
+            totals[name] += runtime
+
+    for name, total in totals.items():
+        logger.info(
+            "{:>16} | total {:.4f}s | {:.2f}x of plain", name, total, total / totals["plain"]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Microbenchmark of the set operations on document and column IDs.
+
+The workload consists of two random sets of unique IDs for each combination of ID range and
+density. The benchmark reports the runtime of the sorting-based NumPy set operations and of the
+set operations of the executors, which search and merge the sorted IDs of sparse sets and switch
+to masks over the ID range for dense sets.
+
+Example:
+    python -m benchmarks.id_sets --num-ids 10000 100000 1000000 10000000 --repetitions 5
+"""
+
+import argparse
+from functools import partial
+
+import numpy as np
+from loguru import logger
+from numpy.typing import NDArray
+
+from backend.config import configure_logging
+from backend.engine.execution.common import (
+    DENSE_INTERSECTION_DENSITY,
+    DENSE_UNION_DENSITY,
+    difference_arrays,
+    id_range,
+    is_dense,
+    reduce_arrays,
+)
+
+from .common import timed
+
+
+def random_ids(num_ids: int, density: float, rng: np.random.Generator) -> NDArray[np.uint32]:
+    """Draw a random set of unique IDs that covers a share of the ID range."""
+    size = max(1, int(num_ids * density))
+    ids = rng.choice(num_ids, size=size, replace=False).astype(np.uint32)
+    ids.sort()
+    return ids
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the set operations on IDs")
+    parser.add_argument(
+        "--num-ids", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--densities", type=float, nargs="+", default=[0.001, 0.01, 0.05, 0.2, 0.5]
+    )
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+    rng = np.random.default_rng(args.seed)
+
+    for num_ids in args.num_ids:
+        for density in args.densities:
+            a = random_ids(num_ids, density, rng)
+            b = random_ids(num_ids, density, rng)
+            arrays = [a, b]
+            operations = {
+                "and": (
+                    partial(np.intersect1d, a, b, assume_unique=True),
+                    partial(reduce_arrays, arrays, "and"),
+                    DENSE_INTERSECTION_DENSITY,
+                ),
+                "or": (
+                    partial(np.union1d, a, b),
+                    partial(reduce_arrays, arrays, "or"),
+                    DENSE_UNION_DENSITY,
+                ),
+                "difference": (
+                    partial(np.setdiff1d, a, b, assume_unique=True),
+                    partial(difference_arrays, a, b),
+                    DENSE_INTERSECTION_DENSITY,
+                ),
+            }
+            for name, (numpy_func, func, dense_density) in operations.items():
+                expected, numpy_runtime = timed(numpy_func, args.repetitions)
+                result, runtime = timed(func, args.repetitions)
+                if not np.array_equal(result, expected):
+                    logger.error("The {} operation returns a different result", name)
+                dense = is_dense(arrays, id_range(arrays), dense_density)
+                logger.info(
+                    "{:>10} ids | density {:.3f} | {:>10} | numpy {:.5f}s | {} {:.5f}s | {:.2f}x",
+                    num_ids,
+                    density,
+                    name,
+                    numpy_runtime,
+                    "masks " if dense else "sorted",
+                    runtime,
+                    numpy_runtime / runtime,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark of parsing and optimizing large queries against looking up their cached plans.
+
+The workload consists of machine-generated queries with a growing number of predicates.
+
+Example:
+    python -m benchmarks.planning --num-predicates 10 100 1000 --repetitions 10
+"""
+
+import argparse
+from functools import partial
+
+import numpy as np
+from loguru import logger
+
+from backend.config import configure_logging
+from backend.engine import Engine
+
+from .common import add_engine_args, load_engine, timed
+
+
+def generated_query(num_predicates: int, seed: int) -> str:
+    """Create a query that combines random keyword and column predicates."""
+    rng = np.random.default_rng(seed)
+    predicates: list[str] = []
+    for i in range(num_predicates):
+        match rng.integers(3):
+            case 0:
+                predicates.append(f"kw('term{i}')")
+            case 1:
+                predicates.append(f"col(name('column{i}'; {rng.integers(3)}))")
+            case _:
+                comparison = rng.choice(["ge", "gt", "le", "lt"])
+                predicates.append(f"col(pp({rng.random():.2f};{comparison};{rng.integers(1000)}))")
+
+    # Group predicates into nested conjunctions and disjunctions
+    groups = [" AND ".join(predicates[i : i + 4]) for i in range(0, num_predicates, 4)]
+    return " OR ".join(f"({group})" for group in groups)
+
+
+def plan_uncached(engine: Engine, query: str) -> None:
+    engine.plan_cache.clear()
+    engine.plan(query)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark query planning")
+    add_engine_args(parser)
+    parser.add_argument("--num-predicates", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+
+    engine = load_engine(
+        args.data_dir, args.collection_name, args.executor_type, plan_cache_max_bytes=2**30
+    )
+    for num_predicates in args.num_predicates:
+        query = generated_query(num_predicates, args.seed)
+
+        _, uncached_time = timed(partial(plan_uncached, engine, query), args.repetitions)
+        engine.plan(query)
+        _, cached_time = timed(partial(engine.plan, query), args.repetitions)
+        logger.info(
+            "predicates={:>5} | parse and optimize {:.6f}s | cached {:.6f}s | speedup {:.0f}x",
+            num_predicates,
+            uncached_time,
+            cached_time,
+            uncached_time / cached_time,
+        )
+
+
+if __name__ == "__main__":
+    main()
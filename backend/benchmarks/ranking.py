@@ -0,0 +1,82 @@
+"""Benchmark of the result ranking against sorting all results in Python.
+
+Example:
+    python -m benchmarks.ranking --sizes 10000 100000 1000000 --per-page 10
+"""
+
+import argparse
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+from loguru import logger
+from numpy.typing import NDArray
+
+from backend.config import DocumentArray, configure_logging
+from backend.engine.ranking import Ranking
+
+from .common import timed
+
+
+def python_sort(doc_ids: DocumentArray, scores: dict[int, float]) -> list[int]:
+    """Ranking as it was done before the introduction of `Ranking`."""
+    result_list: list[int] = doc_ids.tolist()
+    result_list.sort(key=lambda x: scores.get(x, -1), reverse=True)
+    return result_list
+
+
+def ranking_pages(
+    doc_ids: DocumentArray, scores: NDArray[np.float32], per_page: int, num_pages: int
+) -> list[int]:
+    """Rank a result and fetch its first pages one after another."""
+    ranking = Ranking(doc_ids, scores)
+    page: list[int] = []
+    for page_number in range(1, num_pages + 1):
+        page = ranking.page(page_number, per_page).tolist()
+    return page
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark result ranking")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.log_level)
+    rng = np.random.default_rng(args.seed)
+
+    for size in args.sizes:
+        doc_ids = np.sort(rng.choice(4 * size, size, replace=False)).astype(np.uint32)
+        scores = rng.random(size, dtype=np.float32)
+        score_dict: dict[int, float] = defaultdict(
+            float, zip(doc_ids.tolist(), scores.tolist(), strict=True)
+        )
+
+        expected, sort_time = timed(partial(python_sort, doc_ids, score_dict), args.repetitions)
+        logger.info("size={:>8} | python sort          | {:.4f}s", size, sort_time)
+        for num_pages in args.pages:
+            page, rank_time = timed(
+                partial(ranking_pages, doc_ids, scores, args.per_page, num_pages),
+                args.repetitions,
+            )
+            start = (num_pages - 1) * args.per_page
+            if page != expected[start : start + args.per_page]:
+                logger.error("Ranking of page {} differs from the Python sort", num_pages)
+            logger.info(
+                "size={:>8} | ranking up to page {:>3} | {:.4f}s | speedup {:.1f}x",
+                size,
+                num_pages,
+                rank_time,
+                sort_time / rank_time,
+            )
+
+
+if __name__ == "__main__":
+    main()
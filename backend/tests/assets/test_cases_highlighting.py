@@ -3,12 +3,12 @@ from typing import TypedDict
 
 import numpy as np
 
-from backend.config import Highlights
+from backend.config import RenderedHighlights
 
 
 class HighlightingCase(TypedDict):
     query: str
-    expected: Highlights
+    expected: RenderedHighlights
 
 
 HIGHLIGHTING_CASES: dict[str, HighlightingCase] = {
@@ -287,7 +287,8 @@ OPTIMIZER_CASES: dict[str, OptimizerCase] = {
                             "conjunction",
                             [
                                 Tree(
-                                    Token("RULE", "keyword_op"), [Token("STRING", "-(d) AND (f)")]
+                                    Token("RULE", "keyword_op"),
+                                    [Token("STRING", "-(d) AND (e) AND (f)")],
                                 ),
                                 Tree(
                                     "negation",
@@ -303,20 +304,6 @@ OPTIMIZER_CASES: dict[str, OptimizerCase] = {
                                         )
                                     ],
                                 ),
-                                Tree(
-                                    "negation",
-                                    [
-                                        Tree(
-                                            "negation",
-                                            [
-                                                Tree(
-                                                    Token("RULE", "keyword_op"),
-                                                    [Token("STRING", "e")],
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                ),
                             ],
                         ),
                     ],
@@ -349,21 +336,8 @@ OPTIMIZER_CASES: dict[str, OptimizerCase] = {
                             "conjunction",
                             [
                                 Tree(
-                                    Token("RULE", "keyword_op"), [Token("STRING", "-(d) AND (f)")]
-                                ),
-                                Tree(
-                                    "negation",
-                                    [
-                                        Tree(
-                                            "negation",
-                                            [
-                                                Tree(
-                                                    Token("RULE", "keyword_op"),
-                                                    [Token("STRING", "e")],
-                                                )
-                                            ],
-                                        )
-                                    ],
+                                    Token("RULE", "keyword_op"),
+                                    [Token("STRING", "-(d) AND (e) AND (f)")],
                                 ),
                                 Tree(
                                     "negation",
@@ -415,20 +389,7 @@ OPTIMIZER_CASES: dict[str, OptimizerCase] = {
                                     "negation",
                                     [Tree(Token("RULE", "keyword_op"), [Token("STRING", "d")])],
                                 ),
-                                Tree(
-                                    "negation",
-                                    [
-                                        Tree(
-                                            "negation",
-                                            [
-                                                Tree(
-                                                    Token("RULE", "keyword_op"),
-                                                    [Token("STRING", "e")],
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                ),
+                                Tree(Token("RULE", "keyword_op"), [Token("STRING", "e")]),
                                 Tree(Token("RULE", "keyword_op"), [Token("STRING", "f")]),
                                 Tree(
                                     "negation",
@@ -8,6 +8,7 @@ from loguru import logger
 
 from backend.config import ExecutorType, Metadata, Settings
 from backend.engine import Engine, Parser
+from backend.engine.execution.auto_executor import AutoExecutor
 from backend.indices import FainderIndex, HnswIndex, TantivyIndex
 
 
@@ -67,7 +68,8 @@ def default_engine() -> Engine:
         fainder_index=fainder_index,
         hnsw_index=hnsw_index,
         metadata=metadata,
-        cache_size=-1,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
         min_usability_score=settings.min_usability_score,
         rank_by_usability=settings.rank_by_usability,
         executor_type=settings.executor_type,
@@ -103,7 +105,8 @@ def small_fainder_engine() -> Engine:
         fainder_index=fainder_index,
         hnsw_index=hnsw_index,
         metadata=metadata,
-        cache_size=-1,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
         min_usability_score=settings.min_usability_score,
         rank_by_usability=settings.rank_by_usability,
         executor_type=settings.executor_type,
@@ -137,7 +140,8 @@ def prefiltering_engine() -> Engine:
         fainder_index=fainder_index,
         hnsw_index=hnsw_index,
         metadata=metadata,
-        cache_size=-1,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
         executor_type=ExecutorType.PREFILTERING,
         min_usability_score=settings.min_usability_score,
         rank_by_usability=settings.rank_by_usability,
@@ -171,7 +175,8 @@ def parallel_engine() -> Engine:
         fainder_index=fainder_index,
         hnsw_index=hnsw_index,
         metadata=metadata,
-        cache_size=-1,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
         executor_type=ExecutorType.THREADED,
         min_usability_score=settings.min_usability_score,
         rank_by_usability=settings.rank_by_usability,
@@ -205,7 +210,8 @@ def parallel_prefiltering_engine() -> Engine:
         fainder_index=fainder_index,
         hnsw_index=hnsw_index,
         metadata=metadata,
-        cache_size=-1,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
         executor_type=ExecutorType.THREADED_PREFILTERING,
         min_usability_score=settings.min_usability_score,
         rank_by_usability=settings.rank_by_usability,
@@ -213,6 +219,66 @@ def parallel_prefiltering_engine() -> Engine:
     )
 
 
+@pytest.fixture(scope="module")
+def auto_engine() -> Engine:
+    settings = Settings(
+        data_dir=Path(__file__).parent / "assets",
+        collection_name="toy_collection",
+        _env_file=None,  # type: ignore[call-arg]
+    )
+
+    with settings.metadata_path.open("rb") as f:
+        metadata = Metadata.model_validate_json(f.read())
+
+    tantivy_index = TantivyIndex(index_path=settings.tantivy_path, recreate=False)
+    # Fainder indices for testing are generated with the following parameters:
+    # n_clusters = 23, bin_budget = 230, alpha = 1, transform = None,
+    fainder_index = FainderIndex(
+        rebinning_paths={"default": settings.rebinning_index_path},
+        conversion_paths={"default": settings.conversion_index_path},
+        histogram_path=settings.histogram_path,
+        num_workers=0,
+    )
+    hnsw_index = HnswIndex(path=settings.hnsw_index_path, metadata=metadata, use_embeddings=False)
+    engine = Engine(
+        tantivy_index=tantivy_index,
+        fainder_index=fainder_index,
+        hnsw_index=hnsw_index,
+        metadata=metadata,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
+        executor_type=ExecutorType.AUTO,
+        min_usability_score=settings.min_usability_score,
+        rank_by_usability=settings.rank_by_usability,
+        max_workers=settings.max_workers,
+    )
+    # The toy collection is too small for any executor but the simple one to be selected
+    assert isinstance(engine.executor, AutoExecutor)
+    engine.executor.min_hists = 0
+    return engine
+
+
+@pytest.fixture(scope="module")
+def leaf_cache_engine(request: pytest.FixtureRequest, default_engine: Engine) -> Engine:
+    """An engine with a leaf cache whose executor type is given by indirect parametrization.
+
+    The other engines disable all caches so that every test computes its results from the indices.
+    """
+    executor_type: ExecutorType = getattr(request, "param", ExecutorType.SIMPLE)
+    executor = default_engine.executor
+    return Engine(
+        tantivy_index=executor.tantivy_index,
+        fainder_index=executor.fainder_index,
+        hnsw_index=executor.hnsw_index,
+        metadata=executor.metadata,
+        cache_max_bytes=0,
+        executor_type=executor_type,
+        min_usability_score=default_engine.min_usability_score,
+        rank_by_usability=default_engine.rank_by_usability,
+        max_workers=default_engine.max_workers,
+    )
+
+
 @pytest.fixture(scope="module")
 def parser() -> Parser:
     return Parser()
@@ -0,0 +1,59 @@
+from itertools import pairwise
+from typing import TYPE_CHECKING
+
+import pytest
+from lark import UnexpectedInput
+
+from backend.engine.highlighting import render_highlights
+
+from .assets.test_cases_executor import EXECUTOR_CASES
+
+if TYPE_CHECKING:
+    from backend.engine import Engine
+
+QUERIES = [case["query"] for cases in EXECUTOR_CASES.values() for case in cases.values()]
+
+
+def _valid_queries(engine: "Engine") -> list[str]:
+    valid_queries: list[str] = []
+    for query in QUERIES:
+        try:
+            engine.execute(query)
+        except (UnexpectedInput, ValueError):
+            continue
+        valid_queries.append(query)
+    return valid_queries
+
+
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_batch_matches_sequential(engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    queries = _valid_queries(engine)
+    # Combine queries so that the batch contains shared predicates and subexpressions
+    queries += [f"({a}) AND ({b})" for a, b in pairwise(queries)]
+    queries += [f"({a}) OR NOT ({b})" for a, b in zip(queries, queries[2:], strict=False)]
+
+    expected = [engine.execute(query, enable_highlighting=True) for query in queries]
+    engine.clear_cache()
+    results = engine.execute_batch(queries, enable_highlighting=True)
+
+    assert len(results) == len(queries)
+    for query, result, (exp_doc_ids, (exp_doc_highlights, exp_col_highlights)) in zip(
+        queries, results, expected, strict=True
+    ):
+        assert result.ranking.top(len(result.ranking)).tolist() == exp_doc_ids, query
+        assert render_highlights(result.highlights[0]) == exp_doc_highlights, query
+        assert result.highlights[1].tolist() == exp_col_highlights.tolist(), query
+
+
+def test_batch_deduplicates_queries(default_engine: "Engine") -> None:
+    query = "kw('germany') AND col(name('age'; 0))"
+    default_engine.clear_cache()
+    results = default_engine.execute_batch([query, query, "col(name('age'; 0)) AND kw('germany')"])
+
+    assert results[0] is results[1]
+    assert results[0] is results[2]
+    assert default_engine.execute_batch([]) == []
@@ -0,0 +1,233 @@
+import time
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pytest
+
+from backend.config import ExecutorType, FainderMode
+from backend.engine import Engine, Parser
+from backend.engine.cache import ResultCache, query_result_nbytes
+from backend.engine.optimizer import canonical_form, create_optimizer
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from backend.engine.execution.common import DocResult
+    from backend.engine.execution.context import ExecutionContext
+    from backend.engine.plan import QueryPlan
+
+
+@pytest.mark.parametrize(
+    ("query_a", "query_b"),
+    [
+        ("kw('a') AND kw('b')", "kw('b') AND kw('a')"),
+        ("kw('a')   AND\tkw('b')", 'keyword("a") AND kw("b")'),
+        ("col(pp(0.5;ge;10))", "column(percentile(0.50;ge;10.0))"),
+        (
+            "col(name('x';0) OR pp(0.9;lt;5)) AND kw('a')",
+            "kw('a') AND col(pp(0.9;lt;5) OR name('x';0))",
+        ),
+    ],
+)
+def test_canonical_form_equal(query_a: str, query_b: str, parser: Parser) -> None:
+    optimizer = create_optimizer(ExecutorType.SIMPLE)
+    plan_a = optimizer.optimize(parser.parse(query_a))
+    plan_b = optimizer.optimize(parser.parse(query_b))
+
+    assert canonical_form(plan_a) == canonical_form(plan_b)
+
+
+@pytest.mark.parametrize(
+    ("query_a", "query_b"),
+    [
+        ("kw('a') AND kw('b')", "kw('a') OR kw('b')"),
+        ("col(pp(0.5;ge;10))", "col(pp(0.5;gt;10))"),
+        ("col(name('x';0))", "col(name('x';1))"),
+    ],
+)
+def test_canonical_form_different(query_a: str, query_b: str, parser: Parser) -> None:
+    optimizer = create_optimizer(ExecutorType.SIMPLE)
+    plan_a = optimizer.optimize(parser.parse(query_a))
+    plan_b = optimizer.optimize(parser.parse(query_b))
+
+    assert canonical_form(plan_a) != canonical_form(plan_b)
+
+
+def test_result_cache_evicts_by_size() -> None:
+    cache: ResultCache[str, NDArray[np.uint32]] = ResultCache(
+        max_bytes=1000, sizeof=lambda x: x.nbytes
+    )
+    cache.put("a", np.zeros(100, dtype=np.uint32))
+    cache.put("b", np.zeros(100, dtype=np.uint32))
+    assert cache.get("a") is not None
+
+    # Inserting "c" must evict "b", the least recently used entry
+    cache.put("c", np.zeros(100, dtype=np.uint32))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+    info = cache.info()
+    assert info.curr_size == 2  # noqa: PLR2004
+    assert info.curr_bytes == 800  # noqa: PLR2004
+    assert info.evictions == 1
+    assert info.hits == 3  # noqa: PLR2004
+    assert info.misses == 1
+
+
+def test_result_cache_ttl() -> None:
+    cache: ResultCache[str, NDArray[np.uint32]] = ResultCache(
+        max_bytes=1000, sizeof=lambda x: x.nbytes, ttl=0.01
+    )
+    cache.put("a", np.zeros(10, dtype=np.uint32))
+    assert cache.get("a") is not None
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.info().expirations == 1
+
+
+@pytest.mark.parametrize("leaf_cache_engine", [ExecutorType.PREFILTERING], indirect=True)
+def test_leaf_cache_reuse(leaf_cache_engine: Engine) -> None:
+    leaf_cache_engine.clear_cache()
+
+    # The unfiltered percentile result is cached by the first query and then reused with the
+    # histogram filter that the prefiltering executor builds from the keyword result
+    unfiltered, _ = leaf_cache_engine.execute("col(pp(0.9;ge;1000000))")
+    filtered, _ = leaf_cache_engine.execute("kw('data') AND col(pp(0.9;ge;1000000))")
+    assert set(unfiltered) == {1, 2}
+    assert set(filtered) == {1, 2}
+
+    operator_info = leaf_cache_engine.cache_info().leaf_cache_operators
+    assert operator_info["percentile_op"].hits == 1
+    assert operator_info["percentile_op"].misses == 1
+    assert operator_info["keyword_op"].misses == 1
+
+
+def test_result_cache_skips_outdated_results(
+    default_engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    executor = default_engine.executor
+    indices = (executor.tantivy_index, executor.fainder_index, executor.hnsw_index)
+    engine = Engine(*indices, metadata=executor.metadata)
+    query = "kw('germany')"
+
+    # The indices are updated while the query is running
+    execute = engine.executor.execute
+
+    def execute_during_update(plan: "QueryPlan", ctx: "ExecutionContext") -> "DocResult":
+        result = execute(plan, ctx)
+        engine.update_indices(*indices, metadata=executor.metadata)
+        return result
+
+    monkeypatch.setattr(engine.executor, "execute", execute_during_update)
+    expected, _ = engine.execute(query)
+
+    # The result that was computed on the outdated indices is not reused
+    misses = engine.cache_info().result_cache.misses
+    assert engine.execute(query)[0] == expected
+    assert engine.cache_info().result_cache.misses == misses + 1
+
+
+def test_update_indices_swaps_components(
+    default_engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    executor = default_engine.executor
+    indices = (executor.tantivy_index, executor.fainder_index, executor.hnsw_index)
+    engine = Engine(*indices, metadata=executor.metadata)
+    query = "kw('germany') AND col(pp(0.5;ge;20.0))"
+    plan = engine.plan(query)
+    previous = engine.executor, engine.batch_executor, engine.statistics, engine.optimizer
+
+    # Queries that run while the new components are created still see all previous components
+    create_components = engine._create_components  # noqa: SLF001
+
+    def create_components_during_query(*args: object, **kwargs: object) -> object:
+        components = create_components(*args, **kwargs)  # type: ignore[arg-type]
+        current = engine.executor, engine.batch_executor, engine.statistics, engine.optimizer
+        assert current == previous
+        assert engine.plan(query) is plan
+        return components
+
+    monkeypatch.setattr(engine, "_create_components", create_components_during_query)
+    engine.update_indices(*indices, metadata=executor.metadata)
+
+    assert engine.index_generation == 1
+    assert engine.executor.index_generation == 1
+    assert engine.batch_executor.index_generation == 1
+    assert engine.statistics is not previous[2]
+    assert engine.optimizer is not previous[3]
+    # Plans that were optimized with the previous statistics are not reused
+    assert engine.plan(query) is not plan
+
+
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_plan_cache_reuse(engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    query = "kw('germany') AND col(name('age'; 0) OR pp(0.5;ge;20.0))"
+    plan = engine.plan(query)
+    hits = engine.cache_info().plan_cache.hits
+
+    # Cached plans are executed repeatedly, including after cache clears, without being modified
+    for _ in range(3):
+        engine.clear_cache()
+        expected, _ = engine.execute(query)
+        assert engine.plan(query) is plan
+        assert plan.root.canonical == plan.canonical
+        # Result cache misses due to another Fainder mode reuse the plan as well
+        engine.execute(query, fainder_mode=FainderMode.FULL_PRECISION)
+    assert engine.cache_info().plan_cache.hits > hits
+
+    engine.clear_cache()
+    assert engine.execute(query)[0] == expected
+
+
+@pytest.mark.parametrize(
+    "leaf_cache_engine",
+    [
+        ExecutorType.SIMPLE,
+        ExecutorType.PREFILTERING,
+        ExecutorType.THREADED,
+        ExecutorType.THREADED_PREFILTERING,
+    ],
+    indirect=True,
+)
+@pytest.mark.parametrize("enable_highlighting", [False, True])
+def test_refinement_reuse(leaf_cache_engine: Engine, enable_highlighting: bool) -> None:
+    engine = leaf_cache_engine
+    result_cache = engine.result_cache
+    # Each query refines the previous one, whose operands are not evaluated again
+    refinements = [
+        ("kw('germany')", []),
+        ("kw('germany') AND col(pp(0.5;ge;20))", ["keyword_op"]),
+        (
+            "kw('germany') AND col(pp(0.5;ge;20)) AND col(name('age';0))",
+            ["keyword_op", "percentile_op"],
+        ),
+    ]
+    try:
+        engine.clear_cache()
+        expected = [
+            engine.execute(query, enable_highlighting=enable_highlighting)
+            for query, _ in refinements
+        ]
+
+        engine.result_cache = ResultCache(max_bytes=2**20, sizeof=query_result_nbytes)
+        engine.clear_cache()
+        for (query, reused_operators), expected_result in zip(refinements, expected, strict=True):
+            operator_info = engine.cache_info().leaf_cache_operators
+            # Results are equal in ranked order, so the scores of the cached query are kept
+            doc_ids, (doc_highlights, col_highlights) = engine.execute(
+                query, enable_highlighting=enable_highlighting
+            )
+            assert doc_ids == expected_result[0]
+            assert doc_highlights == expected_result[1][0]
+            assert col_highlights.tolist() == expected_result[1][1].tolist()
+
+            new_operator_info = engine.cache_info().leaf_cache_operators
+            for operator in reused_operators:
+                assert new_operator_info[operator] == operator_info[operator]
+    finally:
+        engine.result_cache = result_cache
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pytest
+
+from .assets.test_cases_executor import EXECUTOR_CASES
+
+if TYPE_CHECKING:
+    from backend.engine import Engine
+
+QUERIES = [case["query"] for cases in EXECUTOR_CASES.values() for case in cases.values()]
+
+
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_concurrent_queries(engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    expected = [engine.execute(query, enable_highlighting=True) for query in QUERIES]
+
+    # Run every query several times from multiple threads on the same engine
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(
+            pool.map(lambda query: engine.execute(query, enable_highlighting=True), QUERIES * 4)
+        )
+
+    for i, (doc_ids, (doc_highlights, col_highlights)) in enumerate(results):
+        exp_doc_ids, (exp_doc_highlights, exp_col_highlights) = expected[i % len(QUERIES)]
+        assert doc_ids == exp_doc_ids, QUERIES[i % len(QUERIES)]
+        assert doc_highlights == exp_doc_highlights
+        assert col_highlights.tolist() == exp_col_highlights.tolist()
@@ -1,10 +1,16 @@
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from loguru import logger
 
-from backend.config import FainderMode
-from backend.engine import Engine, Optimizer
+from backend.config import ExecutorType, FainderMode
+from backend.engine import Engine, Optimizer, Parser
+from backend.engine.execution.auto_executor import MIN_HISTS, AutoExecutor
+from backend.engine.execution.threaded_executor import ThreadedExecutor
+from backend.engine.execution.threaded_prefiltering_executor import ThreadedPrefilteringExecutor
+from backend.engine.plan import PercentileOp, compile_plan
 
 from .assets.test_cases_executor import EXECUTOR_CASES, ExecutorCase
 
@@ -101,3 +107,287 @@ def test_execute(
     assert set(small_fainder_exact_result) == set(expected_result), (
         f"Small Fainder exact result: {small_fainder_exact_result}, Expected: {expected_result}"
     )
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "col(pp(0.5;ge;10) AND pp(0.5;le;2000))",
+        "col(pp(0.5;gt;10) AND pp(0.5;gt;100) AND pp(0.9;lt;100000) AND pp(0.5;lt;5000))",
+        "kw('germany') AND col(name('age';0) AND pp(0.5;ge;20) AND pp(0.5;le;50))",
+        "col(pp(0.5;ge;2000) AND pp(0.5;le;10))",
+    ],
+)
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_percentile_fusion(query: str, engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    optimizer = engine.optimizer
+    try:
+        engine.optimizer = Optimizer(predicate_fusion=False)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        expected, _ = engine.execute(query)
+
+        engine.optimizer = Optimizer(predicate_fusion=True)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        plan = engine.plan(query)
+        assert any(
+            isinstance(op, PercentileOp) and op.upper_bound is not None for op in plan.operators
+        )
+        assert set(engine.execute(query)[0]) == set(expected)
+    finally:
+        engine.optimizer = optimizer
+        engine.plan_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "(kw('germany') AND col(name('age';0))) OR (kw('germany') AND col(pp(0.5;ge;20)))",
+        "col(name('age';0) AND pp(0.5;ge;20)) OR "
+        "(kw('germany') AND col(pp(0.5;ge;20) AND name('age';0)))",
+    ],
+)
+@pytest.mark.parametrize("engine_name", ["default_engine", "parallel_engine"])
+def test_shared_subplans(query: str, engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    prefiltering_engine: Engine = request.getfixturevalue("prefiltering_engine")
+    optimizer = engine.optimizer
+    try:
+        engine.optimizer = Optimizer()
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        plan = engine.plan(query)
+        assert any(op.shared for op in plan.operators)
+
+        # Each distinct leaf is only evaluated for its first occurrence
+        node, result = engine.explain(query, analyze=True)
+        assert result is not None
+        nodes = [node]
+        evaluated: list[tuple[str, tuple[str, ...]]] = []
+        while nodes:
+            current = nodes.pop()
+            nodes.extend(current.children)
+            if not current.children and current.wall_time is not None:
+                evaluated.append((current.operator, tuple(current.arguments)))
+        assert len(evaluated) == len(set(evaluated))
+
+        # The prefiltering executor evaluates each occurrence, with the same results and scores
+        expected = prefiltering_engine.execute(query)[0]
+        assert engine.execute(query)[0] == expected
+    finally:
+        engine.optimizer = optimizer
+        engine.plan_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "kw('germany') AND kw('germany')",
+        "col(pp(0.5;ge;20)) AND kw('germany') AND kw('germany')",
+        "kw('germany') OR (kw('germany') AND col(name('age';0)))",
+        "(kw('germany') OR kw('data')) AND (kw('data') OR kw('germany'))",
+    ],
+)
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_duplicate_scores(query: str, engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    optimizer = engine.optimizer
+    try:
+        # Without duplicate elimination, each occurrence of a predicate is evaluated
+        engine.optimizer = Optimizer(keyword_merging=False, subexpression_elimination=False)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        expected = engine.execute_ranked(query).ranking
+
+        engine.optimizer = Optimizer(keyword_merging=False, subexpression_elimination=True)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        ranking = engine.execute_ranked(query).ranking
+        assert ranking.doc_ids.tolist() == expected.doc_ids.tolist()
+        assert ranking.scores.tolist() == pytest.approx(expected.scores.tolist())
+        assert len(expected.doc_ids) > 0
+    finally:
+        engine.optimizer = optimizer
+        engine.plan_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "NOT kw('germany')",
+        "col(NOT pp(0.5;ge;2000))",
+        "col(name('age';0) AND NOT pp(0.5;ge;20))",
+        "col(NOT name('age';0) OR pp(0.5;ge;20))",
+        "kw('germany') AND NOT col(name('age';0))",
+        "NOT (kw('germany') OR col(pp(0.5;ge;20)))",
+        "NOT (kw('germany') AND NOT col(name('age';0)))",
+    ],
+)
+@pytest.mark.parametrize("engine_name", ["default_engine", "parallel_engine"])
+@pytest.mark.parametrize("enable_highlighting", [False, True])
+def test_lazy_complements(
+    query: str, engine_name: str, enable_highlighting: bool, request: pytest.FixtureRequest
+) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    prefiltering_engine: Engine = request.getfixturevalue("prefiltering_engine")
+    engine.clear_cache()
+    prefiltering_engine.clear_cache()
+
+    # The prefiltering executor materializes all complements
+    expected, (expected_doc_highlights, expected_col_highlights) = prefiltering_engine.execute(
+        query, enable_highlighting=enable_highlighting
+    )
+    result, (doc_highlights, col_highlights) = engine.execute(
+        query, enable_highlighting=enable_highlighting
+    )
+    assert result == expected
+    assert doc_highlights == expected_doc_highlights
+    assert col_highlights.tolist() == expected_col_highlights.tolist()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "col(NOT pp(0.5;ge;2000))",
+        "col(name('age';0) AND NOT pp(0.5;ge;20))",
+        "kw('germany') AND col(NOT pp(0.5;lt;20) AND NOT pp(0.9;gt;100))",
+        "col(NOT (pp(0.5;ge;20) OR name('age';0)))",
+    ],
+)
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_percentile_inversion(
+    query: str, engine_name: str, request: pytest.FixtureRequest
+) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    optimizer = engine.optimizer
+    try:
+        engine.optimizer = Optimizer(percentile_inversion=False)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        expected, (_, expected_col_highlights) = engine.execute(query)
+
+        engine.optimizer = Optimizer(percentile_inversion=True)
+        engine.clear_cache()
+        engine.plan_cache.clear()
+        plan = engine.plan(query)
+        assert any(isinstance(op, PercentileOp) and op.inverted for op in plan.operators)
+        result, (_, col_highlights) = engine.execute(query)
+        assert set(result) == set(expected)
+        assert set(col_highlights.tolist()) == set(expected_col_highlights.tolist())
+    finally:
+        engine.optimizer = optimizer
+        engine.plan_cache.clear()
+
+
+@pytest.mark.parametrize(
+    ("category", "test_name", "test_case"),
+    [(cat, name, case) for cat, cases in EXECUTOR_CASES.items() for name, case in cases.items()],
+)
+def test_auto_executor(
+    category: str,
+    test_name: str,
+    test_case: ExecutorCase,
+    auto_engine: Engine,
+    prefiltering_engine: Engine,
+) -> None:
+    query = test_case["query"]
+    expected, _ = prefiltering_engine.execute(query)
+    result, _ = auto_engine.execute(query)
+    assert set(result) == set(expected)
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("kw('germany') AND col(name('age';0))", ExecutorType.SIMPLE),
+        ("col(pp(0.5;ge;20))", ExecutorType.SIMPLE),
+        ("col(pp(0.5;ge;20) AND pp(0.9;le;1000))", ExecutorType.THREADED),
+        ("kw('germany') AND col(pp(0.5;ge;20))", ExecutorType.PREFILTERING),
+        (
+            "kw('germany') AND col(pp(0.5;ge;20)) AND col(pp(0.9;le;1000))",
+            ExecutorType.THREADED_PREFILTERING,
+        ),
+        # Predicates below a negation never filter histograms
+        ("NOT kw('germany') AND col(pp(0.5;ge;20))", ExecutorType.SIMPLE),
+    ],
+)
+def test_auto_executor_selection(query: str, expected: ExecutorType, auto_engine: Engine) -> None:
+    executor = auto_engine.executor
+    assert isinstance(executor, AutoExecutor)
+    ctx = executor.create_context(FainderMode.LOW_MEMORY)
+    try:
+        assert executor.select(auto_engine.plan(query), ctx) == expected
+    finally:
+        executor.score_pool.release(ctx.scores)
+
+
+def test_auto_executor_small_index(auto_engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    executor = auto_engine.executor
+    assert isinstance(executor, AutoExecutor)
+    monkeypatch.setattr(executor, "min_hists", MIN_HISTS)
+    assert executor.metadata.num_hists < MIN_HISTS
+    ctx = executor.create_context(FainderMode.LOW_MEMORY)
+    query = "kw('germany') AND col(pp(0.5;ge;20)) AND col(pp(0.9;le;1000))"
+    try:
+        assert executor.select(auto_engine.plan(query), ctx) == ExecutorType.SIMPLE
+    finally:
+        executor.score_pool.release(ctx.scores)
+
+
+def test_auto_executor_shared_thread_pool(auto_engine: Engine) -> None:
+    executor = auto_engine.executor
+    assert isinstance(executor, AutoExecutor)
+    threaded = executor.executors[ExecutorType.THREADED]
+    threaded_prefiltering = executor.executors[ExecutorType.THREADED_PREFILTERING]
+    assert isinstance(threaded, ThreadedExecutor)
+    assert isinstance(threaded_prefiltering, ThreadedPrefilteringExecutor)
+    assert threaded._thread_pool is threaded_prefiltering._thread_pool  # noqa: SLF001
+
+
+def test_threaded_prefiltering_saturated_pool(
+    parallel_prefiltering_engine: Engine, parser: Parser
+) -> None:
+    engine_executor = parallel_prefiltering_engine.executor
+    executor = ThreadedPrefilteringExecutor(
+        tantivy_index=engine_executor.tantivy_index,
+        fainder_index=engine_executor.fainder_index,
+        hnsw_index=engine_executor.hnsw_index,
+        metadata=engine_executor.metadata,
+        max_workers=1,
+    )
+    query = "col(pp(0.5;ge;0.75) AND name('AveragePrice'; 0))"
+    # Without reordering, the percentile predicate comes before the name predicate that filters
+    # its histograms
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=False, canonicalization=False)
+    plan = compile_plan(optimizer.optimize(parser.parse(query)))
+    assert [op.name for op in plan.operators][-2:] == ["percentile_op", "name_op"]
+    ctx = executor.create_context(FainderMode.LOW_MEMORY)
+
+    # Occupy the only worker until both predicates are queued
+    release = threading.Event()
+    executor._thread_pool.submit(release.wait)  # noqa: SLF001
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(executor.execute, plan, ctx)
+        try:
+            result, _ = future.result(timeout=10)
+        finally:
+            # Cancel the queued predicates so that a deadlocked execution terminates
+            executor._thread_pool.shutdown(wait=False, cancel_futures=True)  # noqa: SLF001
+            timer.cancel()
+
+    expected, _ = parallel_prefiltering_engine.execute(query)
+    assert len(expected) > 0
+    assert set(result) == set(expected)
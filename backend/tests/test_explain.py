@@ -0,0 +1,102 @@
+from typing import TYPE_CHECKING
+
+import pytest
+
+from backend.config import FainderMode, PlanNode
+from backend.engine.execution.context import QueryProfile
+from backend.engine.plan import KeywordOp, NameOp, PercentileOp, compile_plan
+
+if TYPE_CHECKING:
+    from backend.engine import Engine, Parser
+
+QUERY = "kw('germany') AND col(name('age'; 0) AND pp(0.5;ge;20.0))"
+
+
+def _nodes(plan: PlanNode) -> list[PlanNode]:
+    return [plan, *(node for child in plan.children for node in _nodes(child))]
+
+
+def test_explain_without_analyze(default_engine: "Engine") -> None:
+    plan, result = default_engine.explain(QUERY)
+
+    assert result is None
+    assert plan.operator == "query"
+    operators = {node.operator for node in _nodes(plan)}
+    assert {"keyword_op", "col_op", "name_op", "percentile_op"} <= operators
+    assert all(node.wall_time is None for node in _nodes(plan))
+    assert next(n for n in _nodes(plan) if n.operator == "percentile_op").arguments == [
+        "0.5",
+        "ge",
+        "20.0",
+    ]
+
+
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+def test_explain_analyze(engine_name: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    engine.clear_cache()
+    expected, _ = engine.execute(QUERY)
+
+    plan, result = engine.explain(QUERY, analyze=True)
+
+    assert result is not None
+    assert len(result.ranking) == len(expected)
+    assert plan.output_cardinality == len(expected)
+    for node in _nodes(plan):
+        assert node.wall_time is not None, node.operator
+        assert node.wall_time >= 0
+        assert node.output_cardinality is not None, node.operator
+        assert node.input_cardinalities == [child.output_cardinality for child in node.children]
+        # Percentile predicates with an empty histogram filter skip the index lookup
+        if node.operator in {"keyword_op", "name_op", "percentile_op"} and (
+            node.hist_filter_size != 0
+        ):
+            assert node.cache_hit is not None
+
+    percentile_node = next(n for n in _nodes(plan) if n.operator == "percentile_op")
+    if engine_name in {"prefiltering_engine", "parallel_prefiltering_engine"}:
+        assert plan.write_group == 0
+        assert all(node.read_groups is not None for node in _nodes(plan))
+    else:
+        assert percentile_node.hist_filter_size is None
+        assert all(node.write_group is None for node in _nodes(plan))
+
+
+@pytest.mark.parametrize("analyze", [False, True])
+def test_explain_auto_executor(auto_engine: "Engine", analyze: bool) -> None:
+    # The result groups are reported if the plan is dispatched to a prefiltering executor
+    plan, _ = auto_engine.explain(QUERY, analyze=analyze)
+    assert plan.write_group == 0
+    assert all(node.read_groups is not None for node in _nodes(plan))
+
+    plan, _ = auto_engine.explain("kw('germany') AND col(name('age'; 0))", analyze=analyze)
+    assert all(node.write_group is None for node in _nodes(plan))
+
+
+def test_explain_analyze_reports_cache_hits(leaf_cache_engine: "Engine") -> None:
+    leaf_cache_engine.clear_cache()
+    plan, _ = leaf_cache_engine.explain(QUERY, analyze=True)
+    assert all(node.cache_hit is False for node in _nodes(plan) if node.cache_hit is not None)
+
+    plan, _ = leaf_cache_engine.explain(QUERY, analyze=True)
+    assert all(node.cache_hit is True for node in _nodes(plan) if node.cache_hit is not None)
+
+
+def test_threaded_leaf_statistics(parallel_engine: "Engine", parser: "Parser") -> None:
+    parallel_engine.clear_cache()
+    plan = compile_plan(parser.parse(QUERY))
+    ctx = parallel_engine.executor.create_context(FainderMode.LOW_MEMORY)
+    ctx.profile = QueryProfile(len(plan.operators))
+    executor = parallel_engine.executor.bind(ctx)
+
+    # The statistics of a leaf are complete as soon as its future is resolved
+    for op in plan.operators:
+        if isinstance(op, KeywordOp | NameOp | PercentileOp):
+            future = getattr(executor, op.name)(op)
+            future.result()
+            stats = ctx.profile.stats(op)
+            assert stats.wall_time is not None, op.name
+            assert stats.output_cardinality is not None, op.name
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from backend.config import FainderMode
+from backend.engine import Engine, Parser
+from backend.engine.constants import FILTERING_STOP_POINTS
+from backend.engine.execution.context import QueryProfile
+from backend.engine.feedback import RuntimeCostModel
+from backend.engine.plan import KeywordOp, NameOp, PercentileOp, QueryPlan, compile_plan
+
+if TYPE_CHECKING:
+    from backend.engine.plan import Operator
+
+QUERY = "kw('germany') AND col(name('age'; 0) AND pp(0.5;ge;20.0))"
+
+
+def _profile(
+    plan: QueryPlan, latencies: dict[str, float], hist_filter_size: int | None = None
+) -> QueryProfile:
+    profile = QueryProfile(len(plan.operators))
+    for op in plan.operators:
+        if isinstance(op, KeywordOp | NameOp | PercentileOp):
+            stats = profile.stats(op)
+            stats.wall_time = latencies[op.name]
+            stats.output_cardinality = 10
+            if isinstance(op, PercentileOp):
+                stats.hist_filter_size = hist_filter_size
+    return profile
+
+
+@pytest.fixture
+def plan(parser: Parser) -> QueryPlan:
+    return compile_plan(parser.parse(QUERY))
+
+
+def test_leaf_costs(plan: QueryPlan) -> None:
+    cost_model = RuntimeCostModel(min_observations=3)
+    latencies = {"keyword_op": 0.001, "name_op": 0.002, "percentile_op": 0.1}
+    for _ in range(2):
+        cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert cost_model.leaf_costs(FainderMode.EXACT, "default") is None
+
+    cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert cost_model.leaf_costs(FainderMode.EXACT, "default") == {
+        "keyword_op": 1,
+        "name_op": 2,
+        "percentile_op": 128,
+    }
+    # Percentile predicates are learned per Fainder mode
+    assert cost_model.leaf_costs(FainderMode.LOW_MEMORY, "default") is None
+
+
+def test_cache_hits_are_ignored(plan: QueryPlan) -> None:
+    cost_model = RuntimeCostModel()
+    profile = _profile(plan, {"keyword_op": 0.1, "name_op": 0.1, "percentile_op": 0.1})
+    for stats in profile.operators:
+        stats.cache_hit = True
+    cost_model.record(plan, profile, FainderMode.LOW_MEMORY, "default")
+
+    assert cost_model.info().operators == []
+
+
+def test_stop_points(plan: QueryPlan) -> None:
+    cost_model = RuntimeCostModel(min_observations=1)
+    latencies = {"keyword_op": 0.001, "name_op": 0.001, "percentile_op": 0.5}
+    cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert (
+        cost_model.stop_points(FainderMode.EXACT, "default")
+        == (FILTERING_STOP_POINTS[FainderMode.EXACT])
+    )
+
+    # Filtering 1000 histograms takes a tenth of a search over all histograms
+    latencies["percentile_op"] = 0.05
+    cost_model.record(plan, _profile(plan, latencies, 1000), FainderMode.EXACT, "default")
+    stop_points = cost_model.stop_points(FainderMode.EXACT, "default")
+    assert stop_points["num_col_ids"] == pytest.approx(10000, abs=1)
+    assert stop_points["num_hist_ids"] == stop_points["num_col_ids"]
+    assert stop_points["num_doc_ids"] == FILTERING_STOP_POINTS[FainderMode.EXACT]["num_doc_ids"]
+
+
+def test_persistence(plan: QueryPlan, tmp_path: Path) -> None:
+    path = tmp_path / "cost_model.json"
+    cost_model = RuntimeCostModel(path, min_observations=1, save_interval=2)
+    latencies = {"keyword_op": 0.001, "name_op": 0.002, "percentile_op": 0.1}
+    cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert not path.exists()
+    cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert path.exists()
+
+    restored = RuntimeCostModel(path, min_observations=1)
+    assert restored.info() == cost_model.info()
+    assert restored.leaf_costs(FainderMode.EXACT, "default") == cost_model.leaf_costs(
+        FainderMode.EXACT, "default"
+    )
+
+
+def test_concurrent_persistence(plan: QueryPlan, tmp_path: Path) -> None:
+    path = tmp_path / "cost_model.json"
+    cost_model = RuntimeCostModel(path, min_observations=1, save_interval=1)
+    latencies = {"keyword_op": 0.001, "name_op": 0.002, "percentile_op": 0.1}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [
+            pool.submit(
+                cost_model.record, plan, _profile(plan, latencies), FainderMode.EXACT, "default"
+            )
+            for _ in range(64)
+        ]:
+            future.result()
+
+    assert RuntimeCostModel(path, min_observations=1).info() == cost_model.info()
+    # No temporary files are left behind
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_failed_persistence(plan: QueryPlan, tmp_path: Path) -> None:
+    path = tmp_path / "missing" / "cost_model.json"
+    cost_model = RuntimeCostModel(path, min_observations=1, save_interval=1)
+    latencies = {"keyword_op": 0.001, "name_op": 0.002, "percentile_op": 0.1}
+    # Recording a query never fails because its costs cannot be persisted
+    cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert cost_model.leaf_costs(FainderMode.EXACT, "default") is not None
+
+    with pytest.raises(FileNotFoundError):
+        cost_model.save()
+
+
+def test_learned_costs_reorder_plans(default_engine: Engine) -> None:
+    executor = default_engine.executor
+    engine = Engine(
+        tantivy_index=executor.tantivy_index,
+        fainder_index=executor.fainder_index,
+        hnsw_index=executor.hnsw_index,
+        metadata=executor.metadata,
+        cache_max_bytes=0,
+        leaf_cache_max_bytes=0,
+        cost_model=RuntimeCostModel(min_observations=2),
+    )
+    query = "col(name('age'; 0) AND pp(0.5;ge;20.0))"
+
+    def leaf_order(plan: QueryPlan) -> list[str]:
+        leaves: list[Operator] = [op for op in plan.operators if not op.children]
+        return [op.name for op in leaves]
+
+    expected, _ = engine.execute(query)
+    assert leaf_order(engine.plan(query)) == ["name_op", "percentile_op"]
+    for _ in range(2):
+        assert engine.execute(query, fainder_mode=FainderMode.EXACT)[0] == expected
+
+    info = engine.cost_info()
+    assert info.enabled
+    assert {operator.operator for operator in info.operators} >= {"name_op", "percentile_op"}
+
+    # Plans are optimized with the learned costs once all operators have been observed often
+    # enough, and still return the same results
+    assert engine.cost_model is not None
+    plan = engine.plan(QUERY)
+    latencies = {"keyword_op": 1.0, "name_op": 1.0, "percentile_op": 1e-6}
+    for _ in range(2):
+        engine.cost_model.record(plan, _profile(plan, latencies), FainderMode.EXACT, "default")
+    assert leaf_order(engine.plan(query, FainderMode.EXACT)) == ["percentile_op", "name_op"]
+    assert engine.execute(query, fainder_mode=FainderMode.EXACT)[0] == expected
@@ -1,6 +1,8 @@
 import pytest
 
+from backend.config import FieldHighlight
 from backend.engine import Engine
+from backend.engine.highlighting import merge_field_highlights, render_field, render_highlights
 from backend.engine.optimizer import Optimizer
 
 from .assets.test_cases_highlighting import HIGHLIGHTING_CASES, HighlightingCase
@@ -17,3 +19,62 @@ def test_highlighter(test_name: str, test_case: HighlightingCase, default_engine
     assert highlights[0] == test_case["expected"][0]
     # Compare ColumnHighlights
     assert highlights[1].all() == test_case["expected"][1].all()
+
+
+def test_merge_field_highlights() -> None:
+    text = "weather data and climate data"
+    left = {"name": FieldHighlight(text, ((0, 7), (25, 29)))}
+    right = {
+        "name": FieldHighlight(text, ((5, 12), (17, 25))),
+        "description": FieldHighlight("data", ((0, 4),)),
+    }
+
+    merged = merge_field_highlights(left, right)
+    # The merge unites overlapping and adjacent spans and does not depend on the operand order
+    assert merged == merge_field_highlights(right, left)
+    assert merged["name"].spans == ((0, 12), (17, 29))
+    assert (
+        render_field(merged["name"]) == "<mark>weather data</mark> and <mark>climate data</mark>"
+    )
+    assert render_field(merged["description"]) == "<mark>data</mark>"
+    # Marks are only placed at the spans, not at every occurrence of a marked word
+    assert render_field(FieldHighlight("data database", ((0, 4),))) == "<mark>data</mark> database"
+
+
+def test_highlighter_operand_order(default_engine: Engine) -> None:
+    default_engine.optimizer = Optimizer(cost_sorting=False, keyword_merging=False)
+    queries = ["kw('weather') AND kw('data')", "kw('data') AND kw('weather')"]
+    highlights = [default_engine.execute(query, enable_highlighting=True)[1] for query in queries]
+
+    assert highlights[0][0]
+    assert highlights[0][0] == highlights[1][0]
+
+
+@pytest.mark.parametrize(
+    "engine_name",
+    ["default_engine", "prefiltering_engine", "parallel_engine", "parallel_prefiltering_engine"],
+)
+@pytest.mark.parametrize(
+    "query",
+    [
+        "kw('data')",
+        "kw('data') AND col(pp(0.1;ge;1))",
+        "col(pp(0.1;ge;1)) OR kw('weather')",
+        "kw('data') AND NOT kw('weather')",
+        "col(name('age';0) OR NOT pp(0.5;ge;20))",
+    ],
+)
+def test_page_highlighting(engine_name: str, query: str, request: pytest.FixtureRequest) -> None:
+    engine: Engine = request.getfixturevalue(engine_name)
+    doc_ids, (doc_highlights, col_highlights) = engine.execute(query, enable_highlighting=True)
+    col_to_doc = engine.highlighting_executor.metadata.col_to_doc
+
+    for page in [doc_ids[:1], doc_ids[1:], doc_ids]:
+        page_doc_highlights, page_col_highlights = engine.highlight(query, page)
+        # Only the documents of the page are highlighted, exactly like in a highlighted execution
+        assert render_highlights(page_doc_highlights) == {
+            doc_id: fields for doc_id, fields in doc_highlights.items() if doc_id in page
+        }
+        assert page_col_highlights.tolist() == [
+            col_id for col_id in col_highlights.tolist() if col_to_doc[col_id] in page
+        ]
@@ -2,7 +2,8 @@ from copy import deepcopy
 
 import pytest
 
-from backend.engine import Optimizer
+from backend.engine import Optimizer, Parser
+from backend.engine.optimizer import canonical_form
 
 from .assets.test_cases_optimizer import OPTIMIZER_CASES, OptimizerCase
 
@@ -11,7 +12,7 @@ from .assets.test_cases_optimizer import OPTIMIZER_CASES, OptimizerCase
     ("test_name", "test_case"), [(name, case) for name, case in OPTIMIZER_CASES.items()]
 )
 def test_cost_sorting(test_name: str, test_case: OptimizerCase) -> None:
-    optimizer = Optimizer(cost_sorting=True, keyword_merging=False)
+    optimizer = Optimizer(cost_sorting=True, keyword_merging=False, canonicalization=False)
     plan = deepcopy(test_case["input_tree"])
 
     assert test_case["cost_sorting"] == optimizer.optimize(plan)
@@ -21,7 +22,7 @@ def test_cost_sorting(test_name: str, test_case: OptimizerCase) -> None:
     ("test_name", "test_case"), [(name, case) for name, case in OPTIMIZER_CASES.items()]
 )
 def test_kw_merging(test_name: str, test_case: OptimizerCase) -> None:
-    optimizer = Optimizer(cost_sorting=False, keyword_merging=True)
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=True, canonicalization=False)
     plan = deepcopy(test_case["input_tree"])
 
     assert test_case["kw_merging"] == optimizer.optimize(plan)
@@ -31,7 +32,120 @@ def test_kw_merging(test_name: str, test_case: OptimizerCase) -> None:
     ("test_name", "test_case"), [(name, case) for name, case in OPTIMIZER_CASES.items()]
 )
 def test_all_rules(test_name: str, test_case: OptimizerCase) -> None:
-    optimizer = Optimizer(cost_sorting=True, keyword_merging=True)
+    optimizer = Optimizer(cost_sorting=True, keyword_merging=True, canonicalization=False)
     plan = deepcopy(test_case["input_tree"])
 
     assert test_case["all_rules"] == optimizer.optimize(plan)
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        (
+            "col(pp(0.5;ge;10) AND pp(0.5;le;20))",
+            "query(col_op(percentile_op(0.5,'ge',10.0,'le',20.0)))",
+        ),
+        ("col(pp(0.5;gt;10) AND pp(0.5;gt;20))", "query(col_op(percentile_op(0.5,'gt',20.0)))"),
+        ("col(pp(0.5;ge;20) AND pp(0.5;gt;20))", "query(col_op(percentile_op(0.5,'gt',20.0)))"),
+        ("col(pp(0.5;lt;5) AND pp(0.5;lt;5))", "query(col_op(percentile_op(0.5,'lt',5.0)))"),
+        (
+            "col(pp(0.5;gt;1) AND name('a';0) AND pp(0.9;le;3) AND pp(0.5;lt;9) AND pp(0.5;ge;2))",
+            "query(col_op(conjunction(name_op('a',0),percentile_op(0.5,'ge',2.0,'lt',9.0),"
+            "percentile_op(0.9,'le',3.0))))",
+        ),
+        # Predicates in different branches of a disjunction or negation are not fused
+        (
+            "col(pp(0.5;ge;1) OR pp(0.5;ge;2))",
+            "query(col_op(disjunction(percentile_op(0.5,'ge',1.0),percentile_op(0.5,'ge',2.0))))",
+        ),
+        (
+            "col(pp(0.5;ge;1) AND NOT pp(0.5;ge;2))",
+            "query(col_op(conjunction(negation(percentile_op(0.5,'ge',2.0)),"
+            "percentile_op(0.5,'ge',1.0))))",
+        ),
+    ],
+)
+def test_percentile_fusion(query: str, expected: str, parser: Parser) -> None:
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=False, percentile_inversion=False)
+    assert canonical_form(optimizer.optimize(parser.parse(query))) == expected
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("col(name('a';0)) AND col(name('a';0))", "query(col_op(name_op('a',0)))"),
+        # Keyword predicates add their scores once per occurrence and are kept
+        ("kw('a') AND kw('a')", "query(conjunction(keyword_op('a'),keyword_op('a')))"),
+        (
+            "col(name('a';0) OR name('a';0) OR name('b';0))",
+            "query(col_op(disjunction(name_op('a',0),name_op('b',0))))",
+        ),
+        (
+            "col(pp(0.5;ge;1.0) AND name('a';0)) OR col(name('a';0) AND pp(0.5;ge;1))",
+            "query(col_op(conjunction(name_op('a',0),percentile_op(0.5,'ge',1.0))))",
+        ),
+        # Identical subtrees under different parents are kept
+        (
+            "(kw('a') AND kw('b')) OR (kw('a') AND kw('c'))",
+            "query(disjunction(conjunction(keyword_op('a'),keyword_op('b')),"
+            "conjunction(keyword_op('a'),keyword_op('c'))))",
+        ),
+    ],
+)
+def test_duplicate_elimination(query: str, expected: str, parser: Parser) -> None:
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=False)
+    assert canonical_form(optimizer.optimize(parser.parse(query))) == expected
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("NOT NOT kw('a')", "query(keyword_op('a'))"),
+        ("NOT NOT NOT kw('a')", "query(negation(keyword_op('a')))"),
+        (
+            "kw('x') AND NOT (kw('a') OR kw('b'))",
+            "query(conjunction(keyword_op('x'),negation(keyword_op('a')),"
+            "negation(keyword_op('b'))))",
+        ),
+        (
+            "kw('x') AND NOT (kw('a') OR NOT (kw('b') AND kw('c')))",
+            "query(conjunction(keyword_op('b'),keyword_op('c'),keyword_op('x'),"
+            "negation(keyword_op('a'))))",
+        ),
+        (
+            "NOT (kw('a') AND kw('b'))",
+            "query(disjunction(negation(keyword_op('a')),negation(keyword_op('b'))))",
+        ),
+        # Negations are not pushed into column operators
+        (
+            "NOT col(NOT (name('a';0) OR pp(0.5;ge;1)))",
+            "query(negation(col_op(conjunction(negation(name_op('a',0)),"
+            "negation(percentile_op(0.5,'ge',1.0))))))",
+        ),
+    ],
+)
+def test_negation_pushdown(query: str, expected: str, parser: Parser) -> None:
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=False, percentile_inversion=False)
+    assert canonical_form(optimizer.optimize(parser.parse(query))) == expected
+
+
+@pytest.mark.parametrize(
+    ("query", "expected"),
+    [
+        ("col(NOT pp(0.5;ge;10))", "query(col_op(percentile_op(0.5,'lt',10.0,'inverted')))"),
+        ("col(NOT pp(0.9;lt;5))", "query(col_op(percentile_op(0.9,'ge',5.0,'inverted')))"),
+        (
+            "col(name('a';0) AND NOT pp(0.5;gt;1))",
+            "query(col_op(conjunction(name_op('a',0),percentile_op(0.5,'le',1.0,'inverted'))))",
+        ),
+        # Negations of other predicates are kept
+        (
+            "col(NOT name('a';0) AND NOT pp(0.5;le;1))",
+            "query(col_op(conjunction(negation(name_op('a',0)),"
+            "percentile_op(0.5,'gt',1.0,'inverted'))))",
+        ),
+    ],
+)
+def test_percentile_inversion(query: str, expected: str, parser: Parser) -> None:
+    optimizer = Optimizer(cost_sorting=False, keyword_merging=False)
+    assert canonical_form(optimizer.optimize(parser.parse(query))) == expected
@@ -0,0 +1,98 @@
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from backend.engine import Optimizer, Parser
+from backend.engine.optimizer import canonical_form
+from backend.engine.plan import (
+    ColumnOp,
+    Comparison,
+    Conjunction,
+    Disjunction,
+    KeywordOp,
+    NameOp,
+    Negation,
+    PercentileOp,
+    Query,
+    compile_plan,
+)
+
+
+def test_compile_plan(parser: Parser) -> None:
+    optimizer = Optimizer(
+        canonicalization=False,
+        cost_sorting=False,
+        keyword_merging=False,
+        percentile_inversion=False,
+    )
+    tree = optimizer.optimize(
+        parser.parse("kw('germany') AND col(name('age'; 2) OR NOT pp(0.5;ge;20.0))")
+    )
+    plan = compile_plan(tree)
+
+    assert plan.canonical == canonical_form(tree)
+    assert [op.id for op in plan.operators] == list(range(len(plan.operators)))
+    assert all(plan.operators[op.id] is op for op in plan.operators)
+
+    root = plan.root
+    assert isinstance(root, Query)
+    conjunction = root.children[0]
+    assert isinstance(conjunction, Conjunction)
+    assert not conjunction.columns
+    keyword, col_op = conjunction.children
+    assert isinstance(keyword, KeywordOp)
+    assert keyword.query == "germany"
+    assert isinstance(col_op, ColumnOp)
+
+    disjunction = col_op.children[0]
+    assert isinstance(disjunction, Disjunction)
+    assert disjunction.columns
+    name_op, negation = disjunction.children
+    assert isinstance(name_op, NameOp)
+    assert (name_op.column, name_op.k) == ("age", 2)
+    assert isinstance(negation, Negation)
+    assert negation.columns
+
+    percentile_op = negation.children[0]
+    assert isinstance(percentile_op, PercentileOp)
+    assert percentile_op.percentile == 0.5  # noqa: PLR2004
+    assert percentile_op.comparison is Comparison.GE
+    assert percentile_op.reference == 20.0  # noqa: PLR2004
+    assert percentile_op.arguments() == ["0.5", "ge", "20.0"]
+
+
+def test_compile_plan_result_groups(parser: Parser) -> None:
+    plan = compile_plan(parser.parse("kw('a') AND (kw('b') OR col(pp(0.5;ge;20.0)))"))
+
+    assert plan.root.write_group == 0
+    assert plan.parent_write_group[0] == 0
+    disjunction = next(op for op in plan.operators if isinstance(op, Disjunction))
+    for child in disjunction.children:
+        assert child.write_group != disjunction.write_group
+        assert child.parent_write_group == disjunction.write_group
+        assert child.read_groups == (child.write_group, *disjunction.read_groups)
+
+    # Each read group of a percentile predicate counts as one use of the group
+    percentile_op = next(op for op in plan.operators if isinstance(op, PercentileOp))
+    assert all(plan.write_groups_used[group] >= 1 for group in percentile_op.read_groups)
+
+
+def test_plan_is_immutable(parser: Parser) -> None:
+    plan = compile_plan(Optimizer().optimize(parser.parse("kw('a') AND col(name('age'; 0))")))
+
+    with pytest.raises(FrozenInstanceError):
+        plan.root.children = ()  # type: ignore[misc]
+    with pytest.raises(TypeError):
+        plan.parent_write_group[0] = 1  # type: ignore[index]
+    assert not hasattr(plan.root, "__dict__")
+
+
+def test_compile_plan_shared_subplans(parser: Parser) -> None:
+    query = "kw('a') OR (kw('b') AND col(name('age';0) AND pp(0.5;ge;20))) OR col(pp(0.5;ge;20))"
+    plan = compile_plan(parser.parse(query))
+
+    keyword_ops = [op for op in plan.operators if isinstance(op, KeywordOp)]
+    assert [op.occurrences for op in keyword_ops] == [1, 1]
+    percentile_ops = [op for op in plan.operators if isinstance(op, PercentileOp)]
+    assert [op.occurrences for op in percentile_ops] == [2, 2]
+    assert all(op.shared == (op.occurrences > 1) for op in plan.operators)
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.config import QueryPoolFullError
+from backend.query_pool import QueryPool
+
+
+def test_query_pool_rejects_when_full() -> None:
+    pool = QueryPool(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+
+    async def _run() -> None:
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: 42))
+        await asyncio.sleep(0.05)
+
+        info = pool.info()
+        assert info.running == 1
+        assert info.queued == 1
+        with pytest.raises(QueryPoolFullError):
+            await pool.run(lambda: 0)
+
+        release.set()
+        assert (await running).value is True
+        result = await queued
+        assert result.value == 42  # noqa: PLR2004
+        assert result.queue_time > 0
+
+        # Slots are freed once tasks finish
+        assert (await pool.run(lambda: 1)).value == 1
+
+    asyncio.run(_run())
+    info = pool.info()
+    assert info.rejected == 1
+    assert info.running == 0
+    assert info.queued == 0
+    pool.shutdown()
+
+
+def test_query_pool_propagates_errors() -> None:
+    pool = QueryPool(max_workers=1, max_queue_size=0)
+
+    def _fail() -> None:
+        raise ValueError("failure")
+
+    with pytest.raises(ValueError, match="failure"):
+        asyncio.run(pool.run(_fail))
+    assert pool.info().queued == 0
+    pool.shutdown()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from backend.engine.execution.context import ScoreAccumulatorPool
+from backend.engine.ranking import Ranking
+
+
+def _reference_ranking(doc_ids: list[int], scores: list[float]) -> list[int]:
+    order = sorted(range(len(doc_ids)), key=lambda i: scores[i], reverse=True)
+    return [doc_ids[i] for i in order]
+
+
+@pytest.mark.parametrize("num_docs", [0, 1, 10, 1000])
+@pytest.mark.parametrize("num_distinct_scores", [1, 5, 1000])
+def test_ranking_matches_stable_sort(num_docs: int, num_distinct_scores: int) -> None:
+    rng = np.random.default_rng(42)
+    doc_ids = rng.permutation(num_docs).astype(np.uint32)
+    scores = rng.integers(0, num_distinct_scores, num_docs).astype(np.float32)
+    expected = _reference_ranking(doc_ids.tolist(), scores.tolist())
+
+    ranking = Ranking(doc_ids, scores)
+    # Page through the result to exercise the incremental extension
+    per_page = 7
+    pages = [
+        ranking.page(page, per_page).tolist()
+        for page in range(1, (num_docs + per_page - 1) // per_page + 1)
+    ]
+    assert [doc_id for page in pages for doc_id in page] == expected
+    assert ranking.top(len(ranking)).tolist() == expected
+
+
+def test_ranking_out_of_range() -> None:
+    ranking = Ranking(np.array([3, 1, 2], dtype=np.uint32), np.array([1, 3, 2], dtype=np.float32))
+    assert ranking.top(10).tolist() == [1, 2, 3]
+    assert ranking.page(2, 3).tolist() == []
+    assert ranking.ranked_scores(1, 2).tolist() == [2.0]
+
+
+def test_score_accumulator() -> None:
+    pool = ScoreAccumulatorPool(num_docs=5)
+    scores = pool.acquire()
+    scores.add(np.array([1, 3], dtype=np.uint32), np.array([0.5, 0], dtype=np.float32))
+    scores.add(np.array([1, 1], dtype=np.uint32), np.array([1, 2], dtype=np.float32))
+
+    doc_ids = np.arange(5, dtype=np.uint32)
+    # Scored documents keep a score of 0 while unscored documents get the default
+    assert scores.gather(doc_ids).tolist() == [-1, 3.5, -1, 0, -1]
+    assert scores.get(1) == 3.5  # noqa: PLR2004
+
+    pool.release(scores)
+    reused = pool.acquire()
+    assert reused is scores
+    assert reused.gather(doc_ids).tolist() == [-1] * 5
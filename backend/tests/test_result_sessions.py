@@ -0,0 +1,54 @@
+import numpy as np
+
+from backend.config import FainderMode
+from backend.croissant_store import Document
+from backend.engine.cache import QueryResult
+from backend.engine.ranking import Ranking
+from backend.result_sessions import ResultSessionStore, SessionKey
+
+KEY = SessionKey("kw('data')", FainderMode.LOW_MEMORY, False, "default")
+
+
+def _result(num_docs: int) -> QueryResult:
+    doc_ids = np.arange(num_docs, dtype=np.uint32)
+    scores = np.arange(num_docs, dtype=np.float32)
+    return QueryResult(Ranking(doc_ids, scores), ({}, np.array([], dtype=np.uint32)))
+
+
+def test_result_session_pages() -> None:
+    loaded: list[int] = []
+
+    def _load_page(result: QueryResult, page: int, per_page: int) -> list[Document]:
+        loaded.append(page)
+        return [{"id": doc_id} for doc_id in result.ranking.page(page, per_page).tolist()]
+
+    store = ResultSessionStore(max_bytes=2**20, prefetch=True)
+    session = store.create(KEY, _result(25), _load_page)
+    assert session.num_pages(10) == 3  # noqa: PLR2004
+
+    resumed = store.get(session.handle, KEY)
+    assert resumed is session
+    assert store.get(session.handle, KEY._replace(query="kw('other')")) is None
+    assert store.get("unknown", KEY) is None
+
+    assert session.page(1, 10) == [{"id": doc_id} for doc_id in range(24, 14, -1)]
+    store.prefetch(session, 2, 10)
+    assert session.page(2, 10) == [{"id": doc_id} for doc_id in range(14, 4, -1)]
+    # The second page was loaded once in the background and not again on request
+    assert loaded == [1, 2]
+
+    # Prefetched pages are handed out once
+    store.prefetch(session, 3, 10)
+    assert session.take_prefetched(2, 10) is None
+    assert session.take_prefetched(3, 10) == [{"id": doc_id} for doc_id in range(4, -1, -1)]
+    assert session.take_prefetched(3, 10) is None
+
+    # Pages beyond the result are not prefetched
+    store.prefetch(session, 4, 10)
+    assert loaded == [1, 2, 3]
+
+
+def test_result_sessions_disabled() -> None:
+    store = ResultSessionStore(max_bytes=0)
+    session = store.create(KEY, _result(5), lambda *_: [])
+    assert store.get(session.handle, KEY) is None
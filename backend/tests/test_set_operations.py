@@ -0,0 +1,69 @@
+from typing import Literal
+
+import numpy as np
+import pytest
+from numpy.typing import NDArray
+
+from backend.config import CsrMapping
+from backend.engine.conversion import doc_to_col_ids, is_sorted_unique, sorted_unique_ids
+from backend.engine.execution.common import difference_arrays, reduce_arrays
+
+
+def random_ids(num_ids: int, density: float, rng: np.random.Generator) -> NDArray[np.uint32]:
+    size = int(num_ids * density)
+    return np.sort(rng.choice(num_ids, size=size, replace=False)).astype(np.uint32)
+
+
+# Sparse operands use binary searches and merges, dense ones use masks
+@pytest.mark.parametrize("densities", [(0.001, 0.05, 0.01, 0.02), (0.5, 0.3, 0.6), (0.0, 0.2)])
+@pytest.mark.parametrize("operator", ["and", "or"])
+def test_reduce_arrays(densities: tuple[float, ...], operator: Literal["and", "or"]) -> None:
+    rng = np.random.default_rng(42)
+    arrays = [random_ids(100_000, density, rng) for density in densities]
+
+    expected = arrays[0]
+    for arr in arrays[1:]:
+        if operator == "and":
+            expected = np.intersect1d(expected, arr)
+        else:
+            expected = np.union1d(expected, arr)
+
+    result = reduce_arrays(arrays, operator)
+    assert result.dtype == np.uint32
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize("densities", [(0.05, 0.01), (0.5, 0.3), (0.0, 0.2), (0.2, 0.0)])
+def test_difference_arrays(densities: tuple[float, float]) -> None:
+    rng = np.random.default_rng(42)
+    a, b = (random_ids(100_000, density, rng) for density in densities)
+
+    result = difference_arrays(a, b)
+    assert result.dtype == np.uint32
+    assert np.array_equal(result, np.setdiff1d(a, b))
+
+
+def test_sorted_unique_ids() -> None:
+    ids = np.array([3, 1, 3, 2], dtype=np.uint32)
+    assert not is_sorted_unique(ids)
+    assert np.array_equal(sorted_unique_ids(ids), [1, 2, 3])
+
+    sorted_ids = np.array([1, 2, 5], dtype=np.uint32)
+    assert is_sorted_unique(sorted_ids)
+    assert sorted_unique_ids(sorted_ids) is sorted_ids
+
+
+def test_doc_to_col_ids() -> None:
+    cols = [[4, 5], [], [0, 1], [2, 3, 6]]
+    doc_to_cols = CsrMapping.from_lists(cols)
+    assert len(doc_to_cols) == len(cols)
+    assert np.array_equal(doc_to_cols[3], cols[3])
+    assert doc_to_cols.tolist() == cols
+
+    assert np.array_equal(
+        doc_to_col_ids(np.array([0, 1, 2], dtype=np.uint32), doc_to_cols), [0, 1, 4, 5]
+    )
+    assert np.array_equal(
+        doc_to_col_ids(np.array([1, 3], dtype=np.uint32), doc_to_cols), [2, 3, 6]
+    )
+    assert doc_to_col_ids(np.array([], dtype=np.uint32), doc_to_cols).size == 0
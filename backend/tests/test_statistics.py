@@ -0,0 +1,71 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pytest
+
+from backend.config import CsrMapping, Metadata
+from backend.engine import Optimizer, Parser
+from backend.engine.plan import PercentileOp, compile_plan
+from backend.engine.statistics import StatisticsCatalog
+
+if TYPE_CHECKING:
+    from backend.engine import Engine
+
+
+@pytest.fixture(scope="module")
+def uniform_statistics() -> StatisticsCatalog:
+    # Histogram i is uniform on [i, i + 1], so its median is i + 0.5
+    num_hists = 100
+    hists = [
+        (np.uint32(i), (np.ones(4, dtype=np.float32), np.linspace(i, i + 1, 5)))
+        for i in range(num_hists)
+    ]
+    metadata = Metadata(
+        doc_to_cols=CsrMapping.from_lists([[i] for i in range(num_hists)]),
+        doc_to_path=[""] * num_hists,
+        col_to_doc=np.arange(num_hists, dtype=np.uint32),
+        name_to_vector={"a": 0, "b": 1},
+        vector_to_cols={0: {0, 1, 2}, 1: {3}},
+        num_hists=num_hists,
+    )
+    return StatisticsCatalog(metadata, hists)
+
+
+@pytest.mark.parametrize(
+    ("comparison", "reference", "expected"),
+    [("ge", 10.0, 0.9), ("gt", 89.5, 0.1), ("le", 24.5, 0.25), ("lt", 0.0, 0.0)],
+)
+def test_percentile_selectivity(
+    comparison: str, reference: float, expected: float, uniform_statistics: StatisticsCatalog
+) -> None:
+    assert uniform_statistics.percentile_selectivity(0.5, comparison, reference) == pytest.approx(
+        expected, abs=0.01
+    )
+
+
+def test_name_selectivity(uniform_statistics: StatisticsCatalog) -> None:
+    assert uniform_statistics.name_selectivity("a", 0) == pytest.approx(0.03)
+    assert uniform_statistics.name_selectivity("b", 0) == pytest.approx(0.01)
+    assert uniform_statistics.name_selectivity("c", 0) == 0
+    # Two neighbors and the exact match with an average fan-out of two columns each
+    assert uniform_statistics.name_selectivity("a", 2) == pytest.approx(0.06)
+
+
+def test_keyword_selectivity(default_engine: "Engine") -> None:
+    statistics = default_engine.statistics
+    germany = statistics.keyword_selectivity("germany")
+    assert 0 < germany < 1
+    assert statistics.keyword_selectivity("thisworddoesnotexist") == 0
+    assert statistics.keyword_selectivity("germany OR thisworddoesnotexist") == germany
+    assert statistics.keyword_selectivity("germany AND thisworddoesnotexist") == 0
+
+
+def test_cost_sorting_orders_selective_predicates_first(
+    uniform_statistics: StatisticsCatalog, parser: Parser
+) -> None:
+    optimizer = Optimizer(statistics=uniform_statistics, predicate_fusion=False)
+    query = "col(pp(0.5;ge;10.0) AND pp(0.5;le;50.0) AND pp(0.5;lt;5.0))"
+    plan = compile_plan(optimizer.optimize(parser.parse(query)))
+
+    references = [op.reference for op in plan.operators if isinstance(op, PercentileOp)]
+    assert references == [5.0, 50.0, 10.0]
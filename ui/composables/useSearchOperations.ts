@@ -10,6 +10,7 @@ export const useSearchOperations = () => {
     searchTime,
     resultCount,
     totalPages,
+    resultHandle,
     currentPage,
     perPage,
   } = useSearchState();
@@ -45,6 +46,7 @@ export const useSearchOperations = () => {
           fainder_mode: fainderMode || "low_memory",
           result_highlighting: resultHighlighting,
           fainder_index_name: fainderIndexName || "default",
+          result_handle: resultHandle.value,
         }),
       });
 
@@ -77,6 +79,7 @@ export const useSearchOperations = () => {
       searchTime.value = r.search_time;
       resultCount.value = r.result_count;
       totalPages.value = r.total_pages;
+      resultHandle.value = r.result_handle ?? null;
       currentPage.value = r.page;
 
       // Only set selectedResultIndex to 0 if it's a new search (page 1)
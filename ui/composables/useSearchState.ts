@@ -19,6 +19,8 @@ export const useSearchState = () => {
     () => parseInt(route.query.page as string) || 1,
   );
   const totalPages = useState("total-pages", () => 1);
+  // Handle of the last result on the server, used to fetch further pages without re-execution
+  const resultHandle = useState<string | null>("result-handle", () => null);
   const query = useState(
     "search-query",
     () => (route.query.query as string) || "",
@@ -51,6 +53,7 @@ export const useSearchState = () => {
     resultCount,
     currentPage,
     totalPages,
+    resultHandle,
     query,
     fainderMode,
     perPage,